@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Benchmark the SMT-LIB printer on the queries of the filecheck corpora.
+
+The queries are obtained by running the `xdsl-smt` pipelines of the RUN lines
+that print SMT-LIB, with the final `-t smt` replaced by `-t mlir`. Only the
+time spent in `print_to_smtlib` is measured.
+
+To compare two versions of the printer, run the benchmark on both with
+`--output`, and check that the printed queries are identical:
+
+    python benchmarks/smt_printer.py --output /tmp/new.smt2
+    git stash && python benchmarks/smt_printer.py --output /tmp/old.smt2
+    git stash pop && cmp /tmp/old.smt2 /tmp/new.smt2
+"""
+
+import argparse
+import glob
+import re
+import shlex
+import subprocess as sp
+import time
+from io import StringIO
+
+from xdsl.context import Context
+from xdsl.dialects.builtin import ModuleOp
+from xdsl.parser import Parser
+
+from xdsl_smt.dialects import get_all_dialects
+from xdsl_smt.traits.smt_printer import print_to_smtlib
+
+SMT_TARGET_RE = re.compile(r"-t[ =]smt\b")
+
+
+def smt_pipelines(path: str) -> list[list[str]]:
+    """
+    Get the `xdsl-smt` commands of the RUN lines of a file that print SMT-LIB,
+    modified to print the SMT program in MLIR instead.
+    """
+    pipelines: list[list[str]] = []
+    with open(path) as f:
+        for line in f:
+            if "RUN:" not in line:
+                continue
+            command = line.split("RUN:", 1)[1].split("|")[0].strip()
+            if not command.startswith("xdsl-smt") or not SMT_TARGET_RE.search(command):
+                continue
+            command = SMT_TARGET_RE.sub("-t mlir", command).replace("%s", path)
+            pipelines.append(shlex.split(command))
+    return pipelines
+
+
+def load_corpus(ctx: Context, pattern: str) -> list[ModuleOp]:
+    modules: list[ModuleOp] = []
+    for path in sorted(glob.glob(pattern, recursive=True)):
+        for pipeline in smt_pipelines(path):
+            result = sp.run(pipeline, capture_output=True, text=True)
+            if result.returncode != 0:
+                continue
+            module = Parser(ctx, result.stdout, path).parse_module()
+            # Skip the programs that cannot be printed back from MLIR.
+            try:
+                print_to_smtlib(module, StringIO())
+            except Exception:
+                continue
+            modules.append(module)
+    return modules
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        "--corpus",
+        type=str,
+        default="tests/filecheck/**/*.mlir",
+        help="glob pattern of the files whose SMT queries are printed",
+    )
+    arg_parser.add_argument(
+        "--repeat",
+        type=int,
+        default=20,
+        help="number of times each query is printed",
+    )
+    arg_parser.add_argument(
+        "--output",
+        type=str,
+        help="file in which the printed queries are written",
+    )
+    arg_parser.add_argument(
+        "--hoist-shared",
+        action="store_true",
+        help="print the shared expressions once as `define-fun`s",
+    )
+    args = arg_parser.parse_args()
+
+    ctx = Context()
+    ctx.allow_unregistered = True
+    for dialect_name, dialect_factory in get_all_dialects().items():
+        ctx.register_dialect(dialect_name, dialect_factory)
+
+    modules = load_corpus(ctx, args.corpus)
+
+    outputs: list[str] = []
+    for module in modules:
+        stream = StringIO()
+        print_to_smtlib(module, stream, args.hoist_shared)
+        outputs.append(stream.getvalue())
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for module in modules:
+            print_to_smtlib(module, StringIO(), args.hoist_shared)
+    elapsed = time.perf_counter() - start
+
+    size = sum(len(output) for output in outputs)
+    print(f"Printed {len(modules)} queries ({size} characters) {args.repeat} times")
+    print(
+        f"Total: {elapsed:.3f}s, per query: {elapsed / len(modules) / args.repeat * 1e6:.1f}us"
+    )
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            f.write("".join(outputs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+// RUN: xdsl-smt "%s" -p=lower-pairs -t=smt-shared | filecheck "%s"
+// RUN: xdsl-smt "%s" -p=lower-pairs -t=smt-shared | z3 -in
+
+// Expressions used by several assertions are defined once.
+
+builtin.module {
+  %x = "smt.declare_const"() : () -> !smt.utils.pair<!smt.bv<8>, !smt.bool>
+  %y = "smt.declare_const"() : () -> !smt.utils.pair<!smt.bv<8>, !smt.bool>
+  %distinct = "smt.distinct"(%x, %y) : (!smt.utils.pair<!smt.bv<8>, !smt.bool>, !smt.utils.pair<!smt.bv<8>, !smt.bool>) -> !smt.bool
+  %not = smt.not %distinct
+  "smt.assert"(%distinct) : (!smt.bool) -> ()
+  "smt.assert"(%not) : (!smt.bool) -> ()
+  "smt.check_sat"() : () -> ()
+}
+
+// CHECK:      (declare-const $x_first (_ BitVec 8))
+// CHECK-NEXT: (declare-const $x_second Bool)
+// CHECK-NEXT: (declare-const $y_first (_ BitVec 8))
+// CHECK-NEXT: (declare-const $y_second Bool)
+// CHECK-NEXT: (define-fun $distinct () Bool
+// CHECK-NEXT:   (or (distinct $x_first $y_first) (distinct $x_second $y_second)))
+// CHECK-NEXT: (assert $distinct)
+// CHECK-NEXT: (assert (not $distinct))
+// CHECK-NEXT: (check-sat)
@@ -0,0 +1,78 @@
+// RUN: verifier "%s" -j 1 > %t.seq && verifier "%s" -j 3 > %t.par && diff %t.seq %t.par && filecheck %s < %t.par
+
+"builtin.module"() ({
+"func.func"() ({
+  ^bb0(%arg0: !transfer.abs_value<[!transfer.integer]>):
+    %arg0_0 = "transfer.get"(%arg0) {index=0:index}: (!transfer.abs_value<[!transfer.integer]>) -> !transfer.integer
+    %result = "transfer.cmp"(%arg0_0, %arg0_0){predicate=0:i64}:(!transfer.integer,!transfer.integer)->i1
+    "func.return"(%result) : (i1) -> ()
+  }) {function_type = (!transfer.abs_value<[!transfer.integer]>) -> i1, sym_name = "getConstraint"} : () -> ()
+
+"func.func"() ({
+  ^bb0(%arg0: !transfer.abs_value<[!transfer.integer]>, %inst: !transfer.integer):
+    %arg0_0 = "transfer.get"(%arg0) {index=0:index}: (!transfer.abs_value<[!transfer.integer]>) -> !transfer.integer
+    %result = "transfer.cmp"(%arg0_0, %arg0_0){predicate=0:i64}:(!transfer.integer,!transfer.integer)->i1
+    "func.return"(%result) : (i1) -> ()
+}) {function_type = (!transfer.abs_value<[!transfer.integer]>, !transfer.integer) -> i1, sym_name = "getInstanceConstraint"} : () -> ()
+
+"func.func"() ({
+  ^bb0(%arg0: !transfer.abs_value<[!transfer.integer]>, %inst: !transfer.integer, %inst1: !transfer.integer):
+    %arg0_0 = "transfer.get"(%arg0) {index=0:index}: (!transfer.abs_value<[!transfer.integer]>) -> !transfer.integer
+    %eqinst="transfer.and"(%arg0_0,%inst):(!transfer.integer,!transfer.integer)->!transfer.integer
+    %eqinst1="transfer.and"(%arg0_0,%inst1):(!transfer.integer,!transfer.integer)->!transfer.integer
+    %eq = "transfer.cmp"(%eqinst, %eqinst1){predicate=0:i64}:(!transfer.integer,!transfer.integer)->i1
+    "func.return"(%eq) : (i1) -> ()
+  }) {function_type = (!transfer.abs_value<[!transfer.integer]>, !transfer.integer, !transfer.integer) -> i1, sym_name = "inSameEq"} : () -> ()
+
+"func.func"() ({
+  ^bb0(%arg0: !transfer.abs_value<[!transfer.integer]>, %inst: !transfer.integer, %inst1: !transfer.integer, %operand: !transfer.integer):
+    %concrete_res0 = "transfer.xor"(%inst,%operand):(!transfer.integer,!transfer.integer) ->!transfer.integer
+    %concrete_res1 = "transfer.xor"(%inst1,%operand):(!transfer.integer,!transfer.integer) ->!transfer.integer
+    %absres =  "func.call"(%arg0) {callee = @XORImpl0} : (!transfer.abs_value<[!transfer.integer]>) -> !transfer.abs_value<[!transfer.integer]>
+
+    %precond = "func.call"(%absres, %inst, %inst1) {callee = @inSameEq} : (!transfer.abs_value<[!transfer.integer]>, !transfer.integer, !transfer.integer) -> i1
+    %postcond = "func.call"(%arg0, %concrete_res0, %concrete_res1) {callee = @inSameEq} : (!transfer.abs_value<[!transfer.integer]>, !transfer.integer, !transfer.integer) -> i1
+    %const0 = "arith.constant"() {value=0:i1}: () -> i1
+    %const1 = "arith.constant"() {value=1:i1}: () -> i1
+    %precondtrue = "arith.cmpi"(%precond, %const1) {"predicate" = 0 : i64} : (i1, i1) -> i1
+    %postcondfalse = "arith.cmpi"(%postcond, %const0) {"predicate" = 0 : i64} : (i1, i1) -> i1
+    %result="arith.andi"(%precondtrue,%postcondfalse):(i1,i1)->i1
+    "func.return"(%result) : (i1) -> ()
+  }) {function_type = (!transfer.abs_value<[!transfer.integer]>, !transfer.integer, !transfer.integer,!transfer.integer) -> i1, sym_name = "counterXor"} : () -> ()
+
+"func.func"() ({
+  ^bb0(%absres:  !transfer.abs_value<[!transfer.integer]>, %arg0: !transfer.abs_value<[!transfer.integer]>, %inst: !transfer.integer, %inst1: !transfer.integer, %operand: !transfer.integer):
+    %concrete_res0 = "transfer.xor"(%inst,%operand):(!transfer.integer,!transfer.integer) ->!transfer.integer
+    %concrete_res1 = "transfer.xor"(%inst1,%operand):(!transfer.integer,!transfer.integer) ->!transfer.integer
+
+    %precond = "func.call"(%absres, %inst, %inst1) {callee = @inSameEq} : (!transfer.abs_value<[!transfer.integer]>, !transfer.integer, !transfer.integer) -> i1
+    %postcond = "func.call"(%arg0, %concrete_res0, %concrete_res1) {callee = @inSameEq} : (!transfer.abs_value<[!transfer.integer]>, !transfer.integer, !transfer.integer) -> i1
+    %const0 = "arith.constant"() {value=0:i1}: () -> i1
+    %const1 = "arith.constant"() {value=1:i1}: () -> i1
+    %precondtrue = "arith.cmpi"(%precond, %const1) {"predicate" = 0 : i64} : (i1, i1) -> i1
+    %postcondfalse = "arith.cmpi"(%postcond, %const0) {"predicate" = 0 : i64} : (i1, i1) -> i1
+    %result="arith.andi"(%precondtrue,%postcondfalse):(i1,i1)->i1
+    "func.return"(%result) : (i1) -> ()
+  }) {function_type = (!transfer.abs_value<[!transfer.integer]>, !transfer.abs_value<[!transfer.integer]>, !transfer.integer, !transfer.integer,!transfer.integer) -> i1,other_operand=[4], sym_name = "precision_counterXor", abs_input=1} : () -> ()
+
+"func.func"() ({
+  ^bb0(%arg0: !transfer.abs_value<[!transfer.integer]>):
+    "func.return"(%arg0) : (!transfer.abs_value<[!transfer.integer]>) -> ()
+  }) {function_type = (!transfer.abs_value<[!transfer.integer]>) -> !transfer.abs_value<[!transfer.integer]>, sym_name = "XORImpl1", operationNo=0, applied_to=["comb.xor"], is_forward=false, CPPCLASS=["circt::comb::XorOp"], precision_util="precision_counterXor", soundness_counterexample="counterXor"} : () -> ()
+
+  "func.func"() ({
+  ^bb0(%arg0: !transfer.abs_value<[!transfer.integer]>):
+    "func.return"(%arg0) : (!transfer.abs_value<[!transfer.integer]>) -> ()
+  }) {function_type = (!transfer.abs_value<[!transfer.integer]>) -> !transfer.abs_value<[!transfer.integer]>, sym_name = "XORImpl0", operationNo=1, applied_to=["comb.xor"], is_forward=false, CPPCLASS=["circt::comb::XorOp"], precision_util="precision_counterXor", soundness_counterexample="counterXor"} : () -> ()
+
+}) {"builtin.NEED_VERIFY"=[["XOR","XORImpl"]]}: () -> ()
+
+// CHECK:      Current width:  4
+// CHECK-NEXT: Current verify:  XORImpl1
+// CHECK-NEXT: Soundness Check result: True
+// CHECK-NEXT: Unable to find soundness counterexample:  True
+// CHECK-NEXT: Precision Check result: True
+// CHECK-NEXT: Current verify:  XORImpl0
+// CHECK-NEXT: Soundness Check result: True
+// CHECK-NEXT: Unable to find soundness counterexample:  True
+// CHECK-NEXT: Precision Check result: True
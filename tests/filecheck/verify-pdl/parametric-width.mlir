@@ -0,0 +1,19 @@
+// RUN: verify-pdl "%s" -max-bitwidth 64 -parametric-width | filecheck "%s"
+
+builtin.module {
+  pdl.pattern @add_comm : benefit(0) {
+    %type = pdl.type : !transfer.integer
+    %lhs = pdl.operand : %type
+    %rhs = pdl.operand : %type
+    %no_overflow = pdl.attribute = #arith.overflow<none>
+    %add = pdl.operation "arith.addi" (%lhs, %rhs : !pdl.value, !pdl.value) {"overflowFlags" = %no_overflow} -> (%type : !pdl.type)
+    pdl.rewrite %add {
+      %add2 = pdl.operation "arith.addi" (%rhs, %lhs : !pdl.value, !pdl.value) {"overflowFlags" = %no_overflow} -> (%type : !pdl.type)
+      pdl.replace %add with %add2
+    }
+  }
+}
+
+// CHECK:      Verifying pattern add_comm:
+// CHECK-NEXT: with all bitwidths up to 64: SOUND
+// CHECK-NEXT: All patterns are sound
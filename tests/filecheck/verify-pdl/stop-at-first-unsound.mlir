@@ -0,0 +1,35 @@
+// RUN: verify-pdl "%s" -max-bitwidth 4 -j 2 -stop-at-first-unsound | filecheck "%s"
+
+builtin.module {
+  pdl.pattern @addi_analysis : benefit(0) {
+    // Get an i16 type
+    %type = pdl.type : !transfer.integer
+
+    // Get the two operation operands
+    %lhs = pdl.operand : %type
+    %rhs = pdl.operand : %type
+
+    // Get the operands analysis values
+    %lhs_zeros, %lhs_ones = "pdl.dataflow.get"(%lhs) {"domain_name" = "kb"} : (!pdl.value) -> (!transfer.integer, !transfer.integer)
+    %rhs_zeros, %rhs_ones = "pdl.dataflow.get"(%rhs) {"domain_name" = "kb"} : (!pdl.value) -> (!transfer.integer, !transfer.integer)
+
+    // Get an add operation that takes both operands
+    %op = pdl.operation "arith.ori"(%lhs, %rhs : !pdl.value, !pdl.value) -> (%type : !pdl.type)
+
+    pdl.rewrite %op {
+        // Compute the known bits of the result
+        %res_zeros = "transfer.or"(%lhs_zeros, %rhs_zeros) : (!transfer.integer, !transfer.integer) -> !transfer.integer
+        %res_ones = "transfer.or"(%lhs_ones, %rhs_ones) : (!transfer.integer, !transfer.integer) -> !transfer.integer
+
+        // Get the value of the operation result
+        %res = pdl.result 0 of %op
+
+        // Attach it to the operation
+        "pdl.dataflow.attach"(%res, %res_zeros, %res_ones) {"domain_name" = "kb"} : (!pdl.value, !transfer.integer, !transfer.integer) -> ()
+    }
+  }
+}
+
+// CHECK:      Verifying pattern addi_analysis:
+// CHECK-NEXT: with types (1,): UNSOUND
+// CHECK-NEXT: At least one pattern is unsound
@@ -0,0 +1,69 @@
+import z3  # pyright: ignore[reportMissingTypeStubs]
+
+from xdsl.builder import Builder
+from xdsl.dialects.builtin import ModuleOp
+from xdsl.ir import Block, Region
+from xdsl.rewriter import InsertPoint
+
+from xdsl_smt.dialects import smt_bitvector_dialect as smt_bv
+from xdsl_smt.dialects import smt_dialect as smt
+from xdsl_smt.superoptimization.cegis import check_with_cegis
+from xdsl_smt.superoptimization.concrete_inputs import ConcreteInputs
+
+BV = smt_bv.BitVectorType(16)
+
+
+def mask_query(mask: int) -> ModuleOp:
+    """
+    Build the query `exists c, d. forall x. (x & mask) | c == x + d`, which only
+    has solutions if `mask` is all ones.
+    """
+    module = ModuleOp([])
+    builder = Builder(InsertPoint.at_end(module.body.block))
+    c = builder.insert(smt.DeclareConstOp(BV)).res
+    c.name_hint = "c"
+    d = builder.insert(smt.DeclareConstOp(BV)).res
+    d.name_hint = "d"
+
+    forall = builder.insert(smt.ForallOp(Region(Block(arg_types=[BV]))))
+    body = Builder(InsertPoint.at_end(forall.body.block))
+    x = forall.body.block.args[0]
+    masked = body.insert(
+        smt_bv.AndOp(x, body.insert(smt_bv.ConstantOp(mask, 16)).res)
+    ).res
+    lhs = body.insert(smt_bv.OrOp(masked, c)).res
+    rhs = body.insert(smt_bv.AddOp(x, d)).res
+    body.insert(smt.YieldOp(body.insert(smt.EqOp(lhs, rhs)).res))
+
+    builder.insert(smt.AssertOp(forall.result))
+    builder.insert(smt.CheckSatOp())
+    return module
+
+
+def test_cegis_finds_constants():
+    result, model = check_with_cegis(mask_query(0xFFFF))
+    assert result == z3.sat
+    assert model is not None
+    values = {decl.name(): model[decl].as_long() for decl in model.decls()}
+    assert values == {"$c": 0, "$d": 0}
+
+
+def test_cegis_proves_absence_of_constants():
+    result, model = check_with_cegis(mask_query(0xFF00))
+    assert result == z3.unsat
+    assert model is None
+
+
+def test_cegis_shares_counterexamples():
+    inputs = ConcreteInputs()
+    result, _ = check_with_cegis(mask_query(0xFF00), inputs=inputs)
+    assert result == z3.unsat
+    counterexamples = inputs.counterexamples((BV,))
+    assert counterexamples
+
+    # Without seeds, a single iteration is not enough to prove unsatisfiability,
+    # while the recorded counterexamples make the first synthesis query unsat.
+    result, _ = check_with_cegis(mask_query(0xFF00), max_iterations=1)
+    assert result == z3.unknown
+    result, _ = check_with_cegis(mask_query(0xFF00), max_iterations=1, inputs=inputs)
+    assert result == z3.unsat
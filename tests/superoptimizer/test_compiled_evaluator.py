@@ -0,0 +1,132 @@
+import itertools
+from typing import Any, Callable
+
+import z3  # pyright: ignore[reportMissingTypeStubs]
+
+from xdsl.builder import Builder
+from xdsl.dialects.builtin import FunctionType, IntegerAttr, IntegerType
+from xdsl.dialects.func import FuncOp, ReturnOp
+from xdsl.ir import Attribute, Block, Operation, Region
+from xdsl.rewriter import InsertPoint
+
+from xdsl_smt.dialects import smt_dialect as smt, smt_bitvector_dialect as bv
+from xdsl_smt.interpreters.smt_bitvector import to_signed
+from xdsl_smt.superoptimization.compiled_evaluator import CompiledFunction
+
+WIDTH = 3
+
+BINARY_OPS: list[tuple[type[Operation], Callable[[Any, Any], Any]]] = [
+    (bv.AddOp, lambda l, r: l + r),
+    (bv.SubOp, lambda l, r: l - r),
+    (bv.MulOp, lambda l, r: l * r),
+    (bv.AndOp, lambda l, r: l & r),
+    (bv.OrOp, lambda l, r: l | r),
+    (bv.XorOp, lambda l, r: l ^ r),
+    (bv.ShlOp, lambda l, r: l << r),
+    (bv.LShrOp, z3.LShR),  # pyright: ignore[reportUnknownMemberType]
+    (bv.AShrOp, lambda l, r: l >> r),
+    (bv.UDivOp, z3.UDiv),  # pyright: ignore[reportUnknownMemberType]
+    (bv.URemOp, z3.URem),  # pyright: ignore[reportUnknownMemberType]
+    (bv.SDivOp, lambda l, r: l / r),
+    (bv.SRemOp, z3.SRem),  # pyright: ignore[reportUnknownMemberType]
+    (bv.SModOp, lambda l, r: l % r),
+]
+
+
+def _overflow(*no_overflows: Any) -> Any:
+    return z3.Not(z3.And(*no_overflows))  # pyright: ignore[reportUnknownMemberType]
+
+
+def _unsigned_add_overflow(lhs: Any, rhs: Any) -> Any:
+    return _overflow(z3.BVAddNoOverflow(lhs, rhs, False))  # pyright: ignore
+
+
+def _unsigned_mul_overflow(lhs: Any, rhs: Any) -> Any:
+    return _overflow(z3.BVMulNoOverflow(lhs, rhs, False))  # pyright: ignore
+
+
+def _signed_add_overflow(lhs: Any, rhs: Any) -> Any:
+    no_overflow = z3.BVAddNoOverflow(lhs, rhs, True)  # pyright: ignore
+    no_underflow = z3.BVAddNoUnderflow(lhs, rhs)  # pyright: ignore
+    return _overflow(no_overflow, no_underflow)
+
+
+def _signed_mul_overflow(lhs: Any, rhs: Any) -> Any:
+    no_overflow = z3.BVMulNoOverflow(lhs, rhs, True)  # pyright: ignore
+    no_underflow = z3.BVMulNoUnderflow(lhs, rhs)  # pyright: ignore
+    return _overflow(no_overflow, no_underflow)
+
+
+PREDICATE_OPS: list[tuple[type[Operation], Callable[[Any, Any], Any]]] = [
+    (bv.UltOp, z3.ULT),  # pyright: ignore[reportUnknownMemberType]
+    (bv.UleOp, z3.ULE),  # pyright: ignore[reportUnknownMemberType]
+    (bv.SltOp, lambda l, r: l < r),
+    (bv.SgeOp, lambda l, r: l >= r),
+    (bv.UaddOverflowOp, _unsigned_add_overflow),
+    (bv.SaddOverflowOp, _signed_add_overflow),
+    (bv.UmulOverflowOp, _unsigned_mul_overflow),
+    (bv.SmulOverflowOp, _signed_mul_overflow),
+]
+
+
+def binary_func(op_type: type[Operation], result_type: Attribute) -> FuncOp:
+    """Create a function applying a binary operation on its two arguments."""
+    bv_type = bv.BitVectorType(WIDTH)
+    block = Block(arg_types=[bv_type, bv_type])
+    builder = Builder(InsertPoint.at_end(block))
+    op = builder.insert(op_type.create(operands=block.args, result_types=[result_type]))
+    builder.insert(ReturnOp(op.results[0]))
+    return FuncOp(
+        "main",
+        FunctionType.from_lists([bv_type, bv_type], [result_type]),
+        Region(block),
+    )
+
+
+def all_points() -> list[tuple[IntegerAttr[IntegerType], ...]]:
+    values = [IntegerAttr.from_int_and_width(v, WIDTH) for v in range(1 << WIDTH)]
+    return list(itertools.product(values, values))
+
+
+def _bitvector(attr: IntegerAttr[IntegerType]) -> Any:
+    value = attr.value.data
+    return z3.BitVecVal(value, WIDTH)  # pyright: ignore[reportUnknownMemberType]
+
+
+def test_binary_ops_match_z3():
+    points = all_points()
+    for op_type, z3_op in BINARY_OPS:
+        compiled = CompiledFunction(binary_func(op_type, bv.BitVectorType(WIDTH)))
+        for point, (result,) in zip(points, compiled.evaluate(points), strict=True):
+            lhs, rhs = (_bitvector(attr) for attr in point)
+            expected = z3.simplify(z3_op(lhs, rhs)).as_long()  # pyright: ignore
+            assert isinstance(result, bv.BitVectorAttr)
+            assert result.value.data == expected, (op_type.name, point)
+
+
+def test_predicates_match_z3():
+    points = all_points()
+    for op_type, z3_op in PREDICATE_OPS:
+        compiled = CompiledFunction(binary_func(op_type, smt.BoolType()))
+        for point, (result,) in zip(points, compiled.evaluate(points), strict=True):
+            lhs, rhs = (_bitvector(attr) for attr in point)
+            expected = z3.is_true(z3.simplify(z3_op(lhs, rhs)))  # pyright: ignore
+            assert result is expected, (op_type.name, point)
+
+
+def test_sign_extend():
+    bv_type = bv.BitVectorType(WIDTH)
+    result_type = bv.BitVectorType(2 * WIDTH)
+    block = Block(arg_types=[bv_type])
+    builder = Builder(InsertPoint.at_end(block))
+    op = builder.insert(bv.SignExtendOp(block.args[0], result_type))
+    builder.insert(ReturnOp(op.res))
+    func = FuncOp(
+        "main", FunctionType.from_lists([bv_type], [result_type]), Region(block)
+    )
+    compiled = CompiledFunction(func)
+    values = [IntegerAttr.from_int_and_width(v, WIDTH) for v in range(1 << WIDTH)]
+    results = compiled.evaluate([(value,) for value in values])
+    for value, (result,) in zip(values, results, strict=True):
+        signed = to_signed(value.value.data, WIDTH)
+        assert result.value.data == signed % (1 << (2 * WIDTH))
@@ -1,3 +1,12 @@
+import argparse
+import itertools
+import multiprocessing
+import pickle
+from functools import partial
+from pathlib import Path
+
+import pytest
+
 from xdsl.dialects.func import FuncOp
 from xdsl.parser import Parser
 from xdsl.context import Context
@@ -13,7 +22,32 @@ from xdsl_smt.passes.lower_to_smt.smt_lowerer_loaders import (
     load_vanilla_semantics_using_control_flow_dialects,
 )
 
-from xdsl_smt.superoptimization.pattern import Pattern
+from xdsl_smt.dialects.smt_bitvector_dialect import BitVectorType
+import xdsl_smt.superoptimization.pattern as pattern_module
+import xdsl_smt.utils.run_with_smt_solver as run_with_smt_solver
+from xdsl_smt.utils.run_with_smt_solver import SolverBackend
+from xdsl_smt.utils.smt_query_cache import get_query_cache
+from xdsl_smt.superoptimization.pattern import (
+    MIN_BITVECTOR_VALUES,
+    EvaluationPoints,
+    PackedPattern,
+    Pattern,
+    bitvector_values,
+    set_evaluation_points,
+)
+from xdsl_smt.cli.synthesize_rewrites import (
+    CanonicalIndex,
+    Checkpoint,
+    Configuration,
+    EnumerationOrder,
+    RewriteRule,
+    _init_worker,  # pyright: ignore[reportPrivateUsage]
+    find_new_behaviors,
+    find_new_behaviors_in_bucket,
+    merge_canonicals,
+    parse_packed_program,
+    register_all_arguments,
+)
 
 
 def create_pattern(source: str, lower_to_smt: bool = True) -> Pattern:
@@ -117,3 +151,297 @@ def test_permutations():
     pattern = useless_parameter_pattern()
     perms = list(pattern.input_permutations())
     assert perms == [(0, 1, 2)]
+
+
+def smt_binary_pattern(op_name: str) -> Pattern:
+    """An example SMT pattern applying a binary operation to two integers."""
+    source = f"""
+             func.func @main(%a: !smt.bv<32>, %b: !smt.bv<32>) -> !smt.bv<32> {{
+                 %c = "smt.bv.{op_name}"(%a, %b) : (!smt.bv<32>, !smt.bv<32>) -> !smt.bv<32>
+                 return %c : !smt.bv<32>
+             }}
+             """
+    return create_pattern(source, False)
+
+
+def test_refined_fingerprint():
+    # Unsigned and signed divisions agree on the small values used for the
+    # smallest fingerprints, but not on the refinement inputs.
+    set_evaluation_points(EvaluationPoints(max_points=0))
+    try:
+        udiv = smt_binary_pattern("udiv")
+        sdiv = smt_binary_pattern("sdiv")
+    finally:
+        set_evaluation_points(EvaluationPoints())
+    assert udiv.unordered_fingerprint == sdiv.unordered_fingerprint
+    assert udiv.refined_fingerprint != sdiv.refined_fingerprint
+    assert not udiv.is_same_behavior(sdiv)
+
+    assert (
+        smt_pattern().refined_fingerprint
+        == smt_binary_pattern("add").refined_fingerprint
+    )
+
+
+def test_evaluation_points():
+    # Small values come first, followed by corner values.
+    assert bitvector_values(8, 4) == [0, 1, 2, 3]
+    assert bitvector_values(8, 8) == [0, 1, 2, 3, 255, 128, 127, 4]
+    assert bitvector_values(2, 8) == [0, 1, 2, 3]
+    values = bitvector_values(8, 64)
+    assert len(set(values)) == 64
+    assert values == bitvector_values(8, 64)
+
+    # Binary operations on bitvectors are evaluated on 16 values per argument.
+    bv8 = BitVectorType(8)
+    assert EvaluationPoints().bitvector_count([bv8, bv8]) == 16
+    assert EvaluationPoints().bitvector_count([bv8] * 6) == MIN_BITVECTOR_VALUES
+
+    # Signed and unsigned divisions differ on the corner values.
+    udiv = smt_binary_pattern("udiv")
+    sdiv = smt_binary_pattern("sdiv")
+    assert udiv.unordered_fingerprint != sdiv.unordered_fingerprint
+
+
+def smt_ternary_pattern(order: str, body: str) -> Pattern:
+    """
+    An example SMT pattern with three 8-bit arguments, declared in the given
+    order, and whose body uses the arguments `%a`, `%b`, and `%c`.
+    """
+    args = ", ".join(f"%{name}: !smt.bv<8>" for name in order)
+    source = f"""
+             func.func @main({args}) -> !smt.bv<8> {{
+                 {body}
+                 return %r : !smt.bv<8>
+             }}
+             """
+    return create_pattern(source, False)
+
+
+def test_unordered_fingerprint():
+    body = """
+           %x = "smt.bv.sub"(%a, %b) : (!smt.bv<8>, !smt.bv<8>) -> !smt.bv<8>
+           %r = "smt.bv.and"(%x, %c) : (!smt.bv<8>, !smt.bv<8>) -> !smt.bv<8>
+           """
+    patterns = [
+        smt_ternary_pattern("".join(order), body)
+        for order in itertools.permutations("abc")
+    ]
+    for pattern in patterns:
+        assert pattern.unordered_fingerprint == patterns[0].unordered_fingerprint
+        assert pattern.unordered_fingerprint in (
+            pattern.permutated_fingerprint(permutation)
+            for permutation in pattern.input_permutations()
+        )
+
+    # Swapping the operands of the subtraction amounts to swapping `%a` and
+    # `%b`, but subtracting `%c` instead of `%b` changes the behavior.
+    other = smt_ternary_pattern("abc", body.replace("(%a, %b)", "(%b, %a)"))
+    assert other.unordered_fingerprint == patterns[0].unordered_fingerprint
+    other = smt_ternary_pattern("abc", body.replace("(%a, %b)", "(%a, %c)"))
+    assert other.unordered_fingerprint != patterns[0].unordered_fingerprint
+
+    # The useful arguments are permuted around the useless ones.
+    assert other.useless_parameters == {1}
+    assert sorted(other.input_permutations()) == [(0, 1, 2), (2, 1, 0)]
+
+
+def test_refined_fingerprint_useless_parameters():
+    # The same subtraction, with the useless parameter at different positions.
+    sub_c = smt_ternary_pattern(
+        "abc", '%r = "smt.bv.sub"(%a, %c) : (!smt.bv<8>, !smt.bv<8>) -> !smt.bv<8>'
+    )
+    sub_b = smt_ternary_pattern(
+        "abc", '%r = "smt.bv.sub"(%a, %b) : (!smt.bv<8>, !smt.bv<8>) -> !smt.bv<8>'
+    )
+    assert sub_c.useless_parameters == {1}
+    assert sub_b.useless_parameters == {2}
+    assert sub_c.unordered_fingerprint == sub_b.unordered_fingerprint
+    assert sub_c.refined_fingerprint == sub_b.refined_fingerprint
+    assert sub_c.is_same_behavior(sub_b)
+    assert sub_b.is_same_behavior(sub_c)
+
+
+def test_packed_pattern():
+    for pattern in (add_pattern(), smt_binary_pattern("udiv")):
+        packed = pickle.loads(pickle.dumps(PackedPattern(pattern)))
+        # The IR is not sent along with the packed pattern.
+        assert packed._pattern is None  # pyright: ignore[reportPrivateUsage]
+        assert packed.size == pattern.size
+
+        unpacked = packed.unpack()
+        assert str(unpacked.func) == str(pattern.func)
+        assert unpacked.ordered_fingerprint == pattern.ordered_fingerprint
+        assert unpacked.unordered_fingerprint == pattern.unordered_fingerprint
+        assert (
+            packed.unordered_fingerprint
+            == PackedPattern(unpacked).unordered_fingerprint
+        )
+
+
+def test_canonical_index():
+    def packed(op_name: str) -> PackedPattern:
+        return PackedPattern(smt_binary_pattern(op_name))
+
+    index = CanonicalIndex([packed("udiv")])
+    index.extend([packed("sdiv")])
+
+    # Programs are matched against the canonicals with the same fingerprint.
+    assert index.find_same_behavior(packed("sdiv")) == 1
+    assert index.find_same_behavior(packed("add")) is None
+
+    known, new = find_new_behaviors_in_bucket(index, [packed("udiv"), packed("mul")])
+    assert list(known) == [0]
+    assert len(new) == 1
+
+
+def synthesize_rewrites_args(argv: list[str]) -> argparse.Namespace:
+    arg_parser = argparse.ArgumentParser()
+    register_all_arguments(arg_parser)
+    return arg_parser.parse_args(argv)
+
+
+@pytest.mark.parametrize("start_method", ["fork", "spawn"])
+def test_worker_evaluation_points(start_method: str):
+    source = """
+             func.func @main(%a: !smt.bv<32>, %b: !smt.bv<32>) -> !smt.bv<32> {
+                 %c = "smt.bv.udiv"(%a, %b) : (!smt.bv<32>, !smt.bv<32>) -> !smt.bv<32>
+                 return %c : !smt.bv<32>
+             }
+             """
+    parse = partial(parse_packed_program, Configuration.SMT, EnumerationOrder.SIZE, 1)
+    args = synthesize_rewrites_args(["--evaluation-points", "0"])
+
+    # The workers get the evaluation points from the pool initializer, so they
+    # fingerprint the program on the same points as this process.
+    set_evaluation_points(EvaluationPoints(max_points=0))
+    try:
+        expected = parse(source)
+        context = multiprocessing.get_context(start_method)
+        with context.Pool(1, initializer=_init_worker, initargs=(args,)) as pool:
+            (packed,) = pool.map(parse, [source])
+    finally:
+        set_evaluation_points(EvaluationPoints())
+    assert expected is not None and packed is not None
+    assert packed.ordered_fingerprint == expected.ordered_fingerprint
+    assert packed.unordered_fingerprint == expected.unordered_fingerprint
+
+
+def solver_settings() -> tuple[str | None, SolverBackend]:
+    query_cache = get_query_cache()
+    return (
+        None if query_cache is None else query_cache.path,
+        run_with_smt_solver._default_backend,  # pyright: ignore[reportPrivateUsage]
+    )
+
+
+@pytest.mark.parametrize("start_method", ["fork", "spawn"])
+def test_worker_solver_settings(start_method: str, tmp_path: Path):
+    query_cache = str(tmp_path / "queries.sqlite")
+    args = synthesize_rewrites_args(
+        ["--query-cache", query_cache, "--solver-backend", "z3"]
+    )
+    context = multiprocessing.get_context(start_method)
+    with context.Pool(1, initializer=_init_worker, initargs=(args,)) as pool:
+        settings = pool.apply(solver_settings)
+    assert settings == (query_cache, SolverBackend.Z3)
+
+
+@pytest.mark.parametrize("start_method", ["fork", "spawn"])
+def test_find_new_behaviors(start_method: str):
+    def packed(op_name: str) -> PackedPattern:
+        return PackedPattern(smt_binary_pattern(op_name))
+
+    # The workers get the canonicals from the pool initializer, whether or not
+    # they are forked from this process.
+    previous = multiprocessing.get_start_method()
+    multiprocessing.set_start_method(start_method, force=True)
+    try:
+        canonical = packed("udiv")
+        known, new = find_new_behaviors(
+            [[packed("udiv"), packed("mul")], [packed("sdiv")]],
+            CanonicalIndex([canonical]),
+            synthesize_rewrites_args([]),
+        )
+    finally:
+        multiprocessing.set_start_method(previous, force=True)
+    assert list(known) == [canonical]
+    assert len(new) == 2
+
+
+def test_merge_canonicals():
+    def packed(op_name: str) -> PackedPattern:
+        return PackedPattern(smt_binary_pattern(op_name))
+
+    def ordered(pattern: PackedPattern):
+        return next(iter(pattern.unpack().ordered_patterns()))
+
+    canonicals = sorted(map(packed, ["add", "mul", "udiv", "or"]), key=ordered)
+    for canonical in canonicals:
+        canonical.release()
+    new_canonicals = [packed("sdiv"), packed("and"), packed("sub")]
+    expected = sorted(canonicals + new_canonicals, key=ordered)
+
+    merge_canonicals(canonicals, new_canonicals)
+    assert canonicals == expected
+
+
+def test_useless_parameter_solver_calls(monkeypatch: pytest.MonkeyPatch):
+    solver_calls: list[int] = []
+    is_parameter_useless = Pattern._is_parameter_useless  # pyright: ignore
+
+    def counting_is_parameter_useless(self: Pattern, index: int) -> bool:
+        solver_calls.append(index)
+        return is_parameter_useless(self, index)
+
+    monkeypatch.setattr(Pattern, "_is_parameter_useless", counting_is_parameter_useless)
+    # Start from an empty cache, so that the calls do not depend on other tests.
+    monkeypatch.setattr(pattern_module, "_useless_parameters_cache", {})
+
+    # `%b` does not appear in the result, so no solver call is needed.
+    assert 1 in useless_parameter_pattern().useless_parameters
+    assert solver_calls == []
+
+    # `%a` appears in the result, but does not change it.
+    source = """
+             func.func @main(%a: !smt.bv<8>, %b: !smt.bv<8>) -> !smt.bv<8> {
+                 %x = "smt.bv.sub"(%a, %a) : (!smt.bv<8>, !smt.bv<8>) -> !smt.bv<8>
+                 %r = "smt.bv.add"(%b, %x) : (!smt.bv<8>, !smt.bv<8>) -> !smt.bv<8>
+                 return %r : !smt.bv<8>
+             }
+             """
+    assert create_pattern(source, False).useless_parameters == {0}
+    assert solver_calls == [0]
+
+    # The result is reused for structurally equal semantics.
+    assert create_pattern(source, False).useless_parameters == {0}
+    assert solver_calls == [0]
+
+
+def test_checkpoint(tmp_path: Path):
+    directory = str(tmp_path / "checkpoints")
+    settings = {"max_num_args": "2", "bitvector_widths": "4,8"}
+    add, two_add = PackedPattern(add_pattern()), PackedPattern(two_add_pattern())
+    for phase, canonicals in enumerate([[add], [add, two_add]]):
+        Checkpoint(phase, settings, canonicals, [], [], []).save(directory)
+    rewrite = RewriteRule(add_pattern(), add_pattern())
+    Checkpoint(2, settings, [add], [two_add], [rewrite], []).save(directory)
+
+    # The latest checkpoint up to the requested phase is loaded.
+    checkpoint = Checkpoint.load_latest(directory, 1)
+    assert checkpoint is not None
+    assert checkpoint.phase == 1
+    assert [c.size for c in checkpoint.canonicals] == [1, 2]
+    assert (
+        checkpoint.canonicals[1].unordered_fingerprint == two_add.unordered_fingerprint
+    )
+
+    checkpoint = Checkpoint.resume(directory, 5, settings)
+    assert checkpoint is not None
+    assert checkpoint.phase == 2
+    assert str(checkpoint.illegals[0].unpack().func) == str(two_add_pattern().func)
+    assert str(checkpoint.rewrites[0]) == str(rewrite)
+
+    assert Checkpoint.load_latest(str(tmp_path), 5) is None
+    with pytest.raises(ValueError, match="different settings"):
+        Checkpoint.resume(directory, 5, {**settings, "max_num_args": "3"})
@@ -0,0 +1,46 @@
+import subprocess as sp
+import sys
+
+import pytest
+
+from xdsl_smt.superoptimization.program_enumeration import read_programs_from_enumerator
+
+NUM_PROGRAMS = 10000
+
+
+def fake_enumerator(
+    num_programs: int | None = NUM_PROGRAMS, exit_code: int = 0
+) -> sp.Popen[bytes]:
+    """
+    Start a process printing programs separated by `// -----`, or printing
+    programs forever if `num_programs` is `None`, and exiting with `exit_code`.
+    """
+    script = (
+        "import itertools\n"
+        f"for i in itertools.islice(itertools.count(), {num_programs}):\n"
+        "    print(f'program {i}\\nline 2')\n"
+        "    print('// -----')\n"
+        f"raise SystemExit({exit_code})\n"
+    )
+    return sp.Popen([sys.executable, "-c", script], stdin=sp.DEVNULL, stdout=sp.PIPE)
+
+
+def test_stream_all_programs():
+    programs = list(read_programs_from_enumerator(fake_enumerator()))
+    assert len(programs) == NUM_PROGRAMS
+    assert programs[0] == "program 0\nline 2\n"
+    assert programs[-1] == f"program {NUM_PROGRAMS - 1}\nline 2\n"
+
+
+def test_stream_stops_early():
+    enumerator = fake_enumerator(None)
+    programs = read_programs_from_enumerator(enumerator)
+    assert next(iter(programs)) == "program 0\nline 2\n"
+    programs.close()
+    assert enumerator.wait() != 0
+
+
+def test_enumerator_error():
+    programs = read_programs_from_enumerator(fake_enumerator(3, exit_code=1))
+    with pytest.raises(sp.CalledProcessError):
+        list(programs)
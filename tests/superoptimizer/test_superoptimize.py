@@ -0,0 +1,96 @@
+import argparse
+import multiprocessing
+from pathlib import Path
+
+import pytest
+
+from xdsl_smt.cli.superoptimize import (
+    _check_candidates,  # pyright: ignore[reportPrivateUsage]
+    _init_state,  # pyright: ignore[reportPrivateUsage]
+)
+from xdsl_smt.utils.run_with_smt_solver import SolverBackend
+
+LHS = """
+func.func @test(%arg0 : i32) -> i32 {
+  %c2 = arith.constant 2 : i32
+  %r = arith.muli %arg0, %c2 : i32
+  func.return %r : i32
+}
+"""
+
+
+def candidate(op: str) -> str:
+    return f"""
+    func.func @test(%arg0 : i32) -> i32 {{
+      %c = synth.constant : i32
+      %r = {op} %arg0, %c : i32
+      func.return %r : i32
+    }}
+    """
+
+
+# Only the shift and the multiplication have a constant refining the LHS, and
+# the multiplication by 2 is the LHS itself.
+SOURCES = [
+    candidate("arith.ori"),
+    candidate("arith.shli"),
+    candidate("arith.andi"),
+    candidate("arith.muli"),
+    candidate("arith.xori"),
+]
+
+
+def make_args(input_file: Path, jobs: int, deterministic: bool):
+    return argparse.Namespace(
+        input_file=str(input_file),
+        opt=False,
+        timeout=8000,
+        solver_backend=SolverBackend.SMTLIB,
+        incremental=False,
+        cegis=False,
+        concrete_filter=False,
+        verbose=False,
+        jobs=jobs,
+        deterministic=deterministic,
+    )
+
+
+def check(tmp_path: Path, jobs: int, deterministic: bool) -> list[str | None]:
+    input_file = tmp_path / "input.mlir"
+    input_file.write_text(LHS)
+    args = make_args(input_file, jobs, deterministic)
+    _init_state(args)
+    return list(_check_candidates(iter(SOURCES), args))
+
+
+@pytest.fixture(params=["fork", "spawn"])
+def start_method(request: pytest.FixtureRequest):
+    """Run the test with each way of starting the worker processes."""
+    previous = multiprocessing.get_start_method()
+    multiprocessing.set_start_method(request.param, force=True)
+    yield
+    multiprocessing.set_start_method(previous, force=True)
+
+
+def test_single_job(tmp_path: Path):
+    results = check(tmp_path, 1, False)
+    assert [result is not None for result in results] == [
+        False,
+        True,
+        False,
+        False,
+        False,
+    ]
+    assert results[1] is not None and "arith.constant 1 : i32" in results[1]
+
+
+@pytest.mark.usefixtures("start_method")
+def test_deterministic_jobs(tmp_path: Path):
+    assert check(tmp_path, 3, True) == check(tmp_path, 1, False)
+
+
+@pytest.mark.usefixtures("start_method")
+def test_unordered_jobs(tmp_path: Path):
+    results = check(tmp_path, 3, False)
+    expected = check(tmp_path, 1, False)
+    assert sorted(map(str, results)) == sorted(map(str, expected))
@@ -0,0 +1,104 @@
+import itertools
+import multiprocessing
+
+import pytest
+
+from xdsl.context import Context
+from xdsl.dialects.builtin import ModuleOp
+from xdsl.dialects.func import FuncOp
+from xdsl.parser import Parser
+
+import xdsl_smt.cli.synthesize_symbolic_rewrites as sym
+from xdsl_smt.cli.synthesize_symbolic_rewrites import (
+    SymFingerprint,
+    SymProgram,
+    check_range_subsets,
+)
+from xdsl_smt.dialects import get_all_dialects
+
+# x & c, for a synthesized 2-bit constant c.
+PROGRAM = """
+func.func @test(%x : !smt.bv<2>, %b : !smt.bool) -> !smt.bv<2> {
+  %c = synth.constant : !smt.bv<2>
+  %r = "smt.bv.and"(%x, %c) : (!smt.bv<2>, !smt.bv<2>) -> !smt.bv<2>
+  func.return %r : !smt.bv<2>
+}
+"""
+
+
+def parse_func(source: str) -> FuncOp:
+    ctx = Context()
+    ctx.allow_unregistered = True
+    for dialect_name, dialect_factory in get_all_dialects().items():
+        ctx.register_dialect(dialect_name, dialect_factory)
+    module = Parser(ctx, source).parse_module()
+    assert isinstance(module, ModuleOp)
+    func = module.body.block.first_op
+    assert isinstance(func, FuncOp)
+    return func
+
+
+def test_batched_queries_match_single_queries():
+    func = parse_func(PROGRAM)
+    queries = list(itertools.product(range(4), [0, -1], range(4)))
+    batched = SymFingerprint._can_reach_results(  # pyright: ignore[reportPrivateUsage]
+        func, queries
+    )
+    single = [
+        SymFingerprint._can_reach_result(  # pyright: ignore[reportPrivateUsage]
+            func, query[:-1], query[-1]
+        )
+        for query in queries
+    ]
+    assert batched == single
+    # x & c can only reach the values whose bits are set in x.
+    for (x, _, result), reachable in zip(queries, batched):
+        assert reachable == (result & ~x == 0)
+
+
+def test_fingerprints_are_memoized():
+    fingerprint = SymFingerprint.compute_from_func(parse_func(PROGRAM))
+    # The names of the values do not matter.
+    renamed = PROGRAM.replace("%r", "%res").replace("%c", "%cst")
+    assert SymFingerprint.compute_from_func(parse_func(renamed)) is fingerprint
+
+
+# Fingerprints are exact for programs with a single 2-bit argument.
+AND = """
+func.func @test(%x : !smt.bv<2>) -> !smt.bv<2> {
+  %c = synth.constant : !smt.bv<2>
+  %r = "smt.bv.and"(%x, %c) : (!smt.bv<2>, !smt.bv<2>) -> !smt.bv<2>
+  func.return %r : !smt.bv<2>
+}
+"""
+
+IDENTITY = """
+func.func @test(%x : !smt.bv<2>) -> !smt.bv<2> {
+  func.return %x : !smt.bv<2>
+}
+"""
+
+
+@pytest.mark.parametrize("start_method", [None, "fork", "spawn"])
+def test_check_range_subsets(start_method: str | None, monkeypatch: pytest.MonkeyPatch):
+    programs = [SymProgram(parse_func(AND)), SymProgram(parse_func(IDENTITY))]
+    checked: list[tuple[str, ...]] = []
+    is_range_subset = sym.is_range_subset_of_list_with_z3
+
+    def record(left: FuncOp, right: list[FuncOp]) -> bool:
+        checked.append((str(left), *map(str, right)))
+        return is_range_subset(left, right)
+
+    monkeypatch.setattr(sym, "is_range_subset_of_list_with_z3", record)
+
+    # x is x & c for c = 3, but x & c can also return 0 when x is not 0.
+    tasks = [(1, (0,)), (0, (1,))]
+    if start_method is None:
+        results = list(check_range_subsets(programs, tasks, None))
+    else:
+        with multiprocessing.get_context(start_method).Pool(2) as pool:
+            results = list(check_range_subsets(programs, tasks, pool))
+    assert results == [True, False]
+    # The second task is rejected by the fingerprints, without calling Z3.
+    if start_method is None:
+        assert checked == [(str(programs[1].func), str(programs[0].func))]
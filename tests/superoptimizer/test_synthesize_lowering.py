@@ -0,0 +1,78 @@
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from xdsl.dialects.builtin import ModuleOp, StringAttr
+
+from xdsl_smt.cli.synthesize_lowering import run_superoptimize_all
+
+# Stands in for `superoptimize`: echoes its input module after sleeping for the
+# number of seconds given by the module name. If `BARRIER` is set, it first
+# waits for `BARRIER_SIZE` calls to be running at the same time.
+FAKE_SUPEROPTIMIZE = f"""#!{sys.executable}
+import os, sys, time
+source = open(sys.argv[1]).read()
+barrier = os.environ.get("BARRIER")
+if barrier is not None:
+    open(os.path.join(barrier, str(os.getpid())), "w").close()
+    deadline = time.time() + 10
+    while len(os.listdir(barrier)) < int(os.environ["BARRIER_SIZE"]):
+        if time.time() > deadline:
+            sys.exit(1)
+        time.sleep(0.01)
+time.sleep(float(source.split('sym_name = "')[1].split('"')[0]))
+print(source)
+"""
+
+
+@pytest.fixture(autouse=True)
+def fake_superoptimize(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    path = tmp_path / "superoptimize"
+    path.write_text(FAKE_SUPEROPTIMIZE)
+    path.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+
+
+def make_args(jobs: int, op_timeout: float | None = None) -> argparse.Namespace:
+    return argparse.Namespace(
+        output_dialect="dialect.mlir",
+        output_configuration="configuration.json",
+        timeout=8000,
+        opt=False,
+        synth_ops=False,
+        jobs=jobs,
+        op_timeout=op_timeout,
+    )
+
+
+def sleeping_module(seconds: float) -> ModuleOp:
+    return ModuleOp([], sym_name=StringAttr(str(seconds)))
+
+
+def test_concurrent_calls(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    barrier = tmp_path / "barrier"
+    barrier.mkdir()
+    monkeypatch.setenv("BARRIER", str(barrier))
+    monkeypatch.setenv("BARRIER_SIZE", "3")
+
+    # The calls can only return once all three run at the same time, and
+    # finish in the reverse order of the modules.
+    delays = [0.6, 0.3, 0.0]
+    modules = [sleeping_module(delay) for delay in delays]
+    outputs = list(run_superoptimize_all(modules, make_args(jobs=3), 1))
+    for delay, output in zip(delays, outputs, strict=True):
+        assert output is not None
+        assert f'sym_name = "{delay}"' in output
+
+
+def test_op_timeout():
+    modules = [sleeping_module(60), sleeping_module(0)]
+    start = time.time()
+    outputs = list(run_superoptimize_all(modules, make_args(1, op_timeout=1), 1))
+    assert time.time() - start < 30
+    assert outputs[0] is None
+    assert outputs[1] is not None and 'sym_name = "0"' in outputs[1]
@@ -0,0 +1,123 @@
+import pytest
+
+from xdsl.context import Context
+from xdsl.dialects.builtin import ModuleOp
+from xdsl.parser import Parser
+
+from xdsl_smt.dialects import get_all_dialects
+from xdsl_smt.passes.lower_to_smt.smt_lowerer_loaders import load_vanilla_semantics
+from xdsl_smt.superoptimization.synthesizer import (
+    ConstantSynthesizer,
+    synthesize_constants,
+)
+
+LHS = """
+func.func @test(%arg0 : i32) -> i32 {
+  %c2 = arith.constant 2 : i32
+  %r = arith.muli %arg0, %c2 : i32
+  func.return %r : i32
+}
+"""
+
+CANDIDATES = [
+    # No constant makes an `or` equivalent to a multiplication by 2.
+    (
+        """
+        func.func @test(%arg0 : i32) -> i32 {
+          %c = synth.constant : i32
+          %r = arith.ori %arg0, %c : i32
+          func.return %r : i32
+        }
+        """,
+        None,
+    ),
+    (
+        """
+        func.func @test(%arg0 : i32) -> i32 {
+          %c = synth.constant : i32
+          %r = arith.shli %arg0, %c : i32
+          func.return %r : i32
+        }
+        """,
+        "%c = arith.constant 1 : i32",
+    ),
+    (
+        """
+        func.func @test(%arg0 : i32) -> i32 {
+          %r = arith.addi %arg0, %arg0 : i32
+          func.return %r : i32
+        }
+        """,
+        "%r = arith.addi %arg0, %arg0 : i32",
+    ),
+]
+
+
+def parse(ctx: Context, source: str) -> ModuleOp:
+    return Parser(ctx, source).parse_module()
+
+
+@pytest.fixture
+def ctx() -> Context:
+    load_vanilla_semantics()
+    ctx = Context()
+    ctx.allow_unregistered = True
+    for dialect_name, dialect_factory in get_all_dialects().items():
+        ctx.register_dialect(dialect_name, dialect_factory)
+    return ctx
+
+
+@pytest.mark.parametrize(
+    "incremental, cegis", [(False, False), (True, False), (False, True)]
+)
+def test_synthesizer_reuses_lhs(ctx: Context, incremental: bool, cegis: bool):
+    lhs = parse(ctx, LHS)
+    synthesizer = ConstantSynthesizer(
+        lhs, ctx, False, incremental=incremental, cegis=cegis
+    )
+    for source, expected in CANDIDATES:
+        result = synthesizer.synthesize(parse(ctx, source))
+        if expected is None:
+            assert result is None
+        else:
+            assert result is not None
+            assert expected in str(result)
+    # The LHS program is not modified.
+    assert lhs.is_structurally_equivalent(parse(ctx, LHS))
+
+
+def test_synthesize_constants(ctx: Context):
+    for source, expected in CANDIDATES:
+        result = synthesize_constants(parse(ctx, LHS), parse(ctx, source), ctx, True)
+        assert (result is None) == (expected is None)
+
+
+@pytest.mark.parametrize("optimize", [False, True])
+def test_concrete_filter(ctx: Context, optimize: bool):
+    synthesizer = ConstantSynthesizer(
+        parse(ctx, LHS), ctx, optimize, cegis=True, concrete_filter=True
+    )
+    checked: list[ModuleOp] = []
+    check = synthesizer._check  # pyright: ignore[reportPrivateUsage]
+
+    def record_check(module: ModuleOp):
+        checked.append(module)
+        return check(module)
+
+    synthesizer._check = record_check  # pyright: ignore[reportPrivateUsage]
+
+    wrong = """
+    func.func @test(%arg0 : i32) -> i32 {
+      %r = arith.subi %arg0, %arg0 : i32
+      func.return %r : i32
+    }
+    """
+    # The wrong candidate is rejected without calling the solver.
+    assert synthesizer.synthesize(parse(ctx, wrong)) is None
+    assert not checked
+
+    # Candidates with constants, and correct candidates, still go to the solver.
+    for source, expected in CANDIDATES:
+        result = synthesizer.synthesize(parse(ctx, source))
+        assert (result is None) == (expected is None)
+    assert len(checked) == len(CANDIDATES)
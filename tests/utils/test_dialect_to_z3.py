@@ -0,0 +1,259 @@
+from io import StringIO
+from typing import Callable
+
+import pytest
+import z3  # pyright: ignore[reportMissingTypeStubs]
+
+from xdsl.builder import Builder
+from xdsl.dialects.builtin import FunctionType, ModuleOp
+from xdsl.ir import Block, Operation, Region, SSAValue
+from xdsl.rewriter import InsertPoint
+
+from xdsl_smt.dialects import smt_bitvector_dialect as smt_bv
+from xdsl_smt.dialects import smt_dialect as smt
+from xdsl_smt.dialects import smt_int_dialect as smt_int
+from xdsl_smt.dialects import smt_utils_dialect as smt_utils
+from xdsl_smt.traits.smt_printer import print_to_smtlib
+from xdsl_smt.utils.dialect_to_z3 import Z3Translator
+from xdsl_smt.utils.run_with_smt_solver import (
+    SolverBackend,
+    run_module_through_smtlib,
+)
+
+BV = smt_bv.BitVectorType(4)
+
+
+def build_module(
+    body: Callable[[Builder, SSAValue, SSAValue], SSAValue],
+) -> ModuleOp:
+    """
+    Build a module declaring two 4-bit constants `x` and `y`, and asserting
+    that `z` is equal to the value returned by `body`.
+    """
+    module = ModuleOp([])
+    builder = Builder(InsertPoint.at_end(module.body.block))
+    x = builder.insert(smt.DeclareConstOp(BV)).res
+    x.name_hint = "x"
+    y = builder.insert(smt.DeclareConstOp(BV)).res
+    y.name_hint = "y"
+    res = body(builder, x, y)
+    z = builder.insert(smt.DeclareConstOp(res.type)).res
+    z.name_hint = "z"
+    builder.insert(smt.AssertOp(builder.insert(smt.EqOp(z, res)).res))
+    builder.insert(smt.CheckSatOp())
+    return module
+
+
+def assert_same_as_smtlib(module: ModuleOp):
+    """Check that the translation is equivalent to the parsed SMT-LIB program."""
+    ctx = z3.Context()
+    translator = Z3Translator(ctx)
+    direct = [
+        assertion
+        for op in module.ops
+        if (assertion := translator.translate_script_op(op)) is not None
+    ]
+
+    # Constants with the same name and sort are the same in a z3 context.
+    stream = StringIO()
+    print_to_smtlib(module, stream)
+    smtlib = stream.getvalue()
+    parsed = z3.parse_smt2_string(smtlib, ctx=ctx)  # pyright: ignore
+
+    solver = z3.Solver(ctx=ctx)
+    lhs = z3.And(*direct, ctx)  # pyright: ignore
+    rhs = z3.And(*parsed, ctx)  # pyright: ignore
+    solver.add(lhs != rhs)  # pyright: ignore[reportUnknownMemberType]
+    assert solver.check() == z3.unsat  # pyright: ignore[reportUnknownMemberType]
+
+
+def binary(
+    op: Callable[[SSAValue, SSAValue], Operation]
+) -> Callable[[Builder, SSAValue, SSAValue], SSAValue]:
+    return lambda b, x, y: b.insert(op(x, y)).results[0]
+
+
+def unary(
+    op: Callable[[SSAValue], Operation]
+) -> Callable[[Builder, SSAValue, SSAValue], SSAValue]:
+    return lambda b, x, y: b.insert(op(x)).results[0]
+
+
+def extract(b: Builder, x: SSAValue, y: SSAValue) -> SSAValue:
+    return b.insert(smt_bv.ExtractOp(x, 2, 1)).res
+
+
+def repeat(b: Builder, x: SSAValue, y: SSAValue) -> SSAValue:
+    return b.insert(smt_bv.RepeatOp(x, 3)).res
+
+
+def zero_extend(b: Builder, x: SSAValue, y: SSAValue) -> SSAValue:
+    return b.insert(smt_bv.ZeroExtendOp(x, smt_bv.BitVectorType(7))).res
+
+
+def sign_extend(b: Builder, x: SSAValue, y: SSAValue) -> SSAValue:
+    return b.insert(smt_bv.SignExtendOp(x, smt_bv.BitVectorType(7))).res
+
+
+def ite(b: Builder, x: SSAValue, y: SSAValue) -> SSAValue:
+    condition = b.insert(smt_bv.UltOp(x, y)).res
+    five = b.insert(smt_bv.ConstantOp(5, 4)).res
+    return b.insert(smt.IteOp(condition, five, x)).res
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        *(unary(op) for op in [smt_bv.NegOp, smt_bv.NotOp, smt_bv.NegOverflowOp]),
+        *(
+            binary(op)
+            for op in [
+                smt_bv.AddOp,
+                smt_bv.SubOp,
+                smt_bv.MulOp,
+                smt_bv.URemOp,
+                smt_bv.SRemOp,
+                smt_bv.SModOp,
+                smt_bv.ShlOp,
+                smt_bv.LShrOp,
+                smt_bv.AShrOp,
+                smt_bv.SDivOp,
+                smt_bv.UDivOp,
+                smt_bv.OrOp,
+                smt_bv.AndOp,
+                smt_bv.XorOp,
+                smt_bv.NAndOp,
+                smt_bv.NorOp,
+                smt_bv.XNorOp,
+                smt_bv.UleOp,
+                smt_bv.UltOp,
+                smt_bv.UgeOp,
+                smt_bv.UgtOp,
+                smt_bv.SleOp,
+                smt_bv.SltOp,
+                smt_bv.SgeOp,
+                smt_bv.SgtOp,
+                smt_bv.UmulNoOverflowOp,
+                smt_bv.SmulNoOverflowOp,
+                smt_bv.SmulNoUnderflowOp,
+                smt_bv.UaddOverflowOp,
+                smt_bv.SaddOverflowOp,
+                smt_bv.UsubOverflowOp,
+                smt_bv.SsubOverflowOp,
+                smt_bv.UmulOverflowOp,
+                smt_bv.SmulOverflowOp,
+                smt_bv.ConcatOp,
+                smt.DistinctOp,
+            ]
+        ),
+        extract,
+        repeat,
+        zero_extend,
+        sign_extend,
+        ite,
+    ],
+)
+def test_bitvector_ops(body: Callable[[Builder, SSAValue, SSAValue], SSAValue]):
+    assert_same_as_smtlib(build_module(body))
+
+
+def test_int_ops():
+    def body(b: Builder, x: SSAValue, y: SSAValue) -> SSAValue:
+        a = b.insert(smt.DeclareConstOp(smt_int.SMTIntType())).res
+        c = b.insert(smt_int.ConstantOp(3)).res
+        res = b.insert(smt_int.AddOp(a, c)).res
+        res = b.insert(smt_int.MulOp(res, a)).res
+        res = b.insert(smt_int.DivOp(res, c)).res
+        res = b.insert(smt_int.ModOp(res, c)).res
+        return b.insert(smt_int.SubOp(res, a)).res
+
+    assert_same_as_smtlib(build_module(body))
+
+
+def test_pairs():
+    def body(b: Builder, x: SSAValue, y: SSAValue) -> SSAValue:
+        pair = b.insert(smt_utils.PairOp(x, b.insert(smt_bv.UltOp(x, y)).res)).res
+        first = b.insert(smt_utils.FirstOp(pair)).res
+        return b.insert(smt_bv.AddOp(first, y)).res
+
+    assert_same_as_smtlib(build_module(body))
+
+
+def test_nested_pairs():
+    def body(b: Builder, x: SSAValue, y: SSAValue) -> SSAValue:
+        # The outer pair sort is translated before the inner one.
+        nested = b.insert(
+            smt.DeclareConstOp(smt_utils.PairType(smt_utils.PairType(BV, BV), BV))
+        ).res
+        inner = b.insert(smt_utils.PairOp(x, y)).res
+        outer = b.insert(smt_utils.PairOp(inner, x)).res
+        b.insert(smt.AssertOp(b.insert(smt.EqOp(nested, outer)).res))
+        first = b.insert(smt_utils.FirstOp(nested)).res
+        return b.insert(smt_utils.SecondOp(first)).res
+
+    # z3 crashes when parsing this program in a context that already declares
+    # the pair datatypes, so the translation is checked against `z = y`.
+    ctx = z3.Context()
+    translator = Z3Translator(ctx)
+    direct = [
+        assertion
+        for op in build_module(body).ops
+        if (assertion := translator.translate_script_op(op)) is not None
+    ]
+    y = z3.BitVec("$y", 4, ctx)  # pyright: ignore[reportUnknownMemberType]
+    z = z3.BitVec("$z", 4, ctx)  # pyright: ignore[reportUnknownMemberType]
+    solver = z3.Solver(ctx=ctx)
+    solver.add(*direct, z != y)  # pyright: ignore[reportUnknownMemberType]
+    assert solver.check() == z3.unsat  # pyright: ignore[reportUnknownMemberType]
+
+
+def test_functions_and_quantifiers():
+    def body(b: Builder, x: SSAValue, y: SSAValue) -> SSAValue:
+        # An uninterpreted function, and a defined function calling it.
+        declared = b.insert(
+            smt.DeclareFunOp(FunctionType.from_lists([BV], [BV]), "f")
+        ).ret
+        block = Block(arg_types=[BV])
+        arg_builder = Builder(InsertPoint.at_end(block))
+        call = arg_builder.insert(smt.CallOp(declared, [block.args[0]])).res[0]
+        added = arg_builder.insert(smt_bv.AddOp(call, block.args[0])).res
+        arg_builder.insert(smt.ReturnOp(added))
+        defined = b.insert(smt.DefineFunOp(Region(block), "g")).ret
+
+        # forall v. f(v) != g(x)
+        forall = b.insert(smt.ForallOp(Region(Block(arg_types=[BV]))))
+        forall_builder = Builder(InsertPoint.at_end(forall.body.block))
+        lhs = forall_builder.insert(
+            smt.CallOp(declared, [forall.body.block.args[0]])
+        ).res[0]
+        rhs = forall_builder.insert(smt.CallOp(defined, [x])).res[0]
+        forall_builder.insert(
+            smt.YieldOp(forall_builder.insert(smt.DistinctOp(lhs, rhs)).res)
+        )
+        return forall.result
+
+    assert_same_as_smtlib(build_module(body))
+
+
+def test_backends_agree():
+    def body(b: Builder, x: SSAValue, y: SSAValue) -> SSAValue:
+        zero = b.insert(smt_bv.ConstantOp(0, 4)).res
+        b.insert(smt.AssertOp(b.insert(smt.EqOp(y, zero)).res))
+        return b.insert(smt_bv.UDivOp(x, y)).res
+
+    module = build_module(body)
+    models: list[dict[str, str]] = []
+    for backend in SolverBackend:
+        result, solver = run_module_through_smtlib(module, backend=backend)
+        assert result == z3.sat
+        model = solver.model()
+        values: dict[str, str] = {}
+        for decl in model.decls():  # pyright: ignore[reportUnknownVariableType]
+            value = model[decl]  # pyright: ignore[reportUnknownVariableType]
+            assert value is not None
+            name = decl.name()  # pyright: ignore
+            values[name] = value.sexpr()  # pyright: ignore[reportUnknownMemberType]
+        models.append(values)
+    # Dividing by zero returns all ones.
+    assert models[0]["$z"] == "#xf"
+    assert models[0] == models[1]
@@ -0,0 +1,63 @@
+from pathlib import Path
+
+import z3  # pyright: ignore[reportMissingTypeStubs]
+
+from xdsl_smt.utils.smt_query_cache import SMTQueryCache, canonicalize_smtlib
+
+SAT_QUERY = """
+(declare-const $x (_ BitVec 8))
+(declare-const $y (_ BitVec 8))
+(assert (= (bvadd $x $y) #x2a))
+(assert (= $x #x02))
+"""
+
+RENAMED_SAT_QUERY = SAT_QUERY.replace("$x", "$a_0").replace("$y", "$tmp")
+
+UNSAT_QUERY = """
+(declare-const $x (_ BitVec 8))
+(assert (distinct (bvadd $x $x) (bvmul $x #x02)))
+"""
+
+
+def solve(query: str) -> tuple[z3.CheckSatResult, z3.Solver]:
+    solver = z3.Solver()
+    solver.from_string(query)  # pyright: ignore[reportUnknownMemberType]
+    return solver.check(), solver  # pyright: ignore[reportUnknownMemberType]
+
+
+def test_canonicalize():
+    canonical, names = canonicalize_smtlib(SAT_QUERY)
+    renamed_canonical, renamed_names = canonicalize_smtlib(RENAMED_SAT_QUERY)
+    assert canonical == renamed_canonical
+    assert names == ["$x", "$y"]
+    assert renamed_names == ["$a_0", "$tmp"]
+
+
+def test_cache_replays_model(tmp_path: Path):
+    cache = SMTQueryCache(f"{tmp_path}/cache.sqlite")
+    assert cache.lookup(SAT_QUERY, 1000) is None
+    cache.store(SAT_QUERY, 1000, *solve(SAT_QUERY))
+
+    cached = cache.lookup(RENAMED_SAT_QUERY, 1000)
+    assert cached is not None
+    result, solver = cached
+    assert result == z3.sat
+    model = solver.model()
+    values: dict[str, int] = {
+        decl.name(): model[decl].as_long()  # pyright: ignore
+        for decl in model.decls()  # pyright: ignore[reportUnknownVariableType]
+    }
+    assert values == {"$a_0": 2, "$tmp": 40}
+
+
+def test_cache_unsat_and_unknown(tmp_path: Path):
+    cache = SMTQueryCache(f"{tmp_path}/cache.sqlite")
+    cache.store(UNSAT_QUERY, 1000, *solve(UNSAT_QUERY))
+    cached = cache.lookup(UNSAT_QUERY, 1000)
+    assert cached is not None and cached[0] == z3.unsat
+
+    # An unknown result is not reused with a larger timeout.
+    cache.store(SAT_QUERY, 10, z3.unknown, z3.Solver())
+    assert cache.lookup(SAT_QUERY, 1000) is None
+    cached = cache.lookup(SAT_QUERY, 10)
+    assert cached is not None and cached[0] == z3.unknown
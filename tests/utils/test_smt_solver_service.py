@@ -0,0 +1,23 @@
+import pytest
+
+from xdsl_smt.utils.smt_solver_service import SMTSolverService
+
+
+def test_queries_are_isolated():
+    service = SMTSolverService()
+    query = "(declare-const x Bool)\n(assert x)\n(check-sat)"
+    assert service.run(query).strip() == "sat"
+    # `x` is declared again, which is only valid if the previous query was reset.
+    assert service.run(f"{query}\n(assert (not x))\n(check-sat)").split() == [
+        "sat",
+        "unsat",
+    ]
+    service.close()
+
+
+def test_error():
+    service = SMTSolverService()
+    with pytest.raises(Exception, match="unknown constant"):
+        service.run("(assert y)\n(check-sat)")
+    assert service.run("(check-sat)").strip() == "sat"
+    service.close()
@@ -3,36 +3,23 @@
 import sys
 import argparse
 import subprocess as sp
+from contextlib import closing
+from multiprocessing import Pool
+from typing import Generator, Iterator
 
 from xdsl_smt.passes.lower_to_smt.smt_lowerer_loaders import load_vanilla_semantics
 from xdsl_smt.utils.get_submodule_path import get_mlir_fuzz_executable_path
+from xdsl_smt.utils.run_with_smt_solver import SolverBackend
 
 from xdsl.context import Context
+from xdsl.dialects.builtin import ModuleOp
 from xdsl.parser import Parser
 
-from xdsl_smt.superoptimization.synthesizer import synthesize_constants
+from xdsl_smt.superoptimization.synthesizer import ConstantSynthesizer
+from xdsl_smt.superoptimization.program_enumeration import (
+    read_programs_from_enumerator,
+)
 from xdsl_smt.dialects import get_all_dialects
-from xdsl.dialects.builtin import ModuleOp
-
-
-def read_program_from_enumerator(
-    enumerator: sp.Popen[bytes], ctx: Context
-) -> ModuleOp | None:
-    program_lines = list[bytes]()
-    assert enumerator.stdout is not None
-    while True:
-        output = enumerator.stdout.readline()
-
-        # End of program marker
-        if output == b"// -----\n":
-            return Parser(ctx, b"".join(program_lines).decode("utf-8")).parse_module()
-
-        # End of file
-        if not output:
-            return None
-
-        # Add the line to the program lines otherwise
-        program_lines.append(output)
 
 
 def register_all_arguments(arg_parser: argparse.ArgumentParser):
@@ -85,13 +72,74 @@ def register_all_arguments(arg_parser: argparse.ArgumentParser):
         help="Use synthetic operations instead of synth.const",
         action="store_true",
     )
+    arg_parser.add_argument(
+        "--pause-between-programs",
+        dest="pause_between_programs",
+        help="Wait for each candidate to be checked before enumerating the next "
+        "one, instead of streaming the enumerator output",
+        action="store_true",
+    )
+    arg_parser.add_argument(
+        "--solver-backend",
+        dest="solver_backend",
+        type=SolverBackend,
+        choices=tuple(SolverBackend),
+        default=SolverBackend.SMTLIB,
+        help="How SMT queries are passed to z3: printed to SMT-LIB, or built "
+        "directly as z3 expressions",
+    )
+    arg_parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        type=int,
+        help="Number of processes checking candidates concurrently",
+        default=1,
+    )
+    arg_parser.add_argument(
+        "--deterministic",
+        dest="deterministic",
+        help="With several jobs, return the first valid candidate in the "
+        "enumeration order, instead of the first one found",
+        action="store_true",
+    )
+    arg_parser.add_argument(
+        "--cegis",
+        dest="cegis",
+        help="Synthesize constants with counterexample-guided inductive "
+        "synthesis, instead of a single quantified query",
+        action="store_true",
+    )
+    arg_parser.add_argument(
+        "--concrete-filter",
+        dest="concrete_filter",
+        help="Evaluate candidates without constants on concrete inputs, and "
+        "reject them without calling the solver if one input is a counterexample",
+        action="store_true",
+    )
+    arg_parser.add_argument(
+        "--incremental",
+        dest="incremental",
+        help="Lower the input program to SMT once, and check all candidates "
+        "with a single incremental solver",
+        action="store_true",
+    )
 
 
-def main() -> None:
-    arg_parser = argparse.ArgumentParser()
-    register_all_arguments(arg_parser)
-    args = arg_parser.parse_args()
+# State used by `_check_candidate`, set by `_init_state` in each process.
+_ctx: Context
+_input_program: ModuleOp
+_args: argparse.Namespace
+_synthesizer: ConstantSynthesizer | None = None
 
+
+def _init_state(args: argparse.Namespace) -> None:
+    """
+    Load the semantics, the dialects, and the input program. This is also the
+    initializer of the worker processes, so that they do not rely on inheriting
+    the state of the parent process.
+    """
+    global _ctx, _input_program, _args, _synthesizer
     ctx = Context()
     ctx.allow_unregistered = True
 
@@ -104,6 +152,75 @@ def main() -> None:
     with open(args.input_file, "r") as f:
         input_program = Parser(ctx, f.read()).parse_module()
 
+    _ctx, _input_program, _args = ctx, input_program, args
+    _synthesizer = None
+
+
+def _check_candidate(source: str) -> str | None:
+    """
+    Synthesize the constants of a candidate program. Returns the resulting
+    function if it refines the input program and is not the input program.
+    """
+    global _synthesizer
+    rhs_program = Parser(_ctx, source).parse_module()
+
+    # Call the synthesizer with the read program. The synthesizer is created by
+    # each process, which has its own solver and concrete inputs.
+    if _synthesizer is None:
+        _synthesizer = ConstantSynthesizer(
+            _input_program,
+            _ctx,
+            _args.opt,
+            _args.timeout,
+            _args.solver_backend,
+            incremental=_args.incremental,
+            cegis=_args.cegis,
+            concrete_filter=_args.concrete_filter,
+        )
+    result_program = _synthesizer.synthesize(rhs_program)
+
+    if result_program is None:
+        if _args.verbose:
+            print("Example failed:", file=sys.stderr)
+            print(rhs_program, file=sys.stderr)
+        return None
+
+    if result_program.is_structurally_equivalent(_input_program):
+        if _args.verbose:
+            print("Synthesized the same program:", file=sys.stderr)
+            print(result_program, file=sys.stderr)
+        return None
+
+    return str(result_program.ops.first)
+
+
+def _check_candidates(
+    sources: Iterator[str], args: argparse.Namespace
+) -> Generator[str | None, None, None]:
+    """
+    Check the candidates in a pool of processes. Unless `--deterministic` is
+    set, the results are returned as soon as they are available.
+    With a single job, the candidates are checked in this process, which must
+    have called `_init_state`.
+    """
+    if args.jobs == 1:
+        yield from map(_check_candidate, sources)
+        return
+    with Pool(args.jobs, initializer=_init_state, initargs=(args,)) as p:
+        if args.deterministic:
+            yield from p.imap(_check_candidate, sources)
+        else:
+            yield from p.imap_unordered(_check_candidate, sources)
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser()
+    register_all_arguments(arg_parser)
+    args = arg_parser.parse_args()
+
+    # Parse the input program before starting the enumerator.
+    _init_state(args)
+
     executable_path = get_mlir_fuzz_executable_path("superoptimizer")
 
     # Start the enumerator
@@ -113,49 +230,31 @@ def main() -> None:
             args.input_file,
             args.dialect,
             f"--max-num-ops={args.max_num_ops}",
-            "--pause-between-programs",
+            *(["--pause-between-programs"] if args.pause_between_programs else []),
             "--mlir-print-op-generic",
             f"--configuration={args.configuration}",
             f"--use-input-ops={args.use_input_ops}",
         ] 
         + (["--synth-ops"] if args.synth_ops else []), # type: ignore
-        stdin=sp.PIPE,
+        stdin=sp.PIPE if args.pause_between_programs else sp.DEVNULL,
         stdout=sp.PIPE,
     )
 
     try:
-        while True:
-            # Read one program from stdin
-            rhs_program = read_program_from_enumerator(enumerator, ctx)
-            # End of file
-            if rhs_program is None:
-                break
-
-            # Call the synthesizer with the read program in stdin
-            result_program = synthesize_constants(
-                input_program, rhs_program, ctx, args.opt, args.timeout
+        # Closing the results terminates the pool, which cancels the
+        # candidates still being checked.
+        with closing(
+            _check_candidates(
+                read_programs_from_enumerator(enumerator, args.pause_between_programs),
+                args,
             )
-
-            if result_program is None:
-                if args.verbose:
-                    print("Example failed:", file=sys.stderr)
-                    print(rhs_program, file=sys.stderr)
-                assert enumerator.stdin is not None
-                enumerator.stdin.write(b"a")
-                enumerator.stdin.flush()
-                continue
-
-            if result_program.is_structurally_equivalent(input_program):
-                if args.verbose:
-                    print("Synthesized the same program:", file=sys.stderr)
-                    print(result_program, file=sys.stderr)
-                assert enumerator.stdin is not None
-                enumerator.stdin.write(b"a")
-                enumerator.stdin.flush()
-                continue
-
-            print(result_program.ops.first)
-            exit(0)
+        ) as results:
+            for result in results:
+                if result is None:
+                    continue
+                print(result)
+                enumerator.kill()
+                exit(0)
     except BrokenPipeError as e:
         # The enumerator has terminated
         pass
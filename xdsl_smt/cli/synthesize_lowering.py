@@ -1,5 +1,11 @@
 import argparse
+import os
+import signal
 import subprocess as sp
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Iterator
 
 from xdsl.printer import Printer
 from xdsl.context import Context
@@ -52,6 +58,23 @@ def register_all_arguments(arg_parser: argparse.ArgumentParser):
         help="Use synthetic operations instead of synth.const",
         action="store_true",
     )
+    arg_parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        type=int,
+        help="number of lowerings synthesized concurrently",
+        default=1,
+    )
+    arg_parser.add_argument(
+        "--op-timeout",
+        dest="op_timeout",
+        type=float,
+        help="maximum time in seconds spent synthesizing a lowering for an "
+        "operation with a given number of operations, after which it is "
+        "retried with more operations",
+        default=None,
+    )
 
 
 def get_input_operations(
@@ -88,31 +111,61 @@ def get_input_operations(
     return op_list
 
 
-def try_synthesize_lowering_for_module(
-    module: ModuleOp, args: argparse.Namespace, size: int, ctx: Context
-) -> ModuleOp | None:
+def run_superoptimize(
+    module: ModuleOp, args: argparse.Namespace, size: int
+) -> str | None:
     """
-    Try to synthesize a lowering for the given module (containing a single function), given the maximum
-    number of operations to output.
+    Run `superoptimize` on the given module, and return its output, or None if
+    no lowering was found in time.
+    Each call uses its own input file, so that calls can run concurrently.
     """
-    with open("/tmp/input-synthesize.mlir", "w") as f:
-        Printer(f, print_generic_format=True).print_op(module)
-    res = sp.run(
-        [
-            "superoptimize",
-            "/tmp/input-synthesize.mlir",
-            f"--max-num-ops={size}",
-            f"--dialect={args.output_dialect}",
-            f"--configuration={args.output_configuration}",
-        ]
-        + (["--opt"] if args.opt else [])
-        + (["--synth-ops"] if args.synth_ops else []),
-        capture_output=True,
-        text=True,
-    )
-    if res.returncode != 0:
+    fd, input_path = tempfile.mkstemp(prefix="input-synthesize-", suffix=".mlir")
+    try:
+        with os.fdopen(fd, "w") as f:
+            Printer(f, print_generic_format=True).print_op(module)
+        # The process runs in its own session, so that the enumerator it
+        # spawns is killed with it on timeout.
+        process = sp.Popen(
+            [
+                "superoptimize",
+                input_path,
+                f"--max-num-ops={size}",
+                f"--dialect={args.output_dialect}",
+                f"--configuration={args.output_configuration}",
+                f"--timeout={args.timeout}",
+            ]
+            + (["--opt"] if args.opt else [])
+            + (["--synth-ops"] if args.synth_ops else []),
+            stdout=sp.PIPE,
+            stderr=sp.PIPE,
+            text=True,
+            start_new_session=True,
+        )
+        try:
+            stdout, _ = process.communicate(timeout=args.op_timeout)
+        except sp.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.communicate()
+            return None
+    finally:
+        os.remove(input_path)
+    if process.returncode != 0:
         return None
-    return Parser(ctx, res.stdout).parse_module()
+    return stdout
+
+
+def run_superoptimize_all(
+    modules: list[ModuleOp], args: argparse.Namespace, size: int
+) -> Iterator[str | None]:
+    """
+    Run `superoptimize` on each module, with up to `args.jobs` concurrent calls,
+    and yield the outputs in the order of the modules.
+    """
+    # The synthesis runs in separate processes, so threads are enough to run
+    # them concurrently.
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        run = partial(run_superoptimize, args=args, size=size)
+        yield from executor.map(run, modules)
 
 
 def main():
@@ -135,15 +188,16 @@ def main():
         print(
             f"Trying to synthesize lowerings with up to {i} operations. {len(op_list)} remaining."
         )
-        for op in op_list:
-            synthesized = try_synthesize_lowering_for_module(op, args, i, ctx)
-            if synthesized is None:
+        outputs = run_superoptimize_all(op_list, args, i)
+        for op, output in zip(op_list, outputs):
+            if output is None:
                 failed_synthesis.append(op)
                 print(f"Failed to synthesize lowering with {i} operations for:")
                 print(op)
                 print("\n\n", flush=True)
                 continue
 
+            synthesized = Parser(ctx, output).parse_module()
             print("Successfully synthesized lowering for:")
             print(op)
             print("The synthesized lowering is:")
@@ -3,9 +3,11 @@ from __future__ import annotations
 
 import argparse
 import os
+import pickle
 import subprocess as sp
 import sys
 import time
+from bisect import bisect_right
 from dataclasses import dataclass, fields
 from enum import Enum, auto
 from functools import partial
@@ -23,11 +25,17 @@ from xdsl.parser import Parser
 from xdsl.printer import Printer
 
 from xdsl_smt.superoptimization.pattern import (
+    EvaluationPoints,
     Pattern,
-    UnorderedFingerprint,
+    RefinedFingerprint,
+    PackedFingerprint,
+    PackedPattern,
     OrderedPattern,
+    set_evaluation_points,
 )
 from xdsl_smt.utils.pdl import func_to_pdl
+from xdsl_smt.utils.run_with_smt_solver import SolverBackend, set_solver_backend
+from xdsl_smt.utils.smt_query_cache import set_query_cache
 from xdsl_smt.superoptimization.program_enumeration import enumerate_programs
 
 from xdsl_smt.dialects import get_all_dialects
@@ -228,6 +236,48 @@ def register_all_arguments(arg_parser: argparse.ArgumentParser):
         help="if present, check for refinements to reduce the number of canonical programs",
     )
 
+    arg_parser.add_argument(
+        "--checkpoint-dir",
+        dest="checkpoint_dir",
+        type=str,
+        help="the directory in which to write a checkpoint after each phase",
+    )
+
+    arg_parser.add_argument(
+        "--resume",
+        dest="resume",
+        type=str,
+        help="a checkpoint directory from which to resume, skipping completed phases. "
+        "New checkpoints are written to the same directory unless --checkpoint-dir is given",
+    )
+
+    arg_parser.add_argument(
+        "--evaluation-points",
+        dest="evaluation_points",
+        type=int,
+        default=EvaluationPoints.max_points,
+        help="the maximum number of inputs on which programs are evaluated to "
+        "compute their fingerprints. Bitvector arguments take as many values as "
+        "this allows, and at least 4",
+    )
+
+    arg_parser.add_argument(
+        "--query-cache",
+        dest="query_cache",
+        type=str,
+        help="an SQLite file in which to cache the results of SMT queries across runs",
+    )
+
+    arg_parser.add_argument(
+        "--solver-backend",
+        dest="solver_backend",
+        type=SolverBackend,
+        choices=tuple(SolverBackend),
+        default=SolverBackend.SMTLIB,
+        help="how SMT queries are passed to z3: printed to SMT-LIB, or built "
+        "directly as z3 expressions",
+    )
+
 
 def parse_program(configuration: Configuration, source: str) -> Pattern:
     ctx = Context()
@@ -254,91 +304,226 @@ def parse_program(configuration: Configuration, source: str) -> Pattern:
     return Pattern(func_op, semantics_op)
 
 
+def parse_packed_program(
+    configuration: Configuration,
+    enumeration_order: EnumerationOrder,
+    phase: int,
+    source: str,
+) -> PackedPattern | None:
+    """
+    Parse a program printed by the enumerator. Programs that do not belong to
+    the given phase are discarded, and other programs are packed to be sent
+    back to the main process.
+    """
+    program = parse_program(configuration, source)
+    if enumeration_order.phase(program) != phase:
+        return None
+    return PackedPattern(program)
+
+
+class CanonicalIndex:
+    """
+    The canonical programs found so far, indexed by unordered fingerprint. The
+    index is kept across phases, and only the new canonicals are added to it.
+    """
+
+    patterns: list[PackedPattern]
+    """The canonical programs, in the order in which they were added."""
+    by_fingerprint: dict[PackedFingerprint, list[int]]
+    """The indices of the canonical programs with a given fingerprint."""
+
+    def __init__(self, patterns: Iterable[PackedPattern] = ()):
+        self.patterns = []
+        self.by_fingerprint = {}
+        self.extend(patterns)
+
+    def extend(self, patterns: Iterable[PackedPattern]) -> None:
+        for pattern in patterns:
+            self.by_fingerprint.setdefault(pattern.unordered_fingerprint, []).append(
+                len(self.patterns)
+            )
+            self.patterns.append(pattern)
+
+    def find_same_behavior(self, pattern: PackedPattern) -> int | None:
+        """Returns the index of a canonical with the same behavior, if any."""
+        for index in self.by_fingerprint.get(pattern.unordered_fingerprint, []):
+            if pattern.is_same_behavior(self.patterns[index]):
+                return index
+        return None
+
+
 def find_new_behaviors_in_bucket(
-    canonicals: dict[UnorderedFingerprint, list[Pattern]],
-    bucket: list[Pattern],
-) -> tuple[dict[Pattern, list[Pattern]], list[list[Pattern]]]:
-    # Sort programs into actual behavior buckets.
-    behaviors: list[list[Pattern]] = []
+    canonicals: CanonicalIndex,
+    bucket: list[PackedPattern],
+) -> tuple[dict[int, list[PackedPattern]], list[list[PackedPattern]]]:
+    """
+    Returns a `known_behaviors, new_behaviors` pair for the programs of a
+    bucket, where `known_behaviors` maps the indices of canonical programs to
+    the programs with the same behavior.
+    """
+    # Sort programs into actual behavior buckets. Programs with an exact
+    # fingerprint all have the behavior described by the bucket fingerprint.
+    # The other programs are first grouped by refined fingerprint, and only
+    # programs within the same group are compared pairwise.
+    exact_behavior: list[PackedPattern] = []
+    groups: dict[RefinedFingerprint, list[list[PackedPattern]]] = {}
+    behaviors: list[list[PackedPattern]] = []
     for pattern in bucket:
-        for behavior in behaviors:
+        if pattern.exact_fingerprint:
+            if not exact_behavior:
+                behaviors.append(exact_behavior)
+            exact_behavior.append(pattern)
+            continue
+        if exact_behavior and pattern.is_same_behavior(exact_behavior[0]):
+            exact_behavior.append(pattern)
+            continue
+        group = groups.setdefault(pattern.refined_fingerprint, [])
+        for behavior in group:
             if pattern.is_same_behavior(behavior[0]):
                 behavior.append(pattern)
                 break
         else:
-            behaviors.append([pattern])
+            group.append([pattern])
+            behaviors.append(group[-1])
 
     # Exclude known behaviors.
-    known_behaviors: dict[Pattern, list[Pattern]] = {}
-    new_behaviors: list[list[Pattern]] = []
+    known_behaviors: dict[int, list[PackedPattern]] = {}
+    new_behaviors: list[list[PackedPattern]] = []
     for behavior in behaviors:
-        for canonical in canonicals.get(behavior[0].unordered_fingerprint, []):
-            if behavior[0].is_same_behavior(canonical):
-                known_behaviors[canonical] = behavior
-                break
+        index = canonicals.find_same_behavior(behavior[0])
+        if index is not None:
+            known_behaviors[index] = behavior
         else:
             new_behaviors.append(behavior)
     return known_behaviors, new_behaviors
 
 
+def _init_worker(args: argparse.Namespace) -> None:
+    """
+    Apply the settings given on the command line to the current process. This
+    is also the initializer of the worker processes, so that they do not rely
+    on inheriting the settings of the main process. Each worker opens its own
+    connection to the query cache.
+    """
+    set_query_cache(args.query_cache)
+    set_solver_backend(args.solver_backend)
+    set_evaluation_points(EvaluationPoints(max_points=args.evaluation_points))
+
+
+# The canonicals of the worker processes, installed once per worker by the
+# pool initializer instead of being sent with each bucket.
+_canonicals: CanonicalIndex
+
+
+def _init_find_new_behaviors_worker(
+    args: argparse.Namespace, canonicals: CanonicalIndex
+) -> None:
+    global _canonicals
+    _init_worker(args)
+    _canonicals = canonicals
+
+
+def _find_new_behaviors_in_shared_bucket(
+    bucket: list[PackedPattern],
+) -> tuple[dict[int, list[PackedPattern]], list[list[PackedPattern]]]:
+    return find_new_behaviors_in_bucket(_canonicals, bucket)
+
+
 def find_new_behaviors(
-    buckets: list[list[Pattern]],
-    canonicals: list[Pattern],
-) -> tuple[dict[Pattern, list[Pattern]], list[list[Pattern]]]:
+    buckets: list[list[PackedPattern]],
+    canonicals: CanonicalIndex,
+    args: argparse.Namespace,
+) -> tuple[dict[PackedPattern, list[PackedPattern]], list[list[PackedPattern]]]:
     """
     Returns a `known_behaviors, new_behaviors` pair where `known_behaviors` is a
     map from canonical programs to buckets of new programs with the same
     behavior, and `new_behaviors` is a list of equivalence classes of the
     programs exhibiting a new behavior.
     """
-
-    canonicals_dict: dict[UnorderedFingerprint, list[Pattern]] = {}
-    for canonical in canonicals:
-        canonicals_dict.setdefault(canonical.unordered_fingerprint, []).append(
-            canonical
-        )
-
-    known_behaviors: dict[Pattern, list[Pattern]] = dict[Pattern, list[Pattern]]()
-    new_behaviors: list[list[Pattern]] = []
-
-    with Pool(processes=NUM_PROCESSES) as p:
+    known_behaviors: dict[PackedPattern, list[PackedPattern]] = dict[
+        PackedPattern, list[PackedPattern]
+    ]()
+    new_behaviors: list[list[PackedPattern]] = []
+
+    with Pool(
+        processes=NUM_PROCESSES,
+        initializer=_init_find_new_behaviors_worker,
+        initargs=(args, canonicals),
+    ) as p:
         for i, (known, new) in enumerate(
-            p.imap(partial(find_new_behaviors_in_bucket, canonicals_dict), buckets)
+            p.imap(_find_new_behaviors_in_shared_bucket, buckets)
         ):
             print(
                 f"\033[2K Finding new behaviors... "
                 f"({round(100.0 * i / len(buckets), 1)} %)",
                 end="\r",
             )
-            known_behaviors.update(known)
+            for index, programs in known.items():
+                known_behaviors[canonicals.patterns[index]] = programs
             new_behaviors.extend(new)
 
     return known_behaviors, new_behaviors
 
 
+def merge_canonicals(
+    canonicals: list[PackedPattern], new_canonicals: list[PackedPattern]
+) -> None:
+    """
+    Insert new canonical programs into a sorted list of canonical programs,
+    keeping it sorted. The new canonicals are sorted while their IR is still
+    built, and only the existing canonicals they are compared to are parsed
+    again.
+    """
+    ordered: dict[int, OrderedPattern] = {}
+
+    def ordered_canonical(index: int) -> OrderedPattern:
+        if index not in ordered:
+            ordered[index] = next(iter(canonicals[index].unpack().ordered_patterns()))
+        return ordered[index]
+
+    merged: list[PackedPattern] = []
+    start = 0
+    for ordered_pattern, pattern in sorted(
+        ((next(iter(p.pattern.ordered_patterns())), p) for p in new_canonicals),
+        key=lambda item: item[0],
+    ):
+        end = bisect_right(
+            range(len(canonicals)), ordered_pattern, start, key=ordered_canonical
+        )
+        merged.extend(canonicals[start:end])
+        merged.append(pattern)
+        start = end
+    merged.extend(canonicals[start:])
+    canonicals[:] = merged
+
+
 def remove_redundant_illegal_subpatterns(
-    new_canonicals: list[Pattern],
-    new_rewrites: dict[Pattern, list[Pattern]],
-    new_refinements: list[tuple[Pattern, Pattern]],
-) -> tuple[dict[Pattern, list[Pattern]], list[tuple[Pattern, Pattern]], int]:
+    new_canonicals: list[PackedPattern],
+    new_rewrites: dict[PackedPattern, list[PackedPattern]],
+    new_refinements: list[tuple[PackedPattern, PackedPattern]],
+) -> tuple[
+    dict[PackedPattern, list[PackedPattern]],
+    list[tuple[PackedPattern, PackedPattern]],
+    int,
+]:
     buffer = StringIO()
     printer = Printer(buffer, print_generic_format=True)
     printer.print_string("module {")
     printer.print_string("module {")
     for canonical in new_canonicals:
         printer.print_string("module {")
-        printer.print_op(canonical.func)
+        printer.print_string(canonical.source)
         printer.print_string("}")
     printer.print_string("}")
     printer.print_string("module {")
     for programs in new_rewrites.values():
         for program in programs:
             printer.print_string("module {")
-            printer.print_op(program.func)
+            printer.print_string(program.source)
             printer.print_string("}")
     for _, program in new_refinements:
         printer.print_string("module {")
-        printer.print_op(program.func)
+        printer.print_string(program.source)
         printer.print_string("}")
     printer.print_string("}")
     printer.print_string("}")
@@ -351,7 +536,7 @@ def remove_redundant_illegal_subpatterns(
     )
     res_lines = cpp_res.stdout.splitlines()
 
-    pruned_rewrites: dict[Pattern, list[Pattern]] = {
+    pruned_rewrites: dict[PackedPattern, list[PackedPattern]] = {
         canonical: [] for canonical in new_rewrites.keys()
     }
     i = 0
@@ -364,7 +549,7 @@ def remove_redundant_illegal_subpatterns(
             else:
                 pruned_rewrites[canonical].append(program)
             i += 1
-    pruned_refinements: list[tuple[Pattern, Pattern]] = []
+    pruned_refinements: list[tuple[PackedPattern, PackedPattern]] = []
     for program, refined in new_refinements:
         if res_lines[i] == "true":
             pruned_count += 1
@@ -386,7 +571,7 @@ class BucketStat:
     """Expected value of the size of a random program's bucket."""
 
     @classmethod
-    def from_buckets(cls, phase: int, buckets: Iterable[list[Pattern]]):
+    def from_buckets(cls, phase: int, buckets: Iterable[list[PackedPattern]]):
         bucket_sizes = sorted(len(bucket) for bucket in buckets)
         n = len(bucket_sizes)
         return cls(
@@ -421,26 +606,115 @@ class BucketStat:
         return "\t".join(self._value(f.name) for f in fields(type(self)))
 
 
+@dataclass(frozen=True, slots=True)
+class Checkpoint:
+    """
+    The state of the synthesis after a completed phase. Patterns are stored
+    with their fingerprints, so that resuming does not evaluate them again.
+    """
+
+    phase: int
+    settings: dict[str, str]
+    """The command-line arguments that affect the synthesized rules."""
+    canonicals: list[PackedPattern]
+    illegals: list[PackedPattern]
+    rewrites: list[RewriteRule]
+    bucket_stats: list[BucketStat]
+
+    @staticmethod
+    def settings_from_args(args: argparse.Namespace) -> dict[str, str]:
+        return {
+            name: str(getattr(args, name))
+            for name in (
+                "max_num_args",
+                "bitvector_widths",
+                "enumeration_order",
+                "dialect",
+                "configuration",
+                "consider_refinements",
+                "evaluation_points",
+            )
+        }
+
+    def save(self, directory: str) -> None:
+        """Write the checkpoint atomically in the given directory."""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"phase-{self.phase}.pickle")
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(self, f)
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def load_latest(directory: str, max_phase: int) -> Checkpoint | None:
+        """
+        Load the checkpoint of the latest phase that is at most `max_phase` from
+        the given directory, if any.
+        """
+        phases: list[int] = []
+        for filename in os.listdir(directory):
+            if filename.startswith("phase-") and filename.endswith(".pickle"):
+                phases.append(int(filename[len("phase-") : -len(".pickle")]))
+        phases = [phase for phase in phases if phase <= max_phase]
+        if not phases:
+            return None
+        path = os.path.join(directory, f"phase-{max(phases)}.pickle")
+        with open(path, "rb") as f:
+            checkpoint = pickle.load(f)
+        assert isinstance(checkpoint, Checkpoint)
+        return checkpoint
+
+    @staticmethod
+    def resume(
+        directory: str, max_phase: int, settings: dict[str, str]
+    ) -> Checkpoint | None:
+        """
+        Load the checkpoint from which to resume a run with the given settings.
+        Raises `ValueError` if the checkpoint was created with other settings.
+        """
+        checkpoint = Checkpoint.load_latest(directory, max_phase)
+        if checkpoint is not None and checkpoint.settings != settings:
+            raise ValueError(
+                f"Cannot resume from {directory}, which was created with "
+                f"different settings: {checkpoint.settings}"
+            )
+        return checkpoint
+
+
 def main() -> None:
     global_start = time.time()
 
     arg_parser = argparse.ArgumentParser()
     register_all_arguments(arg_parser)
     args = arg_parser.parse_args()
+    _init_worker(args)
 
-    canonicals: list[Pattern] = []
-    illegals: list[Pattern] = []
+    canonicals: list[PackedPattern] = []
+    illegals: list[PackedPattern] = []
     rewrites: list[RewriteRule] = []
     bucket_stats: list[BucketStat] = []
 
+    settings = Checkpoint.settings_from_args(args)
+    checkpoint_dir: str | None = args.checkpoint_dir or args.resume
+    first_phase = 0
+    if args.resume is not None:
+        checkpoint = Checkpoint.resume(args.resume, args.phases, settings)
+        if checkpoint is not None:
+            canonicals = checkpoint.canonicals
+            illegals = checkpoint.illegals
+            rewrites = checkpoint.rewrites
+            bucket_stats = checkpoint.bucket_stats
+            first_phase = checkpoint.phase + 1
+            print(f"Resuming after phase {checkpoint.phase} from {args.resume}.")
+    canonical_index = CanonicalIndex(canonicals)
+
     try:
-        for phase in range(args.phases + 1):
+        for phase in range(first_phase, args.phases + 1):
             phase_start = time.time()
 
             print(f"\033[1m== Phase {phase} (size at most {phase}) ==\033[0m")
 
             enumerating_start = time.time()
-            buckets: dict[UnorderedFingerprint, list[Pattern]] = {}
+            buckets: dict[PackedFingerprint, list[PackedPattern]] = {}
             enumerated_count = 0
             building_blocks: list[list[FuncOp]] = []
             if phase >= 2:
@@ -450,17 +724,24 @@ def main() -> None:
                     if program.size != size:
                         building_blocks.append([])
                         size = program.size
-                    building_blocks[-1].append(program.func)
+                    building_blocks[-1].append(program.unpack().func)
             illegal_patterns = list[pdl.PatternOp]()
             for illegal in illegals:
-                body, _, root, _ = func_to_pdl(illegal.func)
+                body, _, root, _ = func_to_pdl(illegal.unpack().func)
                 body.block.add_op(pdl.RewriteOp(root))
                 pattern = pdl.PatternOp(1, None, body)
                 illegal_patterns.append(pattern)
 
-            with Pool(processes=NUM_PROCESSES) as p:
+            with Pool(
+                processes=NUM_PROCESSES, initializer=_init_worker, initargs=(args,)
+            ) as p:
                 for pattern in p.imap(
-                    partial(parse_program, args.configuration),
+                    partial(
+                        parse_packed_program,
+                        args.configuration,
+                        args.enumeration_order,
+                        phase,
+                    ),
                     enumerate_programs(
                         args.max_num_args,
                         phase,
@@ -472,7 +753,7 @@ def main() -> None:
                         additional_options=["--constant-kind=none"],
                     ),
                 ):
-                    if args.enumeration_order.phase(pattern) != phase:
+                    if pattern is None:
                         continue
                     enumerated_count += 1
                     print(
@@ -490,11 +771,11 @@ def main() -> None:
             )
             bucket_stats.append(BucketStat.from_buckets(phase, buckets.values()))
 
-            new_rewrites: dict[Pattern, list[Pattern]] = {}
+            new_rewrites: dict[PackedPattern, list[PackedPattern]] = {}
 
             finding_start = time.time()
             known_behaviors, new_behaviors = find_new_behaviors(
-                list(buckets.values()), canonicals
+                list(buckets.values()), canonical_index, args
             )
             for canonical, programs in known_behaviors.items():
                 new_rewrites[canonical] = programs
@@ -506,7 +787,7 @@ def main() -> None:
             )
 
             choosing_start = time.time()
-            new_canonicals: list[Pattern] = []
+            new_canonicals: list[PackedPattern] = []
             for i, behavior in enumerate(new_behaviors):
                 print(
                     f"\033[2K Choosing new canonical programs... "
@@ -514,7 +795,7 @@ def main() -> None:
                     end="\r",
                 )
                 canonical = min(
-                    behavior, key=lambda p: next(iter(p.ordered_patterns()))
+                    behavior, key=lambda p: next(iter(p.pattern.ordered_patterns()))
                 )
                 new_canonicals.append(canonical)
                 behavior.remove(canonical)
@@ -526,7 +807,7 @@ def main() -> None:
                 f"in {choosing_time:.02f} s."
             )
 
-            new_refinements: list[tuple[Pattern, Pattern]] = []
+            new_refinements: list[tuple[PackedPattern, PackedPattern]] = []
             if args.consider_refinements and args.phases < 2:
                 print("Checking for refinements between canonicals:")
                 index: int = 0
@@ -539,16 +820,16 @@ def main() -> None:
                     for pattern2 in new_canonicals:
                         if pattern is pattern2:
                             continue
-                        if pattern2.is_refinement(pattern):
+                        if pattern2.pattern.is_refinement(pattern.pattern):
                             new_refinements.append((pattern2, pattern))
                             del new_canonicals[index]
                             break
                     else:
                         index += 1
 
-            canonicals.extend(new_canonicals)
-            # Sort canonicals to ensure deterministic output.
-            canonicals.sort(key=lambda p: next(iter(p.ordered_patterns())))
+            canonical_index.extend(new_canonicals)
+            # Keep canonicals sorted to ensure deterministic output.
+            merge_canonicals(canonicals, new_canonicals)
 
             print(" Removing redundant illegal sub-patterns...", end="\r")
             pruning_start = time.time()
@@ -564,10 +845,13 @@ def main() -> None:
             for _, new_illegal in pruned_refinements:
                 illegals.append(new_illegal)
             rewrites.extend(
-                RewriteRule(program, canonical)
+                RewriteRule(program.pattern, canonical.pattern)
                 for canonical, bucket in pruned_rewrites.items()
                 for program in bucket
             )
+            # Only keep the packed representation of the retained programs.
+            for program in (*new_canonicals, *illegals):
+                program.release()
             pruning_time = round(time.time() - pruning_start, 2)
             print(
                 f"\033[2KRemoved {pruned_count} redundant illegal sub-patterns "
@@ -581,6 +865,11 @@ def main() -> None:
                 f"and {len(illegals)} illegal sub-patterns."
             )
 
+            if checkpoint_dir is not None:
+                Checkpoint(
+                    phase, settings, canonicals, illegals, rewrites, bucket_stats
+                ).save(checkpoint_dir)
+
         print(f"\033[1m== Results ==\033[0m")
         print("Bucket stats:")
         print(BucketStat.headers())
@@ -593,7 +882,7 @@ def main() -> None:
                 os.path.join(args.out, "canonicals.mlir"), "w", encoding="UTF-8"
             ) as f:
                 for program in canonicals:
-                    f.write(str(program.func))
+                    f.write(str(program.unpack().func))
                     f.write("\n// -----\n")
 
             module = ModuleOp([rewrite.to_pdl() for rewrite in rewrites])
@@ -619,7 +908,7 @@ def main() -> None:
                     f.write("\n")
                 f.write("}")
 
-            module = ModuleOp([illegal.func.clone() for illegal in illegals])
+            module = ModuleOp([illegal.unpack().func for illegal in illegals])
             with open(
                 os.path.join(args.out, "illegals.mlir"), "w", encoding="UTF-8"
             ) as f:
@@ -629,7 +918,7 @@ def main() -> None:
         if args.summarize_canonicals:
             print(f"\033[1m== Canonical programs ({len(canonicals)}) ==\033[0m")
             for program in canonicals:
-                print(program)
+                print(program.unpack())
 
         if args.summarize_rewrites:
             print(f"\033[1m== Rewrite rules ({len(rewrites)}) ==\033[0m")
@@ -5,11 +5,11 @@ import argparse
 import z3  # pyright: ignore[reportMissingTypeStubs]
 import itertools
 from enum import Enum
-from typing import Any, Sequence
+from typing import Any, Generator, Hashable, Iterator, Sequence
 from dataclasses import dataclass
-from multiprocessing import Pool
+from multiprocessing.pool import Pool
 
-from xdsl.ir import SSAValue, Region, Block
+from xdsl.ir import Attribute, SSAValue, Region, Block
 from xdsl.parser import Parser
 from xdsl.context import Context
 from xdsl.builder import Builder
@@ -22,7 +22,14 @@ from xdsl.dialects.builtin import FunctionType
 from xdsl_smt.superoptimization.program_enumeration import enumerate_programs
 from xdsl_smt.utils.pdl import func_to_pdl
 from xdsl_smt.utils.inlining import inline_single_result_func
-from xdsl_smt.utils.run_with_smt_solver import run_module_through_smtlib
+from xdsl_smt.utils.run_with_smt_solver import (
+    SolverBackend,
+    run_module_through_smtlib,
+    set_solver_backend,
+)
+from xdsl_smt.utils.dialect_to_z3 import Z3TranslationError, Z3Translator
+from xdsl_smt.utils.smt_query_cache import get_query_cache, set_query_cache
+from xdsl_smt.utils.structural_key import structural_key
 from xdsl_smt.dialects import get_all_dialects
 from xdsl_smt.dialects import (
     smt_dialect as smt,
@@ -115,6 +122,34 @@ def register_all_arguments(arg_parser: argparse.ArgumentParser):
         help="The file containing illegal patterns to exclude",
     )
 
+    arg_parser.add_argument(
+        "--query-cache",
+        dest="query_cache",
+        type=str,
+        help="an SQLite file in which to cache the results of SMT queries across runs",
+    )
+
+    arg_parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        type=int,
+        default=1,
+        help="number of processes used to check program ranges concurrently, "
+        "and to parse programs if larger than 1. By default, programs are parsed "
+        "by one process per CPU",
+    )
+
+    arg_parser.add_argument(
+        "--solver-backend",
+        dest="solver_backend",
+        type=SolverBackend,
+        choices=tuple(SolverBackend),
+        default=SolverBackend.SMTLIB,
+        help="how SMT queries are passed to z3: printed to SMT-LIB, or built "
+        "directly as z3 expressions",
+    )
+
 
 def clone_func_to_smt_func_with_constants(func: FuncOp) -> smt.DefineFunOp:
     """
@@ -143,6 +178,15 @@ def clone_func_to_smt_func_with_constants(func: FuncOp) -> smt.DefineFunOp:
     return smt.DefineFunOp(new_region)
 
 
+def _to_z3_value(value: int, type: Attribute, ctx: z3.Context) -> Any:
+    """Convert an input or result value of a fingerprint to a z3 value."""
+    if isinstance(type, bv.BitVectorType):
+        return z3.BitVecVal(value, type.width.data, ctx)  # pyright: ignore
+    if isinstance(type, smt.BoolType):
+        return z3.BoolVal(value != 0, ctx)  # pyright: ignore[reportUnknownMemberType]
+    raise ValueError(f"Unsupported type: {type}")
+
+
 @dataclass(frozen=True)
 class SymFingerprint:
     fingerprint: dict[tuple[int, ...], dict[int, bool]]
@@ -203,6 +247,95 @@ class SymFingerprint:
             return False
         return None
 
+    @staticmethod
+    def _can_reach_results(
+        func: FuncOp, queries: Sequence[tuple[int, ...]]
+    ) -> list[bool | None]:
+        """
+        Batched version of `_can_reach_result`, where each query is a list of
+        input values followed by the result value.
+        The function is translated to z3 once, and each query is checked in
+        its own scope of a single solver. Consecutive queries with the same
+        inputs share the scope asserting the inputs.
+        Raises `Z3TranslationError` if the function cannot be translated to z3.
+        """
+        module = ModuleOp([])
+        builder = Builder(InsertPoint.at_end(module.body.block))
+        smt_func = builder.insert(clone_func_to_smt_func_with_constants(func))
+        args = [
+            builder.insert(smt.DeclareConstOp(type)).res
+            for type in smt_func.func_type.inputs.data
+        ]
+        call = builder.insert(smt.CallOp(smt_func.ret, args)).res
+
+        ctx = z3.Context()
+        translator = Z3Translator(ctx)
+        for op in module.ops:
+            translator.translate_script_op(op)
+        output = translator.translate(call[0])
+        num_inputs = len(func.function_type.inputs)
+        inputs = [translator.values[arg] for arg in args[:num_inputs]]
+        types: list[Attribute] = [
+            *func.function_type.inputs,
+            func.function_type.outputs.data[0],
+        ]
+
+        solver = z3.Solver(ctx=ctx)
+        solver.set("timeout", 1000)  # pyright: ignore[reportUnknownMemberType]
+        results: list[bool | None] = []
+        for input_values, group in itertools.groupby(
+            queries, key=lambda query: query[:num_inputs]
+        ):
+            solver.push()
+            for var, value, type in zip(inputs, input_values, types):
+                solver.add(  # pyright: ignore[reportUnknownMemberType]
+                    var == _to_z3_value(value, type, ctx)
+                )
+            for query in group:
+                solver.push()
+                solver.add(  # pyright: ignore[reportUnknownMemberType]
+                    output == _to_z3_value(query[-1], types[-1], ctx)
+                )
+                res = solver.check()  # pyright: ignore[reportUnknownMemberType]
+                solver.pop()
+                if res == z3.sat:
+                    results.append(True)
+                elif res == z3.unsat:
+                    results.append(False)
+                else:
+                    results.append(None)
+            solver.pop()
+        return results
+
+    @staticmethod
+    def _compute_from_possible_values(
+        func: FuncOp, possible_inputs: list[list[int]]
+    ) -> SymFingerprint:
+        """
+        Compute the fingerprint for the given possible values of each argument,
+        followed by the possible values of the result.
+        """
+        queries = list(itertools.product(*possible_inputs))
+        results: list[bool | None] | None = None
+        # Queries found in the query cache are checked one by one.
+        if get_query_cache() is None:
+            try:
+                results = SymFingerprint._can_reach_results(func, queries)
+            except Z3TranslationError:
+                pass
+        if results is None:
+            results = [
+                SymFingerprint._can_reach_result(func, query[:-1], query[-1])
+                for query in queries
+            ]
+
+        fingerprint: dict[tuple[int, ...], dict[int, bool]] = {}
+        for input_values, res in zip(queries, results, strict=True):
+            if res is not None:
+                fingerprint.setdefault(input_values[:-1], {})[input_values[-1]] = res
+
+        return SymFingerprint(fingerprint)
+
     @staticmethod
     def compute_exact_from_func(func: FuncOp) -> SymFingerprint:
         # Possible inputs per argument.
@@ -219,18 +352,24 @@ class SymFingerprint:
                 continue
             raise ValueError(f"Unsupported type: {type}")
 
-        fingerprint: dict[tuple[int, ...], dict[int, bool]] = {}
-        for input_values in itertools.product(*possible_inputs):
-            res = SymFingerprint._can_reach_result(
-                func, input_values[:-1], input_values[-1]
-            )
-            if res is not None:
-                fingerprint.setdefault(input_values[:-1], {})[input_values[-1]] = res
-
-        return SymFingerprint(fingerprint)
+        return SymFingerprint._compute_from_possible_values(func, possible_inputs)
 
     @staticmethod
     def compute_from_func(func: FuncOp) -> SymFingerprint:
+        """
+        Compute the fingerprint of a function. Fingerprints are memoized, so
+        structurally equivalent functions are only fingerprinted once per
+        process.
+        """
+        key = structural_key(func)
+        fingerprint = _fingerprint_cache.get(key)
+        if fingerprint is None:
+            fingerprint = SymFingerprint._compute_from_func(func)
+            _fingerprint_cache[key] = fingerprint
+        return fingerprint
+
+    @staticmethod
+    def _compute_from_func(func: FuncOp) -> SymFingerprint:
         num_possibilities = 1
         for type in [*func.function_type.inputs, func.function_type.outputs.data[0]]:
             if isinstance(type, smt.BoolType):
@@ -269,15 +408,7 @@ class SymFingerprint:
                 continue
             raise ValueError(f"Unsupported type: {type}")
 
-        fingerprint: dict[tuple[int, ...], dict[int, bool]] = {}
-        for input_values in itertools.product(*possible_inputs):
-            res = SymFingerprint._can_reach_result(
-                func, input_values[:-1], input_values[-1]
-            )
-            if res is not None:
-                fingerprint.setdefault(input_values[:-1], {})[input_values[-1]] = res
-
-        return SymFingerprint(fingerprint)
+        return SymFingerprint._compute_from_possible_values(func, possible_inputs)
 
     def short_string(self) -> str:
         """
@@ -308,6 +439,27 @@ class SymFingerprint:
                         return False
         return True
 
+    def may_be_subset_of_union(self, others: Sequence[SymFingerprint]) -> bool:
+        """
+        Returns whether this fingerprint can represent a program that has a smaller
+        range than the union of the ranges of the programs represented by the other
+        fingerprints.
+        """
+        for other in others:
+            if list(self.fingerprint.keys()) != list(other.fingerprint.keys()):
+                return True
+        for inputs, results in self.fingerprint.items():
+            for result, value in results.items():
+                if value and not any(
+                    other.fingerprint[inputs].get(result, True) for other in others
+                ):
+                    return False
+        return True
+
+
+_fingerprint_cache: dict[Hashable, SymFingerprint] = {}
+"""The fingerprints computed in this process, by structural key of the function."""
+
 
 @dataclass
 class SymProgram:
@@ -365,6 +517,57 @@ def combine_funcs_with_synth_constants(funcs: Sequence[FuncOp]) -> FuncOp:
     return funcs[0].clone()
 
 
+def _init_worker(query_cache: str | None, solver_backend: SolverBackend) -> None:
+    """
+    Initialize a worker process with the solver settings of the main process.
+    Each worker opens its own connection to the query cache.
+    """
+    set_query_cache(query_cache)
+    set_solver_backend(solver_backend)
+
+
+def _is_range_subset_task(task: tuple[FuncOp, list[FuncOp]]) -> bool:
+    """
+    Check whether the range of the first program is a subset of the union of
+    the ranges of the other programs.
+    """
+    left, right = task
+    return is_range_subset_of_list_with_z3(left, right)
+
+
+def check_range_subsets(
+    programs: Sequence[SymProgram],
+    tasks: list[tuple[int, tuple[int, ...]]],
+    pool: Pool | None,
+) -> Generator[bool, None, None]:
+    """
+    Check for each task `(left, right)` whether the range of `programs[left]` is
+    a subset of the union of the ranges of `programs[right]`. Tasks that are
+    rejected by comparing fingerprints are answered without Z3, and the other
+    ones are checked on the pool if there is one, or in the current process
+    otherwise. Results are returned in the order of the tasks.
+    The programs are sent with each task, so the workers do not depend on the
+    state of the main process.
+    """
+    may_be_subset = [
+        programs[left].fingerprint.may_be_subset_of_union(
+            [programs[index].fingerprint for index in right]
+        )
+        for left, right in tasks
+    ]
+    z3_tasks = [
+        (programs[left].func, [programs[index].func for index in right])
+        for (left, right), may in zip(tasks, may_be_subset)
+        if may
+    ]
+    z3_results: Iterator[bool]
+    if pool is None:
+        z3_results = map(_is_range_subset_task, z3_tasks)
+    else:
+        z3_results = pool.imap(_is_range_subset_task, z3_tasks)
+    yield from (may and next(z3_results) for may in may_be_subset)
+
+
 def is_range_subset_of_list_with_z3(
     left: FuncOp,
     right: Sequence[FuncOp],
@@ -528,6 +731,8 @@ def main():
     arg_parser = argparse.ArgumentParser()
     register_all_arguments(arg_parser)
     args = arg_parser.parse_args()
+    set_query_cache(args.query_cache)
+    set_solver_backend(args.solver_backend)
 
     ctx = Context()
     ctx.allow_unregistered = True
@@ -538,21 +743,28 @@ def main():
         illegals_module = Parser(ctx, f.read()).parse_module()
     illegals = [op for op in illegals_module.body.block.ops if isinstance(op, FuncOp)]
 
-    cst_canonicals = list[SymProgram]()
-    cst_illegals = list[FuncOp]()
-    for phase in range(args.phases + 1):
-        programs = list[SymProgram]()
-        print("Enumerating programs in phase", phase)
-
-        illegal_patterns = list[pdl.PatternOp]()
-        for illegal in [illegal for illegal in illegals] + cst_illegals:
-            body, _, root, _ = func_to_pdl(illegal)
-            body.block.add_op(pdl.RewriteOp(root))
-            pattern = pdl.PatternOp(1, None, body)
-            illegal_patterns.append(pattern)
-
-        with Pool() as p:
-            for program in p.imap(
+    # The pool is shared by all phases, so that the workers reuse the
+    # fingerprints they memoized in previous phases.
+    with Pool(
+        args.jobs if args.jobs > 1 else None,
+        initializer=_init_worker,
+        initargs=(args.query_cache, args.solver_backend),
+    ) as pool:
+        range_pool = pool if args.jobs > 1 else None
+        cst_canonicals = list[SymProgram]()
+        cst_illegals = list[FuncOp]()
+        for phase in range(args.phases + 1):
+            programs = list[SymProgram]()
+            print("Enumerating programs in phase", phase)
+
+            illegal_patterns = list[pdl.PatternOp]()
+            for illegal in [illegal for illegal in illegals] + cst_illegals:
+                body, _, root, _ = func_to_pdl(illegal)
+                body.block.add_op(pdl.RewriteOp(root))
+                pattern = pdl.PatternOp(1, None, body)
+                illegal_patterns.append(pattern)
+
+            for program in pool.imap(
                 parse_sym_program,
                 enumerate_programs(
                     args.max_num_args,
@@ -577,149 +789,202 @@ def main():
                 if not should_skip:
                     programs.append(program)
                 print("Enumerated", len(programs), "programs", end="\r")
-        print()
-
-        # Group canonical programs by their function type, and merge them using
-        # synth.constant.
-        grouped_cst_canonicals: dict[FunctionType, list[SymProgram]] = {}
-        for canonical in cst_canonicals:
-            grouped_cst_canonicals.setdefault(canonical.func.function_type, []).append(
-                canonical
+            print()
+
+            # Group canonical programs by their function type, and merge them using
+            # synth.constant.
+            grouped_cst_canonicals: dict[FunctionType, list[SymProgram]] = {}
+            for canonical in cst_canonicals:
+                grouped_cst_canonicals.setdefault(
+                    canonical.func.function_type, []
+                ).append(canonical)
+
+            # Check in parallel the programs against the canonicals of the same type.
+            canonical_indices: dict[FunctionType, tuple[int, ...]] = {}
+            for canonical_idx, canonical in enumerate(cst_canonicals, len(programs)):
+                function_type = canonical.func.function_type
+                canonical_indices[function_type] = (
+                    *canonical_indices.get(function_type, ()),
+                    canonical_idx,
+                )
+            subset_results = check_range_subsets(
+                programs + cst_canonicals,
+                [
+                    (program_idx, canonical_indices[program.func.function_type])
+                    for program_idx, program in enumerate(programs)
+                    if program.func.function_type in canonical_indices
+                ],
+                range_pool,
             )
 
-        new_illegals = 0
-        new_possible_canonicals = list[SymProgram]()
-        for program_idx, program in enumerate(programs):
-            canonicals_with_same_type = grouped_cst_canonicals.get(
-                program.func.function_type, []
-            )
-            if not canonicals_with_same_type:
-                new_possible_canonicals.append(program)
-                continue
-            if False:
-                for canonical_idx, canonical in enumerate(canonicals_with_same_type):
-                    print(
-                        f"\033[2K Checking program {program_idx + 1}/{len(programs)} against old programs {canonical_idx + 1}/{len(canonicals_with_same_type)}",
-                        end="\r",
-                    )
-                    assert program.func.function_type == canonical.func.function_type
+            new_illegals = 0
+            new_possible_canonicals = list[SymProgram]()
+            for program_idx, program in enumerate(programs):
+                canonicals_with_same_type = grouped_cst_canonicals.get(
+                    program.func.function_type, []
+                )
+                if not canonicals_with_same_type:
+                    new_possible_canonicals.append(program)
+                    continue
+                if False:
+                    for canonical_idx, canonical in enumerate(
+                        canonicals_with_same_type
+                    ):
+                        print(
+                            f"\033[2K Checking program {program_idx + 1}/{len(programs)} against old programs {canonical_idx + 1}/{len(canonicals_with_same_type)}",
+                            end="\r",
+                        )
+                        assert (
+                            program.func.function_type == canonical.func.function_type
+                        )
 
-                    if is_range_subset(program, canonical):
+                        if is_range_subset(program, canonical):
+                            print("Found illegal pattern:", end="")
+                            print(program.func)
+                            print("which is a subset of:", end="")
+                            print(canonical.func)
+                            print("")
+                            cst_illegals.append(program.func)
+                            break
+                    else:
+                        new_possible_canonicals.append(program)
+                else:
+                    if next(subset_results):
                         print("Found illegal pattern:", end="")
                         print(program.func)
-                        print("which is a subset of:", end="")
-                        print(canonical.func)
+                        new_illegals += 1
                         print("")
+                        print(
+                            f"Total illegal patterns found so far: {new_illegals} / {program_idx}"
+                        )
                         cst_illegals.append(program.func)
-                        break
-                else:
-                    new_possible_canonicals.append(program)
-            else:
-                if is_range_subset_of_list_with_z3(
-                    program.func, [p.func for p in canonicals_with_same_type]
-                ):
-                    print("Found illegal pattern:", end="")
-                    print(program.func)
-                    new_illegals += 1
-                    print("")
-                    print(
-                        f"Total illegal patterns found so far: {new_illegals} / {program_idx}"
-                    )
-                    cst_illegals.append(program.func)
-                else:
-                    new_possible_canonicals.append(program)
+                    else:
+                        new_possible_canonicals.append(program)
+
+            subset_results.close()
+            print()
+
+            # Check in parallel each possible canonical against all the other ones of
+            # the same type, before knowing which ones are illegal.
+            same_type_indices = [
+                tuple(
+                    rhs_idx
+                    for rhs_idx, rhs in enumerate(new_possible_canonicals)
+                    if rhs_idx != lhs_idx
+                    and lhs.func.function_type == rhs.func.function_type
+                )
+                for lhs_idx, lhs in enumerate(new_possible_canonicals)
+            ]
+            subset_results = check_range_subsets(
+                new_possible_canonicals,
+                [
+                    (lhs_idx, rhs)
+                    for lhs_idx, rhs in enumerate(same_type_indices)
+                    if rhs
+                ],
+                range_pool,
+            )
 
-        print()
+            is_illegal_mask: list[bool] = [False] * len(new_possible_canonicals)
+            for lhs_idx, lhs in enumerate(new_possible_canonicals):
+                if False:
+                    for rhs_idx, rhs in enumerate(new_possible_canonicals):
+                        print(
+                            f"\033[2K Checking program for canonical {lhs_idx + 1}/{len(new_possible_canonicals)} against {rhs_idx + 1}/{len(new_possible_canonicals)}",
+                            end="\r",
+                        )
 
-        is_illegal_mask: list[bool] = [False] * len(new_possible_canonicals)
-        for lhs_idx, lhs in enumerate(new_possible_canonicals):
-            if False:
-                for rhs_idx, rhs in enumerate(new_possible_canonicals):
+                        if is_illegal_mask[rhs_idx]:
+                            continue
+                        if lhs.func.function_type != rhs.func.function_type:
+                            continue
+                        if lhs is rhs:
+                            continue
+                        if is_range_subset(lhs, rhs):
+                            cst_illegals.append(lhs.func)
+                            is_illegal_mask[lhs_idx] = True
+                            print("Found illegal pattern:", end="")
+                            print(lhs.func)
+                            print("which is a subset of:", end="")
+                            print(rhs.func)
+                            print("")
+                            print(
+                                len([mask for mask in is_illegal_mask if mask]),
+                                "illegal patterns found so far",
+                            )
+                            print("")
+                            break
+                    else:
+                        cst_canonicals.append(lhs)
+                else:
                     print(
-                        f"\033[2K Checking program for canonical {lhs_idx + 1}/{len(new_possible_canonicals)} against {rhs_idx + 1}/{len(new_possible_canonicals)}",
+                        f"\033[2K Checking program for canonical {lhs_idx + 1}/{len(new_possible_canonicals)}",
                         end="\r",
                     )
-
-                    if is_illegal_mask[rhs_idx]:
-                        continue
-                    if lhs.func.function_type != rhs.func.function_type:
-                        continue
-                    if lhs is rhs:
-                        continue
-                    if is_range_subset(lhs, rhs):
+                    candidates: list[SymProgram] = []
+                    for rhs_idx, rhs in enumerate(new_possible_canonicals):
+                        if lhs_idx == rhs_idx:
+                            continue
+                        if is_illegal_mask[rhs_idx]:
+                            continue
+                        if lhs.func.function_type != rhs.func.function_type:
+                            continue
+                        candidates.append(rhs)
+                    is_subset = bool(same_type_indices[lhs_idx]) and next(
+                        subset_results
+                    )
+                    # A range that is not a subset of the union of all the programs is
+                    # not a subset of the union of fewer programs. Otherwise, check
+                    # again if some programs were found illegal in the meantime.
+                    if is_subset and len(candidates) != len(same_type_indices[lhs_idx]):
+                        is_subset = bool(
+                            candidates
+                        ) and is_range_subset_of_list_with_z3(
+                            lhs.func, [c.func for c in candidates]
+                        )
+                    if is_subset:
                         cst_illegals.append(lhs.func)
                         is_illegal_mask[lhs_idx] = True
                         print("Found illegal pattern:", end="")
                         print(lhs.func)
-                        print("which is a subset of:", end="")
-                        print(rhs.func)
                         print("")
                         print(
                             len([mask for mask in is_illegal_mask if mask]),
                             "illegal patterns found so far",
                         )
                         print("")
-                        break
-                else:
-                    cst_canonicals.append(lhs)
-            else:
-                print(
-                    f"\033[2K Checking program for canonical {lhs_idx + 1}/{len(new_possible_canonicals)}",
-                    end="\r",
-                )
-                candidates: list[SymProgram] = []
-                for rhs_idx, rhs in enumerate(new_possible_canonicals):
-                    if lhs_idx == rhs_idx:
-                        continue
-                    if is_illegal_mask[rhs_idx]:
-                        continue
-                    if lhs.func.function_type != rhs.func.function_type:
-                        continue
-                    candidates.append(rhs)
-                if candidates and is_range_subset_of_list_with_z3(
-                    lhs.func, [c.func for c in candidates]
-                ):
-                    cst_illegals.append(lhs.func)
-                    is_illegal_mask[lhs_idx] = True
-                    print("Found illegal pattern:", end="")
-                    print(lhs.func)
-                    print("")
-                    print(
-                        len([mask for mask in is_illegal_mask if mask]),
-                        "illegal patterns found so far",
-                    )
-                    print("")
-                else:
-                    cst_canonicals.append(lhs)
-        print(f"== At step {phase} ==")
-        print("number of canonicals", len(cst_canonicals))
-        for canonical in cst_canonicals:
-            print("  ", end="")
-            print(canonical.func)
-            print("")
-        print("number of illegals", len(cst_illegals))
-
-        illegal_patterns = list[pdl.PatternOp]()
-        for illegal in [illegal for illegal in illegals] + cst_illegals:
-            body, _, root, _ = func_to_pdl(illegal)
-            body.block.add_op(pdl.RewriteOp(root))
-            pattern = pdl.PatternOp(1, None, body)
-            illegal_patterns.append(pattern)
-
-        with open(EXCLUDE_SUBPATTERNS_FILE, "w") as f:
-            for illegal in illegal_patterns:
-                f.write(str(illegal))
-                f.write("\n// -----\n")
-
-        # Write the canonicals and illegals to files.
-        if args.out_canonicals != "":
-            with open(args.out_canonicals, "w", encoding="UTF-8") as f:
-                for program in cst_canonicals:
-                    f.write(str(program))
+                    else:
+                        cst_canonicals.append(lhs)
+            subset_results.close()
+            print(f"== At step {phase} ==")
+            print("number of canonicals", len(cst_canonicals))
+            for canonical in cst_canonicals:
+                print("  ", end="")
+                print(canonical.func)
+                print("")
+            print("number of illegals", len(cst_illegals))
+
+            illegal_patterns = list[pdl.PatternOp]()
+            for illegal in [illegal for illegal in illegals] + cst_illegals:
+                body, _, root, _ = func_to_pdl(illegal)
+                body.block.add_op(pdl.RewriteOp(root))
+                pattern = pdl.PatternOp(1, None, body)
+                illegal_patterns.append(pattern)
+
+            with open(EXCLUDE_SUBPATTERNS_FILE, "w") as f:
+                for illegal in illegal_patterns:
+                    f.write(str(illegal))
                     f.write("\n// -----\n")
 
-                f.write("\n\n\n// +++++ Illegals +++++ \n\n\n")
+            # Write the canonicals and illegals to files.
+            if args.out_canonicals != "":
+                with open(args.out_canonicals, "w", encoding="UTF-8") as f:
+                    for program in cst_canonicals:
+                        f.write(str(program))
+                        f.write("\n// -----\n")
 
-                for program in cst_illegals:
-                    f.write(str(program))
-                    f.write("\n// -----\n")
+                    f.write("\n\n\n// +++++ Illegals +++++ \n\n\n")
+
+                    for program in cst_illegals:
+                        f.write(str(program))
+                        f.write("\n// -----\n")
@@ -1,5 +1,7 @@
 import argparse
-import subprocess
+from dataclasses import dataclass, field
+from enum import Enum
+from multiprocessing.pool import AsyncResult, Pool
 
 from xdsl.context import Context
 from xdsl.parser import Parser
@@ -67,6 +69,7 @@ from ..utils.transfer_function_check_util import (
 from ..passes.transfer_unroll_loop import UnrollTransferLoop
 from xdsl_smt.semantics import transfer_semantics
 from ..traits.smt_printer import print_to_smtlib
+from ..utils.smt_solver_service import run_smtlib_query
 from xdsl_smt.passes.lower_pairs import LowerPairs
 from xdsl.transforms.canonicalize import CanonicalizePass
 from xdsl_smt.semantics.arith_semantics import arith_semantics
@@ -92,6 +95,13 @@ def register_all_arguments(arg_parser: argparse.ArgumentParser):
         help="path to the transfer functions",
         default=8,
     )
+    arg_parser.add_argument(
+        "-j",
+        type=int,
+        default=1,
+        dest="jobs",
+        help="number of processes used to check queries concurrently",
+    )
 
 
 def parse_file(ctx: Context, file: str | None) -> Operation:
@@ -134,7 +144,8 @@ def fix_bit_width_in_verify_pattern(module: ModuleOp):
                     op.operands[1].replace_by(new_constant_op.res)
 
 
-def verify_pattern(ctx: Context, op: ModuleOp) -> bool:
+def to_smtlib_query(ctx: Context, op: ModuleOp) -> str:
+    """Lower a query and print it in SMT-LIB."""
     cloned_op = op.clone()
     stream = StringIO()
     LowerPairs().apply(ctx, cloned_op)
@@ -142,15 +153,16 @@ def verify_pattern(ctx: Context, op: ModuleOp) -> bool:
     DeadCodeElimination().apply(ctx, cloned_op)
     fix_bit_width_in_verify_pattern(cloned_op)
     print_to_smtlib(cloned_op, stream)
-    res = subprocess.run(
-        ["z3", "-in"],
-        capture_output=True,
-        input=stream.getvalue(),
-        text=True,
-    )
-    if res.returncode != 0:
-        raise Exception(res.stderr)
-    return "unsat" in res.stdout
+    return stream.getvalue()
+
+
+def is_unsat(query: str) -> bool:
+    """Check whether an SMT-LIB query is unsatisfiable."""
+    return "unsat" in run_smtlib_query(query)
+
+
+def verify_pattern(ctx: Context, op: ModuleOp) -> bool:
+    return is_unsat(to_smtlib_query(ctx, op))
 
 
 def get_dynamic_concrete_function_name(concrete_op_name: str) -> str:
@@ -475,13 +487,13 @@ def get_dynamic_functions(
     return result
 
 
-def soundness_check(
+def soundness_query(
     smt_transfer_function: SMTTransferFunction,
     domain_constraint: FunctionCollection,
     instance_constraint: FunctionCollection,
     int_attr: dict[int, int],
     ctx: Context,
-):
+) -> ModuleOp:
     query_module = ModuleOp([])
     if smt_transfer_function.is_forward:
         added_ops: list[Operation] = forward_soundness_check(
@@ -499,18 +511,17 @@ def soundness_check(
         )
     query_module.body.block.add_ops(added_ops)
     FunctionCallInline(True, {}).apply(ctx, query_module)
+    return query_module
 
-    print("Soundness Check result:", verify_pattern(ctx, query_module))
 
-
-def soundness_counterexample_check(
+def soundness_counterexample_query(
     smt_transfer_function: SMTTransferFunction,
     domain_constraint: FunctionCollection,
     instance_constraint: FunctionCollection,
     func_name_to_func: dict[str, FuncOp],
     int_attr: dict[int, int],
     ctx: Context,
-):
+) -> ModuleOp | None:
     if smt_transfer_function.soundness_counterexample is not None:
         query_module = ModuleOp([])
         soundness_counterexample_func_name = (
@@ -529,20 +540,18 @@ def soundness_counterexample_check(
         query_module.body.block.add_ops(added_ops)
         FunctionCallInline(True, {}).apply(ctx, query_module)
         # LowerToSMTPass().apply(ctx, query_module)
-        print(
-            "Unable to find soundness counterexample: ",
-            verify_pattern(ctx, query_module),
-        )
+        return query_module
+    return None
 
 
-def precision_check(
+def precision_query(
     smt_transfer_function: SMTTransferFunction,
     domain_constraint: FunctionCollection,
     instance_constraint: FunctionCollection,
     func_name_to_func: dict[str, FuncOp],
     int_attr: dict[int, int],
     ctx: Context,
-):
+) -> ModuleOp:
     query_module = ModuleOp([])
     if smt_transfer_function.is_forward:
         added_ops: list[Operation] = forward_precision_check(
@@ -571,27 +580,69 @@ def precision_check(
 
     FunctionCallInline(True, {}).apply(ctx, query_module)
     assert module_op_validity_check(query_module)
-    print(
-        "Precision Check result:",
-        verify_pattern(ctx, query_module),
-    )
+    return query_module
+
+
+class CheckKind(Enum):
+    """The kinds of queries checked for each transfer function."""
+
+    INT_ATTR = "Integer attributes are valid:"
+    SOUNDNESS = "Soundness Check result:"
+    SOUNDNESS_COUNTEREXAMPLE = "Unable to find soundness counterexample: "
+    PRECISION = "Precision Check result:"
+
+
+@dataclass(frozen=True)
+class VerificationTask:
+    """
+    A single query of the verification, identified by the width, the transfer
+    function, the values of its integer attributes, and the kind of check.
+    """
+
+    width: int
+    function: str
+    int_attr: tuple[tuple[int, int], ...]
+    check: CheckKind
+
 
+@dataclass
+class VerificationReport:
+    """
+    The results of all queries, in the order in which they were created. The
+    results of the soundness and precision checks are printed as they are
+    added.
+    """
 
-def verify_smt_transfer_function(
+    results: dict[VerificationTask, bool] = field(
+        default_factory=dict[VerificationTask, bool]
+    )
+    _width: int | None = None
+    _function: str | None = None
+
+    def add(self, task: VerificationTask, result: bool) -> None:
+        self.results[task] = result
+        if task.width != self._width:
+            self._width, self._function = task.width, None
+            print("Current width: ", task.width)
+        if task.function != self._function:
+            self._function = task.function
+            print("Current verify: ", task.function)
+        if task.check != CheckKind.INT_ATTR:
+            print(task.check.value, result)
+
+
+def int_attr_queries(
     smt_transfer_function: SMTTransferFunction,
     domain_constraint: FunctionCollection,
     instance_constraint: FunctionCollection,
     width: int,
-    transfer_function: TransferFunction,
-    func_name_to_func: dict[str, FuncOp],
-    dynamic_transfer_functions: dict[str, FuncOp],
-    dynamic_functions: dict[str, FuncOp],
     ctx: Context,
-) -> None:
-    # Soundness check
-    query_module = ModuleOp([])
-    dynamic_concrete_function_module = ModuleOp([])
-    dynamic_transfer_function_module = ModuleOp([])
+) -> list[tuple[dict[int, int], ModuleOp]]:
+    """
+    Returns, for all possible values of the integer attributes of the transfer
+    function, a query that is satisfiable if the values are valid.
+    """
+    queries: list[tuple[dict[int, int], ModuleOp]] = []
     int_attr = generate_int_attr_arg(smt_transfer_function.int_attr_arg)
 
     # enumerating all possible int attr
@@ -602,136 +653,198 @@ def verify_smt_transfer_function(
         )
         query_module.body.block.add_ops(added_ops)
         FunctionCallInline(True, {}).apply(ctx, query_module)
-        # we find int_attr is satisfiable
-        if not verify_pattern(ctx, query_module):
-            # start to create dynamic concrete function
-            # and update smt_transfer_function
-            resetConcreteFunction = False
-            if smt_transfer_function.concrete_function is None:
-                dynamic_concrete_function_module = ModuleOp([])
-                dynamic_concrete_function_module.body.block.add_ops(
-                    [
-                        get_dynamic_concrete_function(
-                            smt_transfer_function.concrete_function_name,
-                            width,
-                            int_attr,
-                            transfer_function.is_forward,
-                        )
-                    ]
-                )
-                resetConcreteFunction = True
-                lower_to_smt_module(dynamic_concrete_function_module, width, ctx)
-                assert len(dynamic_concrete_function_module.ops) == 1
-                assert isinstance(
-                    dynamic_concrete_function_module.ops.first, DefineFunOp
-                )
-                concrete_func = dynamic_concrete_function_module.ops.first
-                smt_transfer_function.concrete_function = concrete_func
+        queries.append((dict(int_attr), query_module))
 
-            assert smt_transfer_function.concrete_function is not None
+        hasNext = next_int_attr_arg(int_attr, width)
+        if not hasNext:
+            break
+    return queries
 
-            resetTransferFunction = False
 
-            if smt_transfer_function.transfer_function is None:
-                # dynamic create transfer_function with given int_attr
-                dynamic_transfer_function_module = ModuleOp([])
-                smt_transfer_function.transfer_function = get_dynamic_transfer_function(
-                    dynamic_transfer_functions[
-                        smt_transfer_function.transfer_function_name
-                    ].clone(),
+def verification_queries(
+    smt_transfer_function: SMTTransferFunction,
+    domain_constraint: FunctionCollection,
+    instance_constraint: FunctionCollection,
+    width: int,
+    transfer_function: TransferFunction,
+    func_name_to_func: dict[str, FuncOp],
+    dynamic_transfer_functions: dict[str, FuncOp],
+    dynamic_functions: dict[str, FuncOp],
+    int_attr: dict[int, int],
+    ctx: Context,
+) -> list[tuple[CheckKind, ModuleOp]]:
+    """
+    Returns the soundness and precision queries of a transfer function, for
+    valid values of its integer attributes.
+    """
+    # start to create dynamic concrete function
+    # and update smt_transfer_function
+    resetConcreteFunction = False
+    if smt_transfer_function.concrete_function is None:
+        dynamic_concrete_function_module = ModuleOp([])
+        dynamic_concrete_function_module.body.block.add_ops(
+            [
+                get_dynamic_concrete_function(
+                    smt_transfer_function.concrete_function_name,
                     width,
-                    dynamic_transfer_function_module,
                     int_attr,
-                    ctx,
+                    transfer_function.is_forward,
                 )
-                resetTransferFunction = True
+            ]
+        )
+        resetConcreteFunction = True
+        lower_to_smt_module(dynamic_concrete_function_module, width, ctx)
+        assert len(dynamic_concrete_function_module.ops) == 1
+        assert isinstance(dynamic_concrete_function_module.ops.first, DefineFunOp)
+        concrete_func = dynamic_concrete_function_module.ops.first
+        smt_transfer_function.concrete_function = concrete_func
+
+    assert smt_transfer_function.concrete_function is not None
+
+    resetTransferFunction = False
+
+    if smt_transfer_function.transfer_function is None:
+        # dynamic create transfer_function with given int_attr
+        dynamic_transfer_function_module = ModuleOp([])
+        smt_transfer_function.transfer_function = get_dynamic_transfer_function(
+            dynamic_transfer_functions[
+                smt_transfer_function.transfer_function_name
+            ].clone(),
+            width,
+            dynamic_transfer_function_module,
+            int_attr,
+            ctx,
+        )
+        resetTransferFunction = True
 
-            assert smt_transfer_function.transfer_function is not None
+    assert smt_transfer_function.transfer_function is not None
 
-            dynamic_functions_name_to_functions = {}
-            resetSoundnessCounterExample = False
-            resetPercisionUtil = False
-            if len(dynamic_functions) > 0 and len(int_attr) > 0:
-                dynamic_functions_module = ModuleOp([])
-                dynamic_functions_name_to_functions = get_dynamic_functions(
-                    dynamic_functions, width, dynamic_functions_module, int_attr, ctx
-                )
-                # Fix soundness_counterexample and precision_util
-                if (
-                    smt_transfer_function.soundness_counterexample is None
-                    and "soundness_counterexample"
-                    in transfer_function.transfer_function.attributes
-                ):
-                    soundness_counterexample_func_name_attr = (
-                        transfer_function.transfer_function.attributes[
-                            "soundness_counterexample"
-                        ]
-                    )
-                    assert isinstance(
-                        soundness_counterexample_func_name_attr, StringAttr
-                    )
-                    soundness_counterexample_func_name = (
-                        soundness_counterexample_func_name_attr.data
-                    )
-                    smt_transfer_function.soundness_counterexample = (
-                        dynamic_functions_name_to_functions[
-                            soundness_counterexample_func_name
-                        ]
-                    )
-                    resetSoundnessCounterExample = True
+    dynamic_functions_name_to_functions = {}
+    resetSoundnessCounterExample = False
+    resetPercisionUtil = False
+    if len(dynamic_functions) > 0 and len(int_attr) > 0:
+        dynamic_functions_module = ModuleOp([])
+        dynamic_functions_name_to_functions = get_dynamic_functions(
+            dynamic_functions, width, dynamic_functions_module, int_attr, ctx
+        )
+        # Fix soundness_counterexample and precision_util
+        if (
+            smt_transfer_function.soundness_counterexample is None
+            and "soundness_counterexample"
+            in transfer_function.transfer_function.attributes
+        ):
+            soundness_counterexample_func_name_attr = (
+                transfer_function.transfer_function.attributes[
+                    "soundness_counterexample"
+                ]
+            )
+            assert isinstance(soundness_counterexample_func_name_attr, StringAttr)
+            soundness_counterexample_func_name = (
+                soundness_counterexample_func_name_attr.data
+            )
+            smt_transfer_function.soundness_counterexample = (
+                dynamic_functions_name_to_functions[soundness_counterexample_func_name]
+            )
+            resetSoundnessCounterExample = True
+
+        if (
+            smt_transfer_function.precision_util is None
+            and "precision_util" in transfer_function.transfer_function.attributes
+        ):
+            precision_util_func_name_attr = (
+                transfer_function.transfer_function.attributes["precision_util"]
+            )
+            assert isinstance(precision_util_func_name_attr, StringAttr)
+            precision_util_func_name = precision_util_func_name_attr.data
+            smt_transfer_function.precision_util = dynamic_functions_name_to_functions[
+                precision_util_func_name
+            ]
+            resetPercisionUtil = True
 
-                if (
-                    smt_transfer_function.precision_util is None
-                    and "precision_util"
-                    in transfer_function.transfer_function.attributes
-                ):
-                    precision_util_func_name_attr = (
-                        transfer_function.transfer_function.attributes["precision_util"]
-                    )
-                    assert isinstance(precision_util_func_name_attr, StringAttr)
-                    precision_util_func_name = precision_util_func_name_attr.data
-                    smt_transfer_function.precision_util = (
-                        dynamic_functions_name_to_functions[precision_util_func_name]
-                    )
-                    resetPercisionUtil = True
+    queries: list[tuple[CheckKind, ModuleOp]] = []
+    queries.append(
+        (
+            CheckKind.SOUNDNESS,
+            soundness_query(
+                smt_transfer_function,
+                domain_constraint,
+                instance_constraint,
+                int_attr,
+                ctx,
+            ),
+        )
+    )
+    counterexample_query = soundness_counterexample_query(
+        smt_transfer_function,
+        domain_constraint,
+        instance_constraint,
+        func_name_to_func,
+        int_attr,
+        ctx,
+    )
+    if counterexample_query is not None:
+        queries.append((CheckKind.SOUNDNESS_COUNTEREXAMPLE, counterexample_query))
+    queries.append(
+        (
+            CheckKind.PRECISION,
+            precision_query(
+                smt_transfer_function,
+                domain_constraint,
+                instance_constraint,
+                func_name_to_func,
+                int_attr,
+                ctx,
+            ),
+        )
+    )
+    if resetConcreteFunction:
+        smt_transfer_function.concrete_function = None
+    if resetTransferFunction:
+        smt_transfer_function.transfer_function = None
+    if resetSoundnessCounterExample:
+        smt_transfer_function.soundness_counterexample = None
+    if resetPercisionUtil:
+        smt_transfer_function.precision_util = None
 
-            if True:
-                soundness_check(
-                    smt_transfer_function,
-                    domain_constraint,
-                    instance_constraint,
-                    int_attr,
-                    ctx,
-                )
-                soundness_counterexample_check(
-                    smt_transfer_function,
-                    domain_constraint,
-                    instance_constraint,
-                    func_name_to_func,
-                    int_attr,
-                    ctx,
-                )
-            if True:
-                precision_check(
-                    smt_transfer_function,
-                    domain_constraint,
-                    instance_constraint,
-                    func_name_to_func,
-                    int_attr,
-                    ctx,
-                )
-            if resetConcreteFunction:
-                smt_transfer_function.concrete_function = None
-            if resetTransferFunction:
-                smt_transfer_function.transfer_function = None
-            if resetSoundnessCounterExample:
-                smt_transfer_function.soundness_counterexample = None
-            if resetPercisionUtil:
-                smt_transfer_function.precision_util = None
+    return queries
 
-        hasNext = next_int_attr_arg(int_attr, width)
-        if not hasNext:
-            break
+
+PendingResult = AsyncResult[bool] | bool
+"""The result of a query, which is still being checked if it is asynchronous."""
+
+
+def check_query(pool: Pool | None, query: ModuleOp) -> PendingResult:
+    """
+    Check a query on the pool if there is one, or in the current process
+    otherwise. The result is `True` if the query is unsatisfiable.
+    The query is printed in SMT-LIB in the current process, so that the workers
+    only run the solver.
+    """
+    if pool is None:
+        return verify_pattern(ctx, query)
+    return pool.apply_async(is_unsat, (to_smtlib_query(ctx, query),))
+
+
+def _is_ready(result: PendingResult) -> bool:
+    return not isinstance(result, AsyncResult) or result.ready()
+
+
+def _get(result: PendingResult) -> bool:
+    return result.get() if isinstance(result, AsyncResult) else result
+
+
+def _report_checks(
+    report: VerificationReport,
+    pending: list[list[tuple[VerificationTask, PendingResult]]],
+    wait: bool,
+) -> None:
+    """
+    Add the results of the pending transfer functions to the report, in order.
+    Unless `wait` is set, stop at the first one whose checks are not all done.
+    """
+    while pending and (wait or all(_is_ready(result) for _, result in pending[0])):
+        for task, result in pending.pop(0):
+            report.add(task, _get(result))
 
 
 def main() -> None:
@@ -751,6 +864,20 @@ def main() -> None:
     ctx.load_dialect(Transfer)
     ctx.load_dialect(Index)
 
+    pool = Pool(processes=args.jobs) if args.jobs > 1 else None
+    try:
+        verify_transfer_functions(args, pool)
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+def verify_transfer_functions(args: argparse.Namespace, pool: Pool | None) -> None:
+    """
+    Verify the transfer functions of the input file. The results of each
+    transfer function are printed once all of its queries are checked.
+    """
+
     # Parse the files
     module = parse_file(ctx, args.transfer_functions)
     assert isinstance(module, ModuleOp)
@@ -792,8 +919,10 @@ def main() -> None:
 
     FunctionCallInline(False, func_name_to_func).apply(ctx, module)
 
+    report = VerificationReport()
+    # The checks of the transfer functions whose results are not printed yet.
+    pending: list[list[tuple[VerificationTask, PendingResult]]] = []
     for width in solve_vector_width(args.maximal_verify_bits):
-        print("Current width: ", width)
         smt_module = module.clone()
 
         # expand for loops
@@ -882,7 +1011,6 @@ def main() -> None:
             if func_name in func_name_to_smt_func:
                 smt_transfer_function = func_name_to_smt_func[func_name]
 
-            print("Current verify: ", func_name)
             abs_op_constraint = None
             if "abs_op_constraint" in transfer_function.transfer_function.attributes:
                 abs_op_constraint_name_attr = (
@@ -961,14 +1089,50 @@ def main() -> None:
                 concrete_func,
             )
 
-            verify_smt_transfer_function(
-                smt_transfer_function_obj,
-                domain_constraint,
-                instance_constraint,
-                width,
-                transfer_function,
-                func_name_to_func,
-                dynamic_transfer_functions,
-                dynamic_functions,
-                ctx,
-            )
+            # First check which integer attributes are valid, then check the
+            # soundness and precision of the transfer function for the valid
+            # ones.
+            int_attr_checks = [
+                (int_attr, check_query(pool, query))
+                for int_attr, query in int_attr_queries(
+                    smt_transfer_function_obj,
+                    domain_constraint,
+                    instance_constraint,
+                    width,
+                    ctx,
+                )
+            ]
+            checks: list[tuple[VerificationTask, PendingResult]] = []
+            for int_attr, int_attr_check in int_attr_checks:
+                try:
+                    is_invalid = _get(int_attr_check)
+                except Exception:
+                    # Report the previous transfer functions before failing.
+                    _report_checks(report, pending, wait=True)
+                    raise
+                task = VerificationTask(
+                    width, func_name, tuple(int_attr.items()), CheckKind.INT_ATTR
+                )
+                checks.append((task, not is_invalid))
+                if is_invalid:
+                    continue
+                for check, query in verification_queries(
+                    smt_transfer_function_obj,
+                    domain_constraint,
+                    instance_constraint,
+                    width,
+                    transfer_function,
+                    func_name_to_func,
+                    dynamic_transfer_functions,
+                    dynamic_functions,
+                    int_attr,
+                    ctx=ctx,
+                ):
+                    task = VerificationTask(
+                        width, func_name, tuple(int_attr.items()), check
+                    )
+                    checks.append((task, check_query(pool, query)))
+            pending.append(checks)
+            _report_checks(report, pending, wait=False)
+
+    _report_checks(report, pending, wait=True)
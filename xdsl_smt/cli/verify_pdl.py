@@ -4,18 +4,46 @@ Verify a PDL rewrite for different integer types.
 Check for both correctness and precision.
 """
 
-import subprocess
 import argparse
+import itertools
+import multiprocessing
+import sys
 
 from io import StringIO
-from typing import Iterable
-from xdsl.ir import Dialect
+from multiprocessing import Pool
+from multiprocessing.sharedctypes import SynchronizedArray
+from functools import partial
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+from xdsl.builder import Builder
+from xdsl.ir import Dialect, SSAValue
 from xdsl.context import Context
+from xdsl.parser import Parser
+from xdsl.printer import Printer
+from xdsl.rewriter import InsertPoint
 
-from xdsl.dialects.builtin import Builtin, ModuleOp, IntegerType
+from xdsl.dialects.builtin import (
+    Builtin,
+    FunctionType,
+    IntAttr,
+    IntegerAttr,
+    IntegerType,
+    ModuleOp,
+    StringAttr,
+)
 from xdsl.dialects.func import Func
-from xdsl.dialects.pdl import PDL, PatternOp, TypeOp
-from xdsl.dialects.arith import Arith
+from xdsl.dialects.pdl import (
+    PDL,
+    AttributeOp,
+    OperandOp,
+    OperationOp,
+    PatternOp,
+    ReplaceOp,
+    ResultOp,
+    RewriteOp,
+    TypeOp,
+)
+from xdsl.dialects.arith import Arith, IntegerOverflowAttr
 from xdsl.dialects.comb import Comb
 from xdsl.transforms.common_subexpression_elimination import (
     CommonSubexpressionElimination,
@@ -29,6 +57,8 @@ from ..dialects.pdl_dataflow import PDLDataflowDialect
 from ..dialects.smt_bitvector_dialect import SMTBitVectorDialect
 from ..dialects.smt_dialect import SMTDialect
 from ..dialects.smt_utils_dialect import SMTUtilsDialect
+from ..dialects import smt_dialect as smt
+from ..dialects import smt_int_dialect as smt_int
 from ..dialects.index_dialect import Index
 from ..dialects.transfer import TransIntegerType, Transfer
 from ..dialects.hw_dialect import HW
@@ -38,12 +68,19 @@ from xdsl_smt.passes.lower_pairs import LowerPairs
 from xdsl.transforms.canonicalize import CanonicalizePass
 from xdsl_smt.passes.pdl_to_smt import PDLToSMT
 from ..traits.smt_printer import print_to_smtlib
+from xdsl_smt.utils.smt_solver_service import run_smtlib_query
 from xdsl_smt.pdl_constraints.integer_arith_constraints import (
     integer_arith_native_rewrites,
     integer_arith_native_constraints,
     integer_arith_native_static_constraints,
 )
-from xdsl_smt.passes.lower_to_smt.smt_lowerer_loaders import load_vanilla_semantics
+from xdsl_smt.passes.lower_to_smt.smt_lowerer import SMTLowerer
+from xdsl_smt.passes.lower_to_smt.smt_lowerer_loaders import (
+    load_int_semantics,
+    load_vanilla_semantics,
+)
+from xdsl_smt.semantics.arith_int_semantics import IntIntegerTypeRefinementSemantics
+from xdsl_smt.semantics.generic_integer_proxy import IntegerProxy
 from xdsl_smt.passes.smt_expand import SMTExpand
 
 
@@ -60,62 +97,352 @@ def verify_pattern(ctx: Context, op: ModuleOp, opt: bool) -> bool:
     cloned_op.verify()
     stream = StringIO()
     print_to_smtlib(cloned_op, stream)
-    res = subprocess.run(
-        ["z3", "-in"],
-        capture_output=True,
-        input=stream.getvalue(),
-        text=True,
-    )
-    if res.returncode != 0:
+    try:
+        output = run_smtlib_query(stream.getvalue())
+    except Exception as e:
         raise Exception(
             "An exception was raised in the following program: "
-            f"{stream.getvalue()} \n\n Error message: {res.stderr}"
+            f"{stream.getvalue()} \n\n Error message: {e}"
         )
 
-    return "unsat" in res.stdout
+    return "unsat" in output
+
+
+def _integer_type_ops(op: PatternOp) -> list[TypeOp]:
+    """Returns the TypeOp in the pattern that can be specialized to an integer type."""
+    return [
+        sub_op
+        for sub_op in op.walk()
+        if isinstance(sub_op, TypeOp)
+        and isinstance(sub_op.constantType, TransIntegerType)
+    ]
+
+
+def integer_bitwidths(op: PatternOp, max_bitwidth: int) -> Iterable[tuple[int, ...]]:
+    """
+    Returns all the bitwidths to which the integer types of the pattern can be
+    specialized, with the bitwidth of the first type varying the fastest.
+    """
+    num_types = len(_integer_type_ops(op))
+    for bitwidths in itertools.product(range(1, max_bitwidth + 1), repeat=num_types):
+        yield bitwidths[::-1]
+
+
+def specialize_pattern(op: PatternOp, bitwidths: tuple[int, ...]) -> PatternOp:
+    """Returns a copy of the pattern with its integer types specialized."""
+    specialized = op.clone()
+    type_ops = _integer_type_ops(specialized)
+    for type_op, bitwidth in zip(type_ops, bitwidths, strict=True):
+        type_op.constantType = IntegerType(bitwidth)
+    return specialized
 
 
 def iterate_on_all_integers(
     op: PatternOp,
     max_bitwidth: int,
 ) -> Iterable[tuple[PatternOp, tuple[int, ...]]]:
-    # Find all the TypeOp in the pattern
-    type_ops: list[TypeOp] = []
+    for bitwidths in integer_bitwidths(op, max_bitwidth):
+        yield specialize_pattern(op, bitwidths), bitwidths
+
+
+PARAMETRIC_OPERATIONS = {
+    "arith.addi",
+    "arith.subi",
+    "arith.muli",
+    "arith.andi",
+    "arith.cmpi",
+    "arith.select",
+}
+"""
+Operations whose semantics on integers of symbolic width are exact. In
+particular, the semantics of other operations ignore their flags, or do not
+model undefined behavior yet.
+"""
+
+PARAMETRIC_CMPI_PREDICATES = {0, 1, 6, 7, 8, 9}
+"""The `arith.cmpi` predicates supported on integers of symbolic width."""
+
+
+def supports_parametric_verification(op: PatternOp) -> bool:
+    """
+    Returns whether the pattern has integer types to specialize, and can be
+    verified for all bitwidths at once with `verify_pattern_parametric`.
+    Operations may only use `arith.cmpi` predicates, and no overflow flags.
+    """
+    if not _integer_type_ops(op):
+        return False
     for sub_op in op.walk():
-        if isinstance(sub_op, TypeOp) and isinstance(
-            sub_op.constantType, TransIntegerType
-        ):
-            type_ops.append(sub_op)
-
-    # No type to specialize case
-    if not type_ops:
-        yield op.clone(), ()
-        return
+        match sub_op:
+            case (
+                PatternOp()
+                | TypeOp()
+                | OperandOp()
+                | ResultOp()
+                | RewriteOp()
+                | ReplaceOp()
+            ):
+                pass
+            case OperationOp(opName=StringAttr(data=name)) if (
+                name in PARAMETRIC_OPERATIONS
+            ):
+                pass
+            case AttributeOp(value=IntegerOverflowAttr(data=())):
+                pass
+            case AttributeOp(value=IntegerAttr(value=IntAttr(data=predicate))) if (
+                predicate in PARAMETRIC_CMPI_PREDICATES
+                and all(
+                    isinstance(use.operation, OperationOp)
+                    and use.operation.opName == StringAttr("arith.cmpi")
+                    for use in sub_op.output.uses
+                )
+            ):
+                pass
+            case _:
+                return False
+    return True
+
+
+@contextmanager
+def _parametric_int_semantics(integer_proxy: IntegerProxy):
+    """Lower integers to integers of symbolic width within the context."""
+    saved = (
+        SMTLowerer.op_semantics,
+        SMTLowerer.type_lowerers,
+        SMTLowerer.attribute_semantics,
+        PDLToSMT.pdl_lowerer.refinement,
+    )
+    load_int_semantics(integer_proxy)
+    PDLToSMT.pdl_lowerer.refinement = IntIntegerTypeRefinementSemantics(integer_proxy)
+    try:
+        yield
+    finally:
+        (
+            SMTLowerer.op_semantics,
+            SMTLowerer.type_lowerers,
+            SMTLowerer.attribute_semantics,
+            PDLToSMT.pdl_lowerer.refinement,
+        ) = saved
+
+
+def verify_pattern_parametric(
+    ctx: Context, op: PatternOp, max_bitwidth: int, timeout: int
+) -> bool:
+    """
+    Verify a pattern for all the bitwidths up to `max_bitwidth` in a single
+    query, by giving each integer type a symbolic width. Returns `True` only if
+    the pattern is proven sound for all bitwidths within `timeout` milliseconds.
+    """
+    pattern = op.clone()
+    integer_type_ops = _integer_type_ops(pattern)
 
-    # The initial types are all 1
-    bitwidths = [1 for _ in type_ops]
-    while True:
-        # Assign the types in the pattern:
-        for type_op, bitwidth in zip(type_ops, bitwidths):
-            type_op.constantType = IntegerType(bitwidth)
-
-        yield op.clone(), tuple(bitwidths)
-
-        # Get the next bitwidths to try
-        index = 0
-        while index < len(bitwidths):
-            bitwidth = bitwidths[index]
-            if bitwidth == max_bitwidth:
-                bitwidths[index] = 1
-                index += 1
+    # The width of each operand, either the index of a symbolic width or a
+    # constant width.
+    operand_widths: list[tuple[int | None, int]] = []
+    for sub_op in pattern.walk():
+        if isinstance(sub_op, OperandOp):
+            assert sub_op.value_type is not None
+            type_op = sub_op.value_type.owner
+            assert isinstance(type_op, TypeOp)
+            if type_op in integer_type_ops:
+                operand_widths.append((integer_type_ops.index(type_op), 0))
             else:
-                bitwidths[index] += 1
-                break
-        else:
-            break
+                assert isinstance(type_op.constantType, IntegerType)
+                operand_widths.append((None, type_op.constantType.width.data))
+
+    # Define pow2 on the bitwidths in use, instead of constraining it with
+    # quantifiers as `IntegerProxy` does by default.
+    builder = Builder(InsertPoint.at_start(pattern.body.block))
+
+    def constant(value: int) -> SSAValue:
+        return builder.insert(smt_int.ConstantOp(value)).res
+
+    def assert_(value: SSAValue) -> None:
+        builder.insert(smt.AssertOp(value))
+
+    pow2 = builder.insert(
+        smt.DeclareFunOp(
+            FunctionType.from_lists([smt_int.SMTIntType()], [smt_int.SMTIntType()]),
+            "pow2",
+        )
+    ).ret
+    for bitwidth in range(max_bitwidth + 1):
+        call = builder.insert(smt.CallOp(pow2, [constant(bitwidth)])).res[0]
+        assert_(builder.insert(smt.EqOp(call, constant(2**bitwidth))).res)
+
+    module = ModuleOp([pattern])
+    integer_proxy = IntegerProxy(pow2_fun=pow2)
+    with _parametric_int_semantics(integer_proxy):
+        PDLToSMT().apply(ctx, module)
+
+    check_sat = module.body.block.last_op
+    assert isinstance(check_sat, smt.CheckSatOp)
+    builder = Builder(InsertPoint.before(check_sat))
+
+    # Declare the symbolic widths.
+    widths = [
+        builder.insert(smt.DeclareConstOp(smt_int.SMTIntType())).res
+        for _ in integer_type_ops
+    ]
+    for width in widths:
+        assert_(builder.insert(smt_int.LeOp(constant(1), width)).res)
+        assert_(builder.insert(smt_int.LeOp(width, constant(max_bitwidth))).res)
+
+    # Constrain the operands to be integers of the right width.
+    operands = [
+        sub_op.res
+        for sub_op in module.body.block.ops
+        if isinstance(sub_op, smt.DeclareConstOp)
+        and sub_op.res.type == integer_proxy.int_type
+    ]
+    assert len(operands) == len(operand_widths)
+    for operand, (width_index, constant_width) in zip(operands, operand_widths):
+        payload, _, width = integer_proxy.unpack_integer(operand, builder)
+        expected_width = (
+            widths[width_index] if width_index is not None else constant(constant_width)
+        )
+        assert_(builder.insert(smt.EqOp(width, expected_width)).res)
+        int_max = builder.insert(smt.CallOp(pow2, [width])).res[0]
+        assert_(builder.insert(smt_int.LeOp(constant(0), payload)).res)
+        assert_(builder.insert(smt_int.LtOp(payload, int_max)).res)
 
-    for type_op in type_ops:
-        type_op.constantType = TransIntegerType()
+    LowerEffectPass().apply(ctx, module)
+    SMTExpand().apply(ctx, module)
+    module.verify()
+    stream = StringIO()
+    print(f"(set-option :timeout {timeout})", file=stream)
+    print_to_smtlib(module, stream)
+    return "unsat" in run_smtlib_query(stream.getvalue())
+
+
+def register_verification_dialects(ctx: Context) -> None:
+    """Register the dialects of the patterns and of their SMT encoding."""
+    NEW_PDL = Dialect(
+        "pdl",
+        [*PDL.operations, *PDLDataflowDialect.operations],
+        [*PDL.attributes, *PDLDataflowDialect.attributes],
+    )
+    SMT_COLLECTION = Dialect(
+        "smt",
+        [
+            *SMTDialect.operations,
+            *SMTBitVectorDialect.operations,
+            *SMTUtilsDialect.operations,
+        ],
+        [
+            *SMTDialect.attributes,
+            *SMTBitVectorDialect.attributes,
+            *SMTUtilsDialect.attributes,
+        ],
+    )
+    ctx.register_dialect(Arith.name, lambda: Arith)
+    ctx.register_dialect(Builtin.name, lambda: Builtin)
+    ctx.register_dialect(Func.name, lambda: Func)
+    ctx.register_dialect(Index.name, lambda: Index)
+    ctx.register_dialect(SMT_COLLECTION.name, lambda: SMT_COLLECTION)
+    ctx.register_dialect(Transfer.name, lambda: Transfer)
+    ctx.register_dialect(Hoare.name, lambda: Hoare)
+    ctx.register_dialect(PDL.name, lambda: NEW_PDL)
+    ctx.register_dialect(Comb.name, lambda: Comb)
+    ctx.register_dialect(HW.name, lambda: HW)
+    ctx.register_dialect(LLVM.name, lambda: LLVM)
+
+
+def load_verification_semantics() -> None:
+    """Load the semantics used to encode the patterns in SMT."""
+    load_vanilla_semantics()
+    PDLToSMT.pdl_lowerer.native_rewrites = integer_arith_native_rewrites
+    PDLToSMT.pdl_lowerer.native_constraints = integer_arith_native_constraints
+    PDLToSMT.pdl_lowerer.native_static_constraints = (
+        integer_arith_native_static_constraints
+    )
+
+
+# State shared with the worker processes. It is set in the main process by
+# `_set_state`, and in each worker process by the pool initializer.
+_ctx: Context
+_patterns: list[PatternOp]
+_opt: bool
+_first_unsound: "SynchronizedArray[int]"
+
+
+def _set_state(
+    ctx: Context,
+    patterns: list[PatternOp],
+    opt: bool,
+    first_unsound: "SynchronizedArray[int]",
+) -> None:
+    global _ctx, _patterns, _opt, _first_unsound
+    _ctx = ctx
+    _patterns = patterns
+    _opt = opt
+    _first_unsound = first_unsound
+
+
+def _collect_patterns(module: ModuleOp) -> list[PatternOp]:
+    return [op for op in module.walk() if isinstance(op, PatternOp)]
+
+
+def _init_worker(
+    source: str,
+    allow_unregistered: bool,
+    opt: bool,
+    first_unsound: "SynchronizedArray[int]",
+) -> None:
+    """
+    Initialize a worker process with the state of the main process. Neither the
+    context nor the IR can be pickled, so the worker builds its own context and
+    parses the module again from its generic format.
+    """
+    load_verification_semantics()
+    ctx = Context(allow_unregistered=allow_unregistered)
+    register_verification_dialects(ctx)
+    module = Parser(ctx, source).parse_module()
+    _set_state(ctx, _collect_patterns(module), opt, first_unsound)
+
+
+def _verify_specialization(
+    task: tuple[int, int, tuple[int, ...]], stop_at_first_unsound: bool
+) -> bool | None:
+    """
+    Verify the `index`-th specialization of a pattern. Returns `None` if the
+    verification is skipped because an earlier specialization is unsound.
+    """
+    pattern_index, index, bitwidths = task
+    if stop_at_first_unsound and _first_unsound[pattern_index] < index:
+        return None
+    specialized = specialize_pattern(_patterns[pattern_index], bitwidths)
+    is_sound = verify_pattern(_ctx, ModuleOp([specialized]), _opt)
+    if not is_sound and stop_at_first_unsound:
+        with _first_unsound.get_lock():
+            if index < _first_unsound[pattern_index]:
+                _first_unsound[pattern_index] = index
+    return is_sound
+
+
+def _verify_all(
+    module: ModuleOp,
+    tasks: list[tuple[int, int, tuple[int, ...]]],
+    stop_at_first_unsound: bool,
+    jobs: int,
+) -> Iterator[bool | None]:
+    """
+    Verify the specializations of the patterns of `module` in a pool of `jobs`
+    processes, in order. The state of the main process must already be set.
+    """
+    verify = partial(
+        _verify_specialization, stop_at_first_unsound=stop_at_first_unsound
+    )
+    if jobs == 1:
+        yield from map(verify, tasks)
+        return
+    source = StringIO()
+    Printer(source, print_generic_format=True).print_op(module)
+    with Pool(
+        processes=jobs,
+        initializer=_init_worker,
+        initargs=(source.getvalue(), _ctx.allow_unregistered, _opt, _first_unsound),
+    ) as p:
+        yield from p.imap(verify, tasks)
 
 
 class OptMain(xDSLOptMain):
@@ -132,39 +459,38 @@ class OptMain(xDSLOptMain):
             action="store_true",
             help="Optimize the SMT query before sending it to Z3",
         )
+        arg_parser.add_argument(
+            "-j",
+            type=int,
+            default=1,
+            dest="jobs",
+            help="number of processes used to verify patterns concurrently",
+        )
+        arg_parser.add_argument(
+            "-stop-at-first-unsound",
+            default=False,
+            action="store_true",
+            help="Stop verifying a pattern once a specialization is unsound",
+        )
+        arg_parser.add_argument(
+            "-parametric-width",
+            default=False,
+            action="store_true",
+            help="First try to verify each pattern for all bitwidths at once, "
+            "using integers of symbolic width",
+        )
+        arg_parser.add_argument(
+            "-parametric-timeout",
+            type=int,
+            default=10000,
+            help="timeout in milliseconds of the query verifying a pattern for all "
+            "bitwidths, after which its bitwidths are verified one by one",
+        )
 
         super().register_all_arguments(arg_parser)
 
     def register_all_dialects(self):
-        NEW_PDL = Dialect(
-            "pdl",
-            [*PDL.operations, *PDLDataflowDialect.operations],
-            [*PDL.attributes, *PDLDataflowDialect.attributes],
-        )
-        SMT_COLLECTION = Dialect(
-            "smt",
-            [
-                *SMTDialect.operations,
-                *SMTBitVectorDialect.operations,
-                *SMTUtilsDialect.operations,
-            ],
-            [
-                *SMTDialect.attributes,
-                *SMTBitVectorDialect.attributes,
-                *SMTUtilsDialect.attributes,
-            ],
-        )
-        self.ctx.register_dialect(Arith.name, lambda: Arith)
-        self.ctx.register_dialect(Builtin.name, lambda: Builtin)
-        self.ctx.register_dialect(Func.name, lambda: Func)
-        self.ctx.register_dialect(Index.name, lambda: Index)
-        self.ctx.register_dialect(SMT_COLLECTION.name, lambda: SMT_COLLECTION)
-        self.ctx.register_dialect(Transfer.name, lambda: Transfer)
-        self.ctx.register_dialect(Hoare.name, lambda: Hoare)
-        self.ctx.register_dialect(PDL.name, lambda: NEW_PDL)
-        self.ctx.register_dialect(Comb.name, lambda: Comb)
-        self.ctx.register_dialect(HW.name, lambda: HW)
-        self.ctx.register_dialect(LLVM.name, lambda: LLVM)
+        register_verification_dialects(self.ctx)
 
     def run(self):
         """Executes the different steps."""
@@ -179,24 +505,61 @@ class OptMain(xDSLOptMain):
         finally:
             chunk.close()
 
-        is_one_unsound = False
+        patterns = _collect_patterns(module)
+        first_unsound = multiprocessing.Array("q", [sys.maxsize] * len(patterns))
+        _set_state(self.ctx, patterns, self.args.opt, first_unsound)
 
-        for pattern in module.walk():
-            if isinstance(pattern, PatternOp):
-                if pattern.sym_name:
-                    print(f"Verifying pattern {pattern.sym_name.data}:")
+        # Patterns proven sound for all bitwidths at once are not specialized.
+        proven_patterns = {
+            pattern_index
+            for pattern_index, pattern in enumerate(patterns)
+            if self.args.parametric_width
+            and supports_parametric_verification(pattern)
+            and verify_pattern_parametric(
+                self.ctx,
+                pattern,
+                self.args.max_bitwidth,
+                self.args.parametric_timeout,
+            )
+        }
+
+        tasks = [
+            (pattern_index, index, bitwidths)
+            for pattern_index, pattern in enumerate(patterns)
+            if pattern_index not in proven_patterns
+            for index, bitwidths in enumerate(
+                integer_bitwidths(pattern, self.args.max_bitwidth)
+            )
+        ]
+        results = zip(
+            tasks,
+            _verify_all(module, tasks, self.args.stop_at_first_unsound, self.args.jobs),
+        )
+
+        # Results are printed in order, regardless of the completion order.
+        is_one_unsound = False
+        for pattern_index, pattern in enumerate(patterns):
+            if pattern.sym_name:
+                print(f"Verifying pattern {pattern.sym_name.data}:")
+            else:
+                print(f"Verifying pattern:")
+            if pattern_index in proven_patterns:
+                print(f"with all bitwidths up to {self.args.max_bitwidth}: SOUND")
+                continue
+            # Once a pattern is unsound, its remaining results are skipped.
+            is_pattern_unsound = False
+            for (_, _, bitwidths), is_sound in itertools.islice(
+                results, sum(1 for task in tasks if task[0] == pattern_index)
+            ):
+                if is_pattern_unsound and self.args.stop_at_first_unsound:
+                    continue
+                assert is_sound is not None
+                if is_sound:
+                    print(f"with types {bitwidths}: SOUND")
                 else:
-                    print(f"Verifying pattern:")
-                for specialized_pattern, types in iterate_on_all_integers(
-                    pattern, self.args.max_bitwidth
-                ):
-                    if verify_pattern(
-                        self.ctx, ModuleOp([specialized_pattern]), self.args.opt
-                    ):
-                        print(f"with types {types}: SOUND")
-                    else:
-                        print(f"with types {types}: UNSOUND")
-                        is_one_unsound = True
+                    print(f"with types {bitwidths}: UNSOUND")
+                    is_one_unsound = True
+                    is_pattern_unsound = True
 
         if is_one_unsound:
             print("At least one pattern is unsound")
@@ -205,12 +568,7 @@ class OptMain(xDSLOptMain):
 
 
 def main() -> None:
-    load_vanilla_semantics()
-    PDLToSMT.pdl_lowerer.native_rewrites = integer_arith_native_rewrites
-    PDLToSMT.pdl_lowerer.native_constraints = integer_arith_native_constraints
-    PDLToSMT.pdl_lowerer.native_static_constraints = (
-        integer_arith_native_static_constraints
-    )
+    load_verification_semantics()
     OptMain().run()
 
 
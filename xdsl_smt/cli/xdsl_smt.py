@@ -141,6 +141,9 @@ class OptMain(xDSLOptMain):
     def register_all_targets(self):
         super().register_all_targets()
         self.available_targets["smt"] = print_to_smtlib
+        self.available_targets["smt-shared"] = lambda module, stream: print_to_smtlib(
+            module, stream, hoist_shared=True
+        )
 
     def register_all_arguments(self, arg_parser: argparse.ArgumentParser):
         super().register_all_arguments(arg_parser)
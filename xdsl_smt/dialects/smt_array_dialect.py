@@ -57,11 +57,11 @@ class ArrayType(
         )
 
     def print_sort_to_smtlib(self, stream: IO[str]):
-        print("(Array ", file=stream, end="")
+        stream.write("(Array ")
         SMTConversionCtx.print_sort_to_smtlib(self.domain, stream)
-        print(" ", file=stream, end="")
+        stream.write(" ")
         SMTConversionCtx.print_sort_to_smtlib(self.range, stream)
-        print(")", file=stream)
+        stream.write(")\n")
 
     def __init__(self, domain: DomainT, range: RangeT):
         super().__init__(domain, range)
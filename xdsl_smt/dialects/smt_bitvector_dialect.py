@@ -86,11 +86,7 @@ class ConstantOp(IRDLOperation, Pure, SMTLibOp):
         )
 
     def print_expr_to_smtlib(self, stream: IO[str], ctx: SMTConversionCtx) -> None:
-        print(
-            f"(_ bv{self.value.value.data} {self.value.type.width.data})",
-            file=stream,
-            end="",
-        )
+        stream.write(f"(_ bv{self.value.value.data} {self.value.type.width.data})")
 
 
 _UOpT = TypeVar("_UOpT", bound="UnaryBVOp")
@@ -804,9 +800,9 @@ class ExtractOp(IRDLOperation, SMTLibOp):
 
     def print_expr_to_smtlib(self, stream: IO[str], ctx: SMTConversionCtx) -> None:
         """Print the operation to an SMTLib representation."""
-        print(f"((_ extract {self.end.data} {self.start.data}) ", file=stream, end="")
+        stream.write(f"((_ extract {self.end.data} {self.start.data}) ")
         ctx.print_expr_to_smtlib(self.operand, stream)
-        print(")", file=stream, end="")
+        stream.write(")")
 
 
 @irdl_op_definition
@@ -829,9 +825,9 @@ class RepeatOp(IRDLOperation, SMTLibOp):
 
     def print_expr_to_smtlib(self, stream: IO[str], ctx: SMTConversionCtx) -> None:
         """Print the operation to an SMTLib representation."""
-        print(f"((_ repeat {self.count.data}) ", file=stream, end="")
+        stream.write(f"((_ repeat {self.count.data}) ")
         ctx.print_expr_to_smtlib(self.operand, stream)
-        print(")", file=stream, end="")
+        stream.write(")")
 
 
 @irdl_op_definition
@@ -854,13 +850,11 @@ class ZeroExtendOp(IRDLOperation, SMTLibOp):
         """Print the operation to an SMTLib representation."""
         assert isinstance(self.res.type, BitVectorType)
         assert isinstance(self.operand.type, BitVectorType)
-        print(
-            f"((_ zero_extend {self.res.type.width.data - self.operand.type.width.data}) ",
-            file=stream,
-            end="",
+        stream.write(
+            f"((_ zero_extend {self.res.type.width.data - self.operand.type.width.data}) "
         )
         ctx.print_expr_to_smtlib(self.operand, stream)
-        print(")", file=stream, end="")
+        stream.write(")")
 
 
 @irdl_op_definition
@@ -883,13 +877,11 @@ class SignExtendOp(IRDLOperation, SMTLibOp):
         """Print the operation to an SMTLib representation."""
         assert isinstance(self.res.type, BitVectorType)
         assert isinstance(self.operand.type, BitVectorType)
-        print(
-            f"((_ sign_extend {self.res.type.width.data - self.operand.type.width.data}) ",
-            file=stream,
-            end="",
+        stream.write(
+            f"((_ sign_extend {self.res.type.width.data - self.operand.type.width.data}) "
         )
         ctx.print_expr_to_smtlib(self.operand, stream)
-        print(")", file=stream, end="")
+        stream.write(")")
 
 
 SMTBitVectorDialect = Dialect(
@@ -75,17 +75,17 @@ class QuantifierSMTLibOpTrait(SMTLibOpTrait):
         self, op: Operation, stream: IO[str], ctx: SMTConversionCtx
     ) -> None:
         assert isinstance(op, ForallOp) or isinstance(op, ExistsOp)
-        print(f"({self.name} (", file=stream, end="")
+        stream.write(f"({self.name} (")
         for idx, param in enumerate(op.body.block.args):
             param_name = ctx.get_fresh_name(param)
             if idx != 0:
-                print(" ", file=stream, end="")
-            print(f"({param_name} ", file=stream, end="")
+                stream.write(" ")
+            stream.write(f"({param_name} ")
             ctx.print_sort_to_smtlib(param.type, stream)
-            print(")", file=stream, end="")
-        print(") ", file=stream, end="")
+            stream.write(")")
+        stream.write(") ")
         ctx.print_expr_to_smtlib(op.returned_value, stream)
-        print(")", file=stream, end="")
+        stream.write(")")
 
 
 ForallOp_traits = ForallOp.traits
@@ -144,12 +144,12 @@ class CallOp(IRDLOperation, Pure, SMTLibOp):
             ctx.print_expr_to_smtlib(self.func, stream)
             return
 
-        print("(", file=stream, end="")
+        stream.write("(")
         for idx, operand in enumerate(self.operands):
             if idx != 0:
-                print(" ", file=stream, end="")
+                stream.write(" ")
             ctx.print_expr_to_smtlib(operand, stream)
-        print(")", file=stream, end="")
+        stream.write(")")
 
 
 ################################################################################
@@ -191,7 +191,7 @@ class DeclareFunOp(IRDLOperation, SMTLibScriptOp):
         return self.ret.type
 
     def print_expr_to_smtlib(self, stream: IO[str], ctx: SMTConversionCtx):
-        print("(declare-fun ", file=stream, end="")
+        stream.write("(declare-fun ")
 
         # Print the function name
         name: str
@@ -200,21 +200,21 @@ class DeclareFunOp(IRDLOperation, SMTLibScriptOp):
             ctx.value_to_name[self.ret] = name
         else:
             name = ctx.get_fresh_name(self.ret)
-        print(f"{name} ", file=stream, end="")
+        stream.write(f"{name} ")
 
         # Print the function arguments
-        print("(", file=stream, end="")
+        stream.write("(")
         for idx, typ in enumerate(self.func_type.inputs):
             if idx != 0:
-                print(" ", file=stream, end="")
+                stream.write(" ")
             ctx.print_sort_to_smtlib(typ, stream)
-        print(") ", file=stream, end="")
+        stream.write(") ")
 
         # Print the function return type
         assert len(self.func_type.outputs.data) == 1
         ret_type = self.func_type.outputs.data[0]
         ctx.print_sort_to_smtlib(ret_type, stream)
-        print(")", file=stream)
+        stream.write(")\n")
 
 
 @irdl_op_definition
@@ -304,7 +304,7 @@ class DefineFunOp(IRDLOperation, SMTLibScriptOp):
             )
 
     def print_expr_to_smtlib(self, stream: IO[str], ctx: SMTConversionCtx):
-        print("(define-fun ", file=stream, end="")
+        stream.write("(define-fun ")
 
         # Print the function name
         name: str
@@ -313,34 +313,34 @@ class DefineFunOp(IRDLOperation, SMTLibScriptOp):
             ctx.value_to_name[self.ret] = name
         else:
             name = ctx.get_fresh_name(self.ret)
-        print(f"{name} ", file=stream, end="")
+        stream.write(f"{name} ")
 
         # Print the function arguments
-        print("(", file=stream, end="")
+        stream.write("(")
         for idx, arg in enumerate(self.body.blocks[0].args):
             if idx != 0:
-                print(" ", file=stream, end="")
+                stream.write(" ")
             arg_name = ctx.get_fresh_name(arg)
             typ = arg.type
-            print(f"({arg_name} ", file=stream, end="")
+            stream.write(f"({arg_name} ")
             ctx.print_sort_to_smtlib(typ, stream)
-            print(")", file=stream, end="")
-        print(") ", file=stream, end="")
+            stream.write(")")
+        stream.write(") ")
 
         # Print the function return type
         assert len(self.func_type.outputs.data) == 1
         ret_type = self.func_type.outputs.data[0]
         ctx.print_sort_to_smtlib(ret_type, stream)
-        print("", file=stream)
+        stream.write("\n")
 
         # Print the function body
-        print("  ", file=stream, end="")
+        stream.write("  ")
         if len(self.return_values) != 1:
             raise Exception(
                 "Functions with multiple return values cannot be converted to SMT-LIB"
             )
         ctx.print_expr_to_smtlib(self.return_values[0], stream, identation="  ")
-        print(")", file=stream)
+        stream.write(")\n")
 
 
 @irdl_op_definition
@@ -377,9 +377,9 @@ class DeclareConstOp(IRDLOperation, SMTLibScriptOp):
     def print_expr_to_smtlib(self, stream: IO[str], ctx: SMTConversionCtx):
         name = ctx.get_fresh_name(self.res)
         typ = self.res.type
-        print(f"(declare-const {name} ", file=stream, end="")
+        stream.write(f"(declare-const {name} ")
         ctx.print_sort_to_smtlib(typ, stream)
-        print(")", file=stream)
+        stream.write(")\n")
 
 
 @irdl_op_definition
@@ -393,9 +393,9 @@ class AssertOp(IRDLOperation, SMTLibScriptOp):
         super().__init__(operands=[operand])
 
     def print_expr_to_smtlib(self, stream: IO[str], ctx: SMTConversionCtx):
-        print("(assert ", file=stream, end="")
+        stream.write("(assert ")
         ctx.print_expr_to_smtlib(self.op, stream, identation="  ")
-        print(")", file=stream)
+        stream.write(")\n")
 
     @staticmethod
     def get(arg: Operation | SSAValue) -> AssertOp:
@@ -409,7 +409,7 @@ class CheckSatOp(IRDLOperation, SMTLibScriptOp):
     name = "smt.check_sat"
 
     def print_expr_to_smtlib(self, stream: IO[str], ctx: SMTConversionCtx):
-        print("(check-sat)", file=stream)
+        stream.write("(check-sat)\n")
 
 
 # Core operations
@@ -457,9 +457,9 @@ class ConstantBoolOpPrinter(SMTLibOpTrait):
     ) -> None:
         assert isinstance(op, ConstantBoolOp)
         if op.value:
-            print("true", file=stream, end="")
+            stream.write("true")
         else:
-            print("false", file=stream, end="")
+            stream.write("false")
 
 
 ConstantBoolOp.traits.add_trait(ConstantBoolOpPrinter())
@@ -638,9 +638,9 @@ class EvalOp(IRDLOperation, SMTLibScriptOp):
         super().__init__(operands=[operand])
 
     def print_expr_to_smtlib(self, stream: IO[str], ctx: SMTConversionCtx):
-        print("(eval ", file=stream, end="")
+        stream.write("(eval ")
         ctx.print_expr_to_smtlib(self.expr, stream, identation="  ")
-        print(")", file=stream)
+        stream.write(")\n")
 
     @staticmethod
     def get(arg: Operation | SSAValue) -> EvalOp:
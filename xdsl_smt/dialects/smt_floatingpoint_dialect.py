@@ -57,7 +57,7 @@ class RoundingModeType(ParametrizedAttribute, SMTLibSort, TypeAttribute):
         super().__init__()
 
     def print_sort_to_smtlib(self, stream: IO[str]) -> None:
-        print(f"RoundingMode", file=stream, end="")
+        stream.write("RoundingMode")
 
 
 class RunningModeConstantOp(IRDLOperation, Pure, SMTLibOp):
@@ -77,7 +77,7 @@ class RunningModeConstantOp(IRDLOperation, Pure, SMTLibOp):
         super().__init__(result_types=[RoundingModeType()])
 
     def print_expr_to_smtlib(self, stream: IO[str], ctx: SMTConversionCtx) -> None:
-        print(f"{self.constant_name()}", file=stream, end="")
+        stream.write(self.constant_name())
 
     @abstractmethod
     def constant_name(self) -> str:
@@ -209,7 +209,7 @@ class FloatingPointType(ParametrizedAttribute, SMTLibSort, TypeAttribute):
         printer.print_string(f"<{self.eb.data}, {self.sb.data}>")
 
     def print_sort_to_smtlib(self, stream: IO[str]) -> None:
-        print(f"(_ FloatingPoint {self.eb.data} {self.sb.data})", file=stream, end="")
+        stream.write(f"(_ FloatingPoint {self.eb.data} {self.sb.data})")
 
 
 """
@@ -276,8 +276,8 @@ class SpecialConstantOp(IRDLOperation, Pure, SMTLibOp):
     def print_expr_to_smtlib(self, stream: IO[str], ctx: SMTConversionCtx) -> None:
         assert isinstance(self, Operation)
         assert isinstance(self.res.type, FloatingPointType)
-        print(f"(_ {self.constant_name()}", file=stream, end="")
-        print(f" {self.res.type.eb.data} {self.res.type.sb.data})", file=stream, end="")
+        stream.write(f"(_ {self.constant_name()}")
+        stream.write(f" {self.res.type.eb.data} {self.res.type.sb.data})")
 
     @abstractmethod
     def constant_name(self) -> str:
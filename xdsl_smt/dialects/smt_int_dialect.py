@@ -40,7 +40,7 @@ class SMTIntType(ParametrizedAttribute, SMTLibSort, TypeAttribute):
     name = "smt.int.int"
 
     def print_sort_to_smtlib(self, stream: IO[str]) -> None:
-        print("Int", file=stream, end="")
+        stream.write("Int")
 
 
 _BOpT = TypeVar("_BOpT", bound="BinaryIntOp")
@@ -102,7 +102,7 @@ class ConstantOp(IRDLOperation, Pure, SMTLibOp):
         )
 
     def print_expr_to_smtlib(self, stream: IO[str], ctx: SMTConversionCtx):
-        print(self.value.value.data, file=stream, end="")
+        stream.write(str(self.value.value.data))
 
 
 @irdl_op_definition
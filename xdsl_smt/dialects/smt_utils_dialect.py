@@ -49,11 +49,11 @@ class PairType(Generic[_F, _S], ParametrizedAttribute, SMTLibSort, TypeAttribute
         super().__init__(first, second)
 
     def print_sort_to_smtlib(self, stream: IO[str]) -> None:
-        print("(Pair ", file=stream, end="")
+        stream.write("(Pair ")
         SMTConversionCtx.print_sort_to_smtlib(self.first, stream)
-        print(" ", file=stream, end="")
+        stream.write(" ")
         SMTConversionCtx.print_sort_to_smtlib(self.second, stream)
-        print(")", file=stream, end="")
+        stream.write(")")
 
 
 AnyPairType: TypeAlias = PairType[Attribute, Attribute]
@@ -364,5 +364,5 @@ transfer_to_smt_patterns: dict[type[Operation], SMTLoweringRewritePattern] = {
     transfer.SMaxOp: SMaxOpPattern(),
     transfer.UMaxOp: UMaxOpPattern(),
     transfer.UMinOp: UMinOpPattern(),
-    CallOp: CallOpPattern(),
+    func.CallOp: CallOpPattern(),
 }
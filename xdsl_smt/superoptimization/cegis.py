@@ -0,0 +1,182 @@
+"""
+Counterexample-guided inductive synthesis (CEGIS) of the constants of an SMT
+query of the form `exists csts. forall args. P(csts, args)`.
+
+Instead of asking the solver for a model of the quantified query directly,
+CEGIS alternates between two quantifier-free queries:
+* a synthesis query, finding constants such that `P(csts, args)` holds for
+  a finite set of inputs `args`,
+* a verification query, checking whether some input falsifies `P` for the
+  synthesized constants. Such an input is added to the set of inputs, and
+  the synthesis query is solved again.
+The counterexamples can be shared between queries through `ConcreteInputs`, in
+which case they seed the synthesis query of the next ones.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any
+
+import z3  # pyright: ignore[reportMissingTypeStubs]
+
+from xdsl.dialects.builtin import IntAttr, ModuleOp
+from xdsl.ir import Attribute
+
+from xdsl_smt.dialects.smt_bitvector_dialect import BitVectorType
+from xdsl_smt.dialects.smt_dialect import AssertOp, BoolType, DeclareConstOp, ForallOp
+from xdsl_smt.superoptimization.concrete_inputs import (
+    ConcreteInputs,
+    Point,
+    flatten_forall,
+)
+from xdsl_smt.utils.dialect_to_z3 import Z3Translator
+
+Z3Expr = Any
+
+
+@dataclass
+class _UniversalConstraint:
+    """A constraint `forall bound. body`, with the bound variables as constants."""
+
+    bound: list[Z3Expr]
+    body: Z3Expr
+    types: tuple[Attribute, ...]
+    """The types of the bound variables."""
+
+    def instantiate(self, values: list[Z3Expr]) -> Z3Expr:
+        return z3.substitute(self.body, *zip(self.bound, values))  # pyright: ignore
+
+    def instantiate_point(self, point: Point) -> Z3Expr:
+        """
+        Instantiate the constraint with concrete values. Variables whose values
+        are unknown, such as arrays, are left free, which still gives a
+        consequence of the constraint.
+        """
+        substitution = list[tuple[Z3Expr, Z3Expr]]()
+        for var, ty, value in zip(self.bound, self.types, point):
+            match ty:
+                case BoolType() if value is not None:
+                    bool_value = z3.BoolVal(value, var.ctx)  # pyright: ignore
+                    substitution.append((var, bool_value))
+                case BitVectorType(width=IntAttr(data=width)) if value is not None:
+                    bv_value = z3.BitVecVal(value, width, var.ctx)  # pyright: ignore
+                    substitution.append((var, bv_value))
+                case _:
+                    pass
+        return z3.substitute(self.body, *substitution)  # pyright: ignore
+
+
+def _to_python(value: Z3Expr) -> Any:
+    """Convert a z3 value to the value used by the compiled evaluator."""
+    if z3.is_bv_value(value):  # pyright: ignore[reportUnknownMemberType]
+        return value.as_long()
+    if z3.is_true(value):
+        return True
+    if z3.is_false(value):
+        return False
+    return None
+
+
+def check_with_cegis(
+    module: ModuleOp,
+    timeout: int = 1000,
+    max_iterations: int = 64,
+    inputs: ConcreteInputs | None = None,
+    max_seeds: int = 16,
+) -> tuple[Any, Any | None]:
+    """
+    Check the satisfiability of an SMT program with CEGIS. The top-level
+    constants of the program are synthesized, and the top-level assertions of
+    `smt.forall` are checked with counterexamples. Other assertions are passed
+    to the synthesis query as is.
+    Returns the result, and a model assigning all top-level constants if the
+    program is satisfiable. The result is `unknown` if a query is `unknown`,
+    or if no solution is found after `max_iterations` counterexamples.
+    If `inputs` is given, the synthesis query is seeded with the last
+    `max_seeds` counterexamples it contains, and the counterexamples found are
+    added to it.
+    Raises `Z3TranslationError` if the program cannot be translated to z3.
+    """
+    ctx = z3.Context()
+    translator = Z3Translator(ctx)
+    constants = list[Z3Expr]()
+    universals = list[_UniversalConstraint]()
+
+    synthesizer = z3.Solver(ctx=ctx)
+    synthesizer.set("timeout", timeout)  # pyright: ignore[reportUnknownMemberType]
+    verifier = z3.Solver(ctx=ctx)
+    verifier.set("timeout", timeout)  # pyright: ignore[reportUnknownMemberType]
+
+    for op in module.ops:
+        if isinstance(op, AssertOp) and isinstance(op.op.owner, ForallOp):
+            # Nested quantifiers are merged, so that verification queries are
+            # quantifier-free.
+            args, returned_value = flatten_forall(op.op.owner)
+            bound = [translator.declare(arg) for arg in args]
+            body = translator.translate(returned_value)
+            types = tuple(arg.type for arg in args)
+            universals.append(_UniversalConstraint(bound, body, types))
+            continue
+        assertion = translator.translate_script_op(op)
+        if isinstance(op, DeclareConstOp):
+            constants.append(translator.values[op.res])
+        if assertion is not None:
+            synthesizer.add(assertion)  # pyright: ignore[reportUnknownMemberType]
+
+    if inputs is not None:
+        for universal in universals:
+            for point in inputs.counterexamples(universal.types)[-max_seeds:]:
+                synthesizer.add(  # pyright: ignore[reportUnknownMemberType]
+                    universal.instantiate_point(point)
+                )
+
+    for _ in range(max_iterations):
+        result = synthesizer.check()  # pyright: ignore[reportUnknownMemberType]
+        if result != z3.sat:
+            return result, None
+        model = synthesizer.model()  # pyright: ignore[reportUnknownMemberType]
+        values = [
+            model.eval(cst, model_completion=True)  # pyright: ignore
+            for cst in constants
+        ]
+        substitution = list(zip(constants, values))
+
+        # Look for an input falsifying one of the universal constraints.
+        has_counterexample = False
+        for universal in universals:
+            verifier.push()
+            body = z3.substitute(universal.body, *substitution)  # pyright: ignore
+            verifier.add(z3.Not(body))  # pyright: ignore[reportUnknownMemberType]
+            result = verifier.check()  # pyright: ignore[reportUnknownMemberType]
+            if result == z3.sat:
+                verifier_model = verifier.model()  # pyright: ignore
+                counterexample = [
+                    verifier_model.eval(var, model_completion=True)  # pyright: ignore
+                    for var in universal.bound
+                ]
+                synthesizer.add(  # pyright: ignore[reportUnknownMemberType]
+                    universal.instantiate(counterexample)
+                )
+                if inputs is not None:
+                    inputs.add_counterexample(
+                        universal.types, tuple(map(_to_python, counterexample))
+                    )
+                has_counterexample = True
+            verifier.pop()
+            if result == z3.unknown:
+                return result, None
+            if has_counterexample:
+                break
+
+        if not has_counterexample:
+            # Return a model that assigns all constants, including the ones
+            # that are left unconstrained.
+            solution = z3.Solver(ctx=ctx)
+            solution.add(  # pyright: ignore[reportUnknownMemberType]
+                *(cst == value for cst, value in zip(constants, values))
+            )
+            solution.check()  # pyright: ignore[reportUnknownMemberType]
+            return z3.sat, solution.model()  # pyright: ignore
+
+    return z3.unknown, None
@@ -0,0 +1,406 @@
+"""
+This file defines a compiled evaluator for functions written in the `smt`,
+`smt.bv`, and `smt.utils` dialects.
+
+Instead of walking the IR once per input like the xDSL interpreter does, a
+function is compiled once into straight-line Python code operating on plain
+integers, tuples and booleans. The generated code then evaluates a whole batch
+of inputs in a single call, and only boxes the final results into the values
+returned by `xdsl_smt.cli.xdsl_smt_run.interpret`.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Callable, Iterable, Sequence, cast
+
+from xdsl.ir import Attribute, Block, Operation, SSAValue
+from xdsl.dialects.builtin import ArrayAttr, IntAttr, IntegerAttr
+from xdsl.dialects.func import FuncOp, ReturnOp
+
+from xdsl_smt.dialects import (
+    smt_dialect as smt,
+    smt_bitvector_dialect as bv,
+    smt_utils_dialect as pair,
+)
+
+
+class UnsupportedOperationError(Exception):
+    """
+    Exception raised when a function contains an operation or a type that the
+    compiled evaluator does not support. Callers are expected to fall back to
+    the xDSL interpreter in that case.
+    """
+
+    pass
+
+
+def _to_signed(value: int, width: int) -> int:
+    if value >> (width - 1):
+        return value - (1 << width)
+    return value
+
+
+def _udiv(lhs: int, rhs: int, width: int) -> int:
+    if rhs == 0:
+        return (1 << width) - 1
+    return lhs // rhs
+
+
+def _urem(lhs: int, rhs: int) -> int:
+    if rhs == 0:
+        return lhs
+    return lhs % rhs
+
+
+def _sdiv(lhs: int, rhs: int, width: int) -> int:
+    slhs = _to_signed(lhs, width)
+    srhs = _to_signed(rhs, width)
+    if srhs == 0:
+        return 1 if slhs < 0 else (1 << width) - 1
+    # SMT-LIB division rounds towards zero.
+    quotient = abs(slhs) // abs(srhs)
+    if (slhs < 0) != (srhs < 0):
+        quotient = -quotient
+    return quotient & ((1 << width) - 1)
+
+
+def _srem(lhs: int, rhs: int, width: int) -> int:
+    slhs = _to_signed(lhs, width)
+    srhs = _to_signed(rhs, width)
+    if srhs == 0:
+        return lhs
+    # The remainder has the sign of the dividend.
+    remainder = abs(slhs) % abs(srhs)
+    if slhs < 0:
+        remainder = -remainder
+    return remainder & ((1 << width) - 1)
+
+
+def _smod(lhs: int, rhs: int, width: int) -> int:
+    srhs = _to_signed(rhs, width)
+    if srhs == 0:
+        return lhs
+    # The remainder has the sign of the divisor, like Python's `%`.
+    return (_to_signed(lhs, width) % srhs) & ((1 << width) - 1)
+
+
+def _ashr(lhs: int, rhs: int, width: int) -> int:
+    return (_to_signed(lhs, width) >> min(rhs, width)) & ((1 << width) - 1)
+
+
+def _signed_in_range(value: int, width: int) -> bool:
+    return -(1 << (width - 1)) <= value < (1 << (width - 1))
+
+
+_HELPERS: dict[str, Callable[..., Any]] = {
+    "_s": _to_signed,
+    "_udiv": _udiv,
+    "_urem": _urem,
+    "_sdiv": _sdiv,
+    "_srem": _srem,
+    "_smod": _smod,
+    "_ashr": _ashr,
+    "_srange": _signed_in_range,
+}
+
+# Expression templates for operations whose results have the same width as
+# their operands. `{0}` and `{1}` are the operands, `{w}` the bitwidth, and `{m}`
+# the mask of the bitwidth.
+_BV_TEMPLATES: dict[type[Operation], str] = {
+    bv.AddOp: "({0} + {1}) & {m}",
+    bv.SubOp: "({0} - {1}) & {m}",
+    bv.MulOp: "({0} * {1}) & {m}",
+    bv.NegOp: "-{0} & {m}",
+    bv.NotOp: "{0} ^ {m}",
+    bv.AndOp: "{0} & {1}",
+    bv.OrOp: "{0} | {1}",
+    bv.XorOp: "{0} ^ {1}",
+    bv.NAndOp: "({0} & {1}) ^ {m}",
+    bv.NorOp: "({0} | {1}) ^ {m}",
+    bv.XNorOp: "({0} ^ {1}) ^ {m}",
+    bv.ShlOp: "0 if {1} >= {w} else ({0} << {1}) & {m}",
+    bv.LShrOp: "0 if {1} >= {w} else {0} >> {1}",
+    bv.AShrOp: "_ashr({0}, {1}, {w})",
+    bv.UDivOp: "_udiv({0}, {1}, {w})",
+    bv.URemOp: "_urem({0}, {1})",
+    bv.SDivOp: "_sdiv({0}, {1}, {w})",
+    bv.SRemOp: "_srem({0}, {1}, {w})",
+    bv.SModOp: "_smod({0}, {1}, {w})",
+}
+
+# Expression templates for predicates over bitvectors, where `{w}` and `{m}`
+# refer to the operands bitwidth.
+_BV_PREDICATE_TEMPLATES: dict[type[Operation], str] = {
+    bv.UltOp: "{0} < {1}",
+    bv.UleOp: "{0} <= {1}",
+    bv.UgtOp: "{0} > {1}",
+    bv.UgeOp: "{0} >= {1}",
+    bv.SltOp: "_s({0}, {w}) < _s({1}, {w})",
+    bv.SleOp: "_s({0}, {w}) <= _s({1}, {w})",
+    bv.SgtOp: "_s({0}, {w}) > _s({1}, {w})",
+    bv.SgeOp: "_s({0}, {w}) >= _s({1}, {w})",
+    bv.NegOverflowOp: "{0} == 1 << ({w} - 1)",
+    bv.UaddOverflowOp: "{0} + {1} > {m}",
+    bv.SaddOverflowOp: "not _srange(_s({0}, {w}) + _s({1}, {w}), {w})",
+    bv.UsubOverflowOp: "{0} < {1}",
+    bv.SsubOverflowOp: "not _srange(_s({0}, {w}) - _s({1}, {w}), {w})",
+    bv.UmulOverflowOp: "{0} * {1} > {m}",
+    bv.SmulOverflowOp: "not _srange(_s({0}, {w}) * _s({1}, {w}), {w})",
+    bv.UmulNoOverflowOp: "{0} * {1} <= {m}",
+    bv.SmulNoOverflowOp: "_s({0}, {w}) * _s({1}, {w}) < 1 << ({w} - 1)",
+    bv.SmulNoUnderflowOp: "_s({0}, {w}) * _s({1}, {w}) >= -(1 << ({w} - 1))",
+}
+
+# Predicates of `smt.bv.cmp`, in the order of their `pred` property.
+_CMP_PREDICATES: tuple[type[Operation], ...] = (
+    bv.SltOp,
+    bv.SleOp,
+    bv.SgtOp,
+    bv.SgeOp,
+    bv.UltOp,
+    bv.UleOp,
+    bv.UgtOp,
+    bv.UgeOp,
+)
+
+
+def _width(ty: Attribute) -> int:
+    if not isinstance(ty, bv.BitVectorType):
+        raise UnsupportedOperationError(f"Expected a bitvector type, got {ty}")
+    return ty.width.data
+
+
+def _unboxer(ty: Attribute) -> Callable[[Attribute], Any]:
+    """
+    Returns a function converting an attribute of the given type, as returned by
+    `values_of_type`, into the Python value used by the compiled code.
+    """
+    match ty:
+        case smt.BoolType():
+            return lambda attr: cast(IntegerAttr, attr).value.data != 0
+        case bv.BitVectorType(width=IntAttr(data=width)):
+            return lambda attr: cast(IntegerAttr, attr).value.data % (1 << width)
+        case pair.PairType():
+            ty = cast(pair.PairType[Attribute, Attribute], ty)
+            first, second = _unboxer(ty.first), _unboxer(ty.second)
+            return lambda attr: (
+                first(cast(ArrayAttr[Attribute], attr).data[0]),
+                second(cast(ArrayAttr[Attribute], attr).data[1]),
+            )
+        case _:
+            raise UnsupportedOperationError(f"Unsupported type: {ty}")
+
+
+def _boxer(ty: Attribute) -> Callable[[Any], Any]:
+    """
+    Returns a function converting a Python value computed by the compiled code
+    into the value the xDSL interpreter would have returned for that type.
+    """
+    match ty:
+        case smt.BoolType():
+            return lambda value: value
+        case bv.BitVectorType(width=IntAttr(data=width)):
+            # Results are shared between evaluation points, so only allocate
+            # one attribute per distinct value.
+            cache: dict[int, bv.BitVectorAttr] = {}
+
+            def box_bv(value: int) -> bv.BitVectorAttr:
+                attr = cache.get(value)
+                if attr is None:
+                    attr = bv.BitVectorAttr(value, width)
+                    cache[value] = attr
+                return attr
+
+            return box_bv
+        case pair.PairType():
+            ty = cast(pair.PairType[Attribute, Attribute], ty)
+            first, second = _boxer(ty.first), _boxer(ty.second)
+            return lambda value: (first(value[0]), second(value[1]))
+        case _:
+            raise UnsupportedOperationError(f"Unsupported type: {ty}")
+
+
+class _CodeGenerator:
+    """Generates the body of the batched evaluation function."""
+
+    names: dict[SSAValue, str]
+    lines: list[str]
+
+    def __init__(self, block: Block):
+        self.names = {arg: f"a{i}" for i, arg in enumerate(block.args)}
+        self.lines = []
+
+    def _name(self, value: SSAValue) -> str:
+        return self.names[value]
+
+    def _emit(self, result: SSAValue, expr: str) -> None:
+        name = f"v{len(self.names)}"
+        self.names[result] = name
+        self.lines.append(f"{name} = {expr}")
+
+    def compile_op(self, op: Operation) -> None:
+        operands = [self._name(operand) for operand in op.operands]
+        match op:
+            case bv.ConstantOp():
+                self._emit(op.res, str(op.value.value.data))
+            case smt.ConstantBoolOp():
+                self._emit(op.result, str(bool(op.value)))
+            case smt.NotOp():
+                self._emit(op.result, f"not {operands[0]}")
+            case smt.AndOp():
+                self._emit(op.result, "(" + " and ".join(operands) + ")")
+            case smt.OrOp():
+                self._emit(op.result, "(" + " or ".join(operands) + ")")
+            case smt.XOrOp():
+                self._emit(op.result, "(" + " ^ ".join(operands) + ")")
+            case smt.ImpliesOp():
+                self._emit(op.result, f"(not {operands[0]} or {operands[1]})")
+            case smt.EqOp():
+                self._emit(op.res, f"{operands[0]} == {operands[1]}")
+            case smt.DistinctOp():
+                self._emit(op.res, f"{operands[0]} != {operands[1]}")
+            case smt.IteOp():
+                self._emit(op.res, f"{operands[1]} if {operands[0]} else {operands[2]}")
+            case pair.PairOp():
+                self._emit(op.res, f"({operands[0]}, {operands[1]})")
+            case pair.FirstOp():
+                self._emit(op.res, f"{operands[0]}[0]")
+            case pair.SecondOp():
+                self._emit(op.res, f"{operands[0]}[1]")
+            case bv.CmpOp():
+                predicate = _CMP_PREDICATES[op.pred.value.data]
+                width = _width(op.lhs.type)
+                template = _BV_PREDICATE_TEMPLATES[predicate]
+                self._emit(
+                    op.res, template.format(*operands, w=width, m=(1 << width) - 1)
+                )
+            case bv.ConcatOp():
+                self._emit(
+                    op.res, f"({operands[0]} << {_width(op.rhs.type)}) | {operands[1]}"
+                )
+            case bv.ExtractOp():
+                mask = (1 << (op.end.data - op.start.data + 1)) - 1
+                self._emit(op.res, f"({operands[0]} >> {op.start.data}) & {mask}")
+            case bv.RepeatOp():
+                width = _width(op.operand.type)
+                repeat = sum(1 << (width * i) for i in range(op.count.data))
+                self._emit(op.res, f"{operands[0]} * {repeat}")
+            case bv.ZeroExtendOp():
+                self._emit(op.res, operands[0])
+            case bv.SignExtendOp():
+                width = _width(op.operand.type)
+                mask = (1 << _width(op.res.type)) - 1
+                self._emit(op.res, f"_s({operands[0]}, {width}) & {mask}")
+            case _ if type(op) in _BV_TEMPLATES:
+                width = _width(op.results[0].type)
+                template = _BV_TEMPLATES[type(op)]
+                self._emit(
+                    op.results[0],
+                    template.format(*operands, w=width, m=(1 << width) - 1),
+                )
+            case _ if type(op) in _BV_PREDICATE_TEMPLATES:
+                width = _width(op.operands[0].type)
+                template = _BV_PREDICATE_TEMPLATES[type(op)]
+                self._emit(
+                    op.results[0],
+                    template.format(*operands, w=width, m=(1 << width) - 1),
+                )
+            case _:
+                raise UnsupportedOperationError(f"Unsupported operation: {op.name}")
+
+
+class CompiledFunction:
+    """
+    A `func.func` or `smt.define_fun` whose body only contains `smt`, `smt.bv`
+    and `smt.utils` operations, compiled into a Python function evaluating a
+    batch of inputs at once.
+    """
+
+    arg_types: tuple[Attribute, ...]
+    """The types of the function arguments."""
+    result_types: tuple[Attribute, ...]
+    """The types of the function results."""
+    source: str
+    """The generated Python source code, kept for debugging purposes."""
+
+    _run: Callable[[Iterable[Sequence[Any]]], list[tuple[Any, ...]]]
+    _unboxers: tuple[Callable[[Attribute], Any], ...]
+    _boxers: tuple[Callable[[Any], Any], ...]
+
+    def __init__(self, func: FuncOp | smt.DefineFunOp):
+        if isinstance(func, FuncOp):
+            self.arg_types = func.function_type.inputs.data
+            self.result_types = func.function_type.outputs.data
+        else:
+            self.arg_types = func.func_type.inputs.data
+            self.result_types = func.func_type.outputs.data
+        if len(func.body.blocks) != 1:
+            raise UnsupportedOperationError("Expected a single-block function")
+        block = func.body.block
+
+        generator = _CodeGenerator(block)
+        returned: list[str] | None = None
+        for op in block.ops:
+            if isinstance(op, ReturnOp | smt.ReturnOp):
+                returned = [generator.names[operand] for operand in op.operands]
+                break
+            generator.compile_op(op)
+        if returned is None:
+            raise UnsupportedOperationError("Expected a returning function")
+
+        args = "".join(f"a{i}, " for i in range(len(block.args)))
+        results = "".join(f"{name}, " for name in returned)
+        body = "".join(f"        {line}\n" for line in generator.lines)
+        self.source = (
+            "def _run(points):\n"
+            "    results = []\n"
+            "    append = results.append\n"
+            f"    for ({args}) in points:\n"
+            f"{body}"
+            f"        append(({results}))\n"
+            "    return results\n"
+        )
+        namespace: dict[str, Any] = dict(_HELPERS)
+        exec(compile(self.source, f"<compiled {func.name}>", "exec"), namespace)
+        self._run = namespace["_run"]
+
+        self._unboxers = tuple(_unboxer(ty) for ty in self.arg_types)
+        self._boxers = tuple(_boxer(ty) for ty in self.result_types)
+
+    def evaluate_values(self, points: Iterable[Sequence[Any]]) -> list[tuple[Any, ...]]:
+        """
+        Evaluate the function on a batch of inputs given as Python values,
+        returning the results as Python values (integers for bitvectors, booleans,
+        and tuples for pairs).
+        """
+        return self._run(points)
+
+    def evaluate(
+        self, points: Iterable[Sequence[Attribute]]
+    ) -> tuple[tuple[Any, ...], ...]:
+        """
+        Evaluate the function on a batch of inputs given as attributes.
+        Results are returned in the same format as
+        `xdsl_smt.cli.xdsl_smt_run.interpret`.
+        """
+        unboxers = self._unboxers
+        boxers = self._boxers
+        raw_results = self._run(
+            tuple(unbox(attr) for unbox, attr in zip(unboxers, point, strict=True))
+            for point in points
+        )
+        return tuple(
+            tuple(box(value) for box, value in zip(boxers, result))
+            for result in raw_results
+        )
+
+
+def compile_function(func: FuncOp | smt.DefineFunOp) -> CompiledFunction | None:
+    """
+    Compile a function for batched evaluation, or return `None` if the function
+    contains unsupported operations.
+    """
+    try:
+        return CompiledFunction(func)
+    except UnsupportedOperationError:
+        return None
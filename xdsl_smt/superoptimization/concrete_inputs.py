@@ -0,0 +1,308 @@
+"""
+Concrete evaluation of the universal constraints of superoptimization queries.
+
+A candidate without constants to synthesize is correct if its query
+`forall args. P(args)` holds. Before asking the solver, `P` is compiled with
+the compiled evaluator and evaluated on a set of concrete inputs: corner values
+of the bound variable types, and the counterexamples found while checking
+previous candidates. A single input falsifying `P` rejects the candidate.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from itertools import islice, product
+from typing import Any, Iterator, Sequence, cast
+
+from xdsl.dialects.builtin import IntAttr, ModuleOp
+from xdsl.ir import (
+    Attribute,
+    Block,
+    BlockArgument,
+    Operation,
+    OpResult,
+    Region,
+    SSAValue,
+)
+
+from xdsl_smt.dialects import (
+    smt_dialect as smt,
+    smt_bitvector_dialect as bv,
+    smt_utils_dialect as pair,
+)
+from xdsl_smt.superoptimization.compiled_evaluator import (
+    CompiledFunction,
+    compile_function,
+)
+
+Point = tuple[Any, ...]
+"""
+Concrete values of the bound variables of a universal constraint, as used by
+the compiled evaluator. Values of unsupported types, such as arrays, are None.
+"""
+
+
+def flatten_forall(forall: smt.ForallOp) -> tuple[list[BlockArgument], SSAValue]:
+    """
+    Get the bound variables and the body of `forall xs. forall ys. ... P`, seen
+    as a single constraint `forall xs, ys, .... P`.
+    """
+    bound = list(forall.body.block.args)
+    body = forall.returned_value
+    while isinstance(body.owner, smt.ForallOp):
+        bound.extend(body.owner.body.block.args)
+        body = body.owner.returned_value
+    return bound, body
+
+
+def universal_assertions(module: ModuleOp) -> list[smt.ForallOp]:
+    """Get the `smt.forall` operations asserted at the top level of a module."""
+    return [
+        op.op.owner
+        for op in module.ops
+        if isinstance(op, smt.AssertOp) and isinstance(op.op.owner, smt.ForallOp)
+    ]
+
+
+def _is_supported(ty: Attribute) -> bool:
+    if isinstance(ty, pair.PairType):
+        ty = cast(pair.PairType[Attribute, Attribute], ty)
+        return _is_supported(ty.first) and _is_supported(ty.second)
+    return isinstance(ty, smt.BoolType | bv.BitVectorType)
+
+
+def _leaves(ty: Attribute) -> list[Attribute | None]:
+    """
+    Get the types of the leaves of a type, seen as a tree of pairs. Unsupported
+    types are represented by None.
+    """
+    if isinstance(ty, pair.PairType):
+        ty = cast(pair.PairType[Attribute, Attribute], ty)
+        return _leaves(ty.first) + _leaves(ty.second)
+    if isinstance(ty, smt.BoolType | bv.BitVectorType):
+        return [ty]
+    return [None]
+
+
+def _flatten(ty: Attribute, value: Any, leaves: list[Any]) -> None:
+    """Append the leaves of a value of the given type to a list."""
+    if isinstance(ty, pair.PairType):
+        ty = cast(pair.PairType[Attribute, Attribute], ty)
+        _flatten(ty.first, value[0], leaves)
+        _flatten(ty.second, value[1], leaves)
+    else:
+        leaves.append(value)
+
+
+def _nest(ty: Attribute, leaves: Iterator[Any]) -> Any:
+    """Build a value of the given type from its leaves."""
+    if isinstance(ty, pair.PairType):
+        ty = cast(pair.PairType[Attribute, Attribute], ty)
+        return (_nest(ty.first, leaves), _nest(ty.second, leaves))
+    return next(leaves)
+
+
+def _corner_values(ty: Attribute | None) -> list[Any]:
+    match ty:
+        case smt.BoolType():
+            return [False, True]
+        case bv.BitVectorType(width=IntAttr(data=width)):
+            values = [0, 1, (1 << width) - 1, 1 << (width - 1), (1 << (width - 1)) - 1]
+            return list(dict.fromkeys(values))
+        case _:
+            return [None]
+
+
+def _projection(value: SSAValue) -> tuple[SSAValue, tuple[int, ...]]:
+    """
+    Decompose a value `first(second(...(x)))` into `x` and the indices of the
+    pair elements that are projected. Projections of `smt.utils.pair`
+    operations are resolved to the corresponding operands.
+    """
+    path: list[int] = []
+    while isinstance(value, OpResult):
+        if isinstance(value.op, pair.FirstOp | pair.SecondOp):
+            path.append(0 if isinstance(value.op, pair.FirstOp) else 1)
+            value = value.op.pair
+        elif path and isinstance(value.op, pair.PairOp):
+            value = value.op.operands[path.pop()]
+        else:
+            break
+    return value, tuple(reversed(path))
+
+
+def _project(value: Any, path: tuple[int, ...]) -> Any:
+    for index in path:
+        value = value[index]
+    return value
+
+
+@dataclass
+class CompiledConstraint:
+    """
+    The body of a universal constraint, compiled as a function of the bound
+    variables it uses.
+    """
+
+    function: CompiledFunction
+    used: tuple[tuple[int, tuple[int, ...]], ...]
+    """
+    The arguments of the function, given as the index of a bound variable and
+    the pair elements projected from it. Projections are only used for pairs
+    containing unsupported types, such as the memory paired with the UB flag.
+    """
+
+    def find_counterexample(self, points: Sequence[Point]) -> Point | None:
+        """Return the first point falsifying the constraint, if any."""
+        used = self.used
+        results = self.function.evaluate_values(
+            tuple(_project(point[i], path) for i, path in used) for point in points
+        )
+        for point, (holds,) in zip(points, results):
+            if not holds:
+                return point
+        return None
+
+
+def compile_constraint(forall: smt.ForallOp) -> CompiledConstraint | None:
+    """
+    Compile the body of a universal constraint. Returns None if the body depends
+    on declared constants, or uses operations or bound variables that the
+    compiled evaluator does not support.
+    """
+    bound, body = flatten_forall(forall)
+    block = Block()
+    mapping: dict[SSAValue, SSAValue] = {}
+    used: list[tuple[int, tuple[int, ...]]] = []
+
+    if isinstance(body, BlockArgument):
+        return None
+    # Clone the operations computing the body after their dependencies.
+    stack: list[tuple[Operation, bool]] = [(cast(Operation, body.owner), False)]
+    while stack:
+        op, expanded = stack.pop()
+        if op.results[0] in mapping:
+            continue
+        if expanded:
+            for operand in op.operands:
+                if operand not in mapping:
+                    mapping[operand] = mapping[_projection(operand)[0]]
+            new_op = op.clone(value_mapper=mapping)
+            block.add_op(new_op)
+            mapping.update(zip(op.results, new_op.results))
+            continue
+        if op.regions or isinstance(op, smt.DeclareConstOp):
+            return None
+        stack.append((op, True))
+        for operand in op.operands:
+            # Projections of unsupported bound variables, such as the UB flag
+            # paired with the memory, become arguments of their own.
+            root, path = _projection(operand)
+            if path and (root not in bound or _is_supported(root.type)):
+                root, path = operand, ()
+            key = operand if path else root
+            if key in mapping:
+                continue
+            if path or isinstance(root, BlockArgument):
+                if root not in bound:
+                    return None
+                used.append((bound.index(root), path))
+                mapping[key] = block.insert_arg(key.type, len(block.args))
+                continue
+            stack.append((cast(Operation, root.owner), False))
+
+    block.add_op(smt.ReturnOp(mapping[body]))
+    function = compile_function(smt.DefineFunOp(Region(block)))
+    if function is None:
+        return None
+    return CompiledConstraint(function, tuple(used))
+
+
+@dataclass
+class ConcreteInputs:
+    """
+    Concrete inputs on which the universal constraints of queries are tested.
+    The inputs are the counterexamples found by the solver, followed by corner
+    values of the types.
+    Inputs are stored as the leaves of the bound variables seen as trees of
+    pairs, and are shared between constraints with the same leaf types. This
+    way, the counterexamples found once pairs are lowered are also used before
+    pairs are lowered.
+    """
+
+    max_corner_points: int = 256
+    max_counterexamples: int = 256
+
+    _corners: dict[tuple[Attribute | None, ...], list[Point]] = field(
+        default_factory=dict[tuple[Attribute | None, ...], list[Point]]
+    )
+    _counterexamples: dict[tuple[Attribute | None, ...], list[Point]] = field(
+        default_factory=dict[tuple[Attribute | None, ...], list[Point]]
+    )
+
+    @staticmethod
+    def _key(types: tuple[Attribute, ...]) -> tuple[Attribute | None, ...]:
+        return tuple(leaf for ty in types for leaf in _leaves(ty))
+
+    @staticmethod
+    def _nest_all(types: tuple[Attribute, ...], points: list[Point]) -> list[Point]:
+        if all(not isinstance(ty, pair.PairType) for ty in types):
+            return points
+        nested: list[Point] = []
+        for point in points:
+            leaves = iter(point)
+            nested.append(tuple(_nest(ty, leaves) for ty in types))
+        return nested
+
+    def points(self, types: tuple[Attribute, ...]) -> list[Point]:
+        """Get the inputs for bound variables of the given types."""
+        key = self._key(types)
+        corners = self._corners.get(key)
+        if corners is None:
+            corners = list(
+                islice(
+                    product(*(_corner_values(ty) for ty in key)),
+                    self.max_corner_points,
+                )
+            )
+            self._corners[key] = corners
+        return self._nest_all(types, self._counterexamples.get(key, []) + corners)
+
+    def counterexamples(self, types: tuple[Attribute, ...]) -> list[Point]:
+        """Get the counterexamples found for bound variables of the given types."""
+        return self._nest_all(types, self._counterexamples.get(self._key(types), []))
+
+    def add_counterexample(self, types: tuple[Attribute, ...], point: Point) -> None:
+        """
+        Record a counterexample. Points missing the value of a variable of a
+        supported type are ignored.
+        """
+        key = self._key(types)
+        leaves: list[Any] = []
+        for ty, value in zip(types, point, strict=True):
+            _flatten(ty, value, leaves)
+        if any(value is None and ty is not None for ty, value in zip(key, leaves)):
+            return
+        counterexamples = self._counterexamples.setdefault(key, [])
+        flat_point = tuple(leaves)
+        if flat_point in counterexamples:
+            return
+        counterexamples.append(flat_point)
+        if len(counterexamples) > self.max_counterexamples:
+            del counterexamples[0]
+
+    def refutes(self, module: ModuleOp) -> bool:
+        """
+        Check whether a top-level universal assertion of an SMT program is
+        falsified by one of the inputs, in which case the program is
+        unsatisfiable. Assertions that cannot be compiled are not checked.
+        """
+        for forall in universal_assertions(module):
+            constraint = compile_constraint(forall)
+            if constraint is None:
+                continue
+            bound, _ = flatten_forall(forall)
+            types = tuple(arg.type for arg in bound)
+            if constraint.find_counterexample(self.points(types)) is not None:
+                return True
+        return False
@@ -7,14 +7,30 @@ well as additional semantic information.
 
 from __future__ import annotations
 
+from array import array
 from dataclasses import dataclass
-from typing import Any, cast, Iterable
+from functools import cache, cached_property
+from io import StringIO
+from typing import (
+    Any,
+    Callable,
+    Hashable,
+    Iterator,
+    Sequence,
+    TypeVar,
+    cast,
+    Iterable,
+)
 import itertools
+import math
+import random
 import z3  # pyright: ignore[reportMissingTypeStubs]
 
 from xdsl.ir import SSAValue, BlockArgument, OpResult, Attribute
 from xdsl.context import Context
 from xdsl.builder import Builder
+from xdsl.parser import Parser
+from xdsl.printer import Printer
 from xdsl.rewriter import InsertPoint, Rewriter
 from xdsl.utils.hints import isa
 
@@ -23,20 +39,56 @@ from xdsl.dialects.builtin import IntegerAttr, ArrayAttr, IntAttr, ModuleOp
 
 from xdsl_smt.passes.transfer_inline import FunctionCallInline
 from xdsl_smt.dialects import (
+    get_all_dialects,
     smt_dialect as smt,
     smt_bitvector_dialect as bv,
     smt_utils_dialect as pair,
 )
 from xdsl_smt.cli.xdsl_smt_run import build_interpreter, interpret
+from xdsl_smt.superoptimization.compiled_evaluator import compile_function
 from xdsl_smt.utils.run_with_smt_solver import run_module_through_smtlib
 from xdsl_smt.utils.frozen_multiset import FrozenMultiset
 from xdsl_smt.utils.permutation import Permutation, permute
+from xdsl_smt.utils.structural_key import structural_key
 from xdsl_smt.semantics.refinements import function_results_refinement
 
 
-def values_of_type(ty: Attribute) -> tuple[list[Attribute], bool]:
+MIN_BITVECTOR_VALUES = 4
+"""The number of values of each bitvector argument in the smallest fingerprints."""
+
+
+def bitvector_values(width: int, count: int, seed: int = 0) -> list[int]:
     """
-    Returns values of the passed type.
+    Returns `count` distinct values of a bitvector type, or all its values if
+    there are fewer. The values are the small values 0 to 3, then the corner
+    values -1, the signed minimum and maximum, and the powers of two with
+    their negations and predecessors, and finally pseudo-random values that
+    only depend on `seed` and the width.
+    """
+    if count >= 1 << width:
+        return list(range(1 << width))
+    mask = (1 << width) - 1
+    candidates = [0, 1, 2, 3, mask, 1 << (width - 1), mask >> 1]
+    for k in range(2, width - 1):
+        candidates.extend((1 << k, -(1 << k) & mask, (1 << k) - 1))
+    values = list(dict.fromkeys(candidates))[:count]
+
+    rng = random.Random(f"{seed}-{width}")
+    seen = set(values)
+    while len(values) < count:
+        value = rng.getrandbits(width)
+        if value not in seen:
+            seen.add(value)
+            values.append(value)
+    return values
+
+
+def values_of_type(
+    ty: Attribute, bitvector_count: int = MIN_BITVECTOR_VALUES, seed: int = 0
+) -> tuple[list[Attribute], bool]:
+    """
+    Returns values of the passed type. Bitvectors take `bitvector_count`
+    values, as given by `bitvector_values`.
 
     The boolean indicates whether the returned values cover the whole type. If
     `true`, this means all possible values of the type were returned.
@@ -45,14 +97,16 @@ def values_of_type(ty: Attribute) -> tuple[list[Attribute], bool]:
         case smt.BoolType():
             return [IntegerAttr.from_bool(False), IntegerAttr.from_bool(True)], True
         case bv.BitVectorType(width=IntAttr(data=width)):
-            w = min(2, width)
-            return [
-                IntegerAttr.from_int_and_width(value, width) for value in range(1 << w)
-            ], (w == width)
+            values = bitvector_values(width, bitvector_count, seed)
+            return [IntegerAttr.from_int_and_width(value, width) for value in values], (
+                len(values) == 1 << width
+            )
         case pair.PairType():
             ty = cast(pair.PairType, ty)
-            first_values, first_total = values_of_type(ty.first)
-            second_values, second_total = values_of_type(ty.second)
+            first_values, first_total = values_of_type(ty.first, bitvector_count, seed)
+            second_values, second_total = values_of_type(
+                ty.second, bitvector_count, seed
+            )
             return (
                 [ArrayAttr([fv, sv]) for fv in first_values for sv in second_values],
                 first_total and second_total,
@@ -61,6 +115,85 @@ def values_of_type(ty: Attribute) -> tuple[list[Attribute], bool]:
             raise ValueError(f"Unsupported type: {ty}")
 
 
+def _num_values(ty: Attribute, bitvector_count: int) -> int:
+    """The number of values returned by `values_of_type`."""
+    match ty:
+        case bv.BitVectorType(width=IntAttr(data=width)):
+            return min(bitvector_count, 1 << width)
+        case pair.PairType():
+            ty = cast(pair.PairType, ty)
+            return _num_values(ty.first, bitvector_count) * _num_values(
+                ty.second, bitvector_count
+            )
+        case _:
+            return 2
+
+
+@dataclass(frozen=True)
+class EvaluationPoints:
+    """
+    The configuration of the inputs on which patterns are evaluated for their
+    fingerprints. The inputs are all combinations of values of the useful
+    arguments, where each bitvector argument takes as many values as possible
+    without exceeding `max_points` inputs.
+    """
+
+    max_points: int = 256
+    """
+    The maximum number of inputs of a fingerprint. Bitvector arguments always
+    take at least `MIN_BITVECTOR_VALUES` values, so patterns with many
+    arguments may exceed it.
+    """
+    seed: int = 0
+    """The seed of the pseudo-random values of bitvectors."""
+
+    def bitvector_count(self, types: Sequence[Attribute]) -> int:
+        """
+        The number of values of each bitvector argument, for arguments of the
+        given types.
+        """
+        count = MIN_BITVECTOR_VALUES
+        num_points = math.prod(_num_values(ty, count) for ty in types)
+        while True:
+            next_num_points = math.prod(_num_values(ty, count + 1) for ty in types)
+            if next_num_points > self.max_points or next_num_points == num_points:
+                return count
+            count += 1
+            num_points = next_num_points
+
+
+_evaluation_points = EvaluationPoints()
+
+
+def set_evaluation_points(evaluation_points: EvaluationPoints) -> None:
+    """Set the inputs on which patterns built afterwards are evaluated."""
+    global _evaluation_points
+    _evaluation_points = evaluation_points
+
+
+def random_value_of_type(ty: Attribute, rng: random.Random) -> Attribute:
+    """Returns a value of the passed type, drawn from the given generator."""
+    match ty:
+        case smt.BoolType():
+            return IntegerAttr.from_bool(rng.random() < 0.5)
+        case bv.BitVectorType(width=IntAttr(data=width)):
+            return IntegerAttr.from_int_and_width(rng.getrandbits(width), width)
+        case pair.PairType():
+            ty = cast(pair.PairType, ty)
+            return ArrayAttr(
+                [
+                    random_value_of_type(ty.first, rng),
+                    random_value_of_type(ty.second, rng),
+                ]
+            )
+        case _:
+            raise ValueError(f"Unsupported type: {ty}")
+
+
+NUM_REFINEMENT_POINTS = 32
+"""The number of inputs on which `Pattern.refined_fingerprint` is computed."""
+
+
 def clone_func_to_smt_func(func: FuncOp) -> smt.DefineFunOp:
     """
     Convert a `func.func` to an `smt.define_fun` operation.
@@ -80,8 +213,97 @@ def clone_func_to_smt_func(func: FuncOp) -> smt.DefineFunOp:
     return smt.DefineFunOp(new_region)
 
 
+K = TypeVar("K")
+
 Result = tuple[Any, ...]
-UnorderedFingerprint = FrozenMultiset[tuple[Result, ...]]
+UnorderedFingerprint = tuple[Result, ...]
+RefinedFingerprint = FrozenMultiset[tuple[Result, ...]]
+Evaluator = Callable[[Sequence[tuple[Attribute, ...]]], tuple[Result, ...]]
+
+
+def _result_key(types: Sequence[Attribute], result: Result) -> tuple[Any, ...]:
+    """An orderable key of a result, with booleans and bitvectors as integers."""
+    leaves: list[Any] = []
+    for ty, value in zip(types, result, strict=True):
+        _pack_value(ty, value, leaves)
+    return tuple(leaf if isinstance(leaf, int) else str(leaf) for leaf in leaves)
+
+
+def _rank(colors: dict[K, Any]) -> dict[K, int]:
+    """Replace colors by their index in the sorted list of distinct colors."""
+    ranks = {color: rank for rank, color in enumerate(sorted(set(colors.values())))}
+    return {key: ranks[color] for key, color in colors.items()}
+
+
+def _class_orders(classes: list[list[int]]) -> list[tuple[int, ...]]:
+    """
+    Returns the orders of the arguments of the given classes, where arguments
+    of the same class are interchangeable, and are thus kept in order.
+    """
+    orders: list[tuple[int, ...]] = []
+    order: list[int] = []
+    remaining = [len(args) for args in classes]
+
+    def extend() -> None:
+        if not any(remaining):
+            orders.append(tuple(order))
+            return
+        for c, args in enumerate(classes):
+            if remaining[c]:
+                order.append(args[len(args) - remaining[c]])
+                remaining[c] -= 1
+                extend()
+                remaining[c] += 1
+                order.pop()
+
+    extend()
+    return orders
+
+
+def _used_arguments(func: FuncOp) -> set[int]:
+    """
+    Returns the indices of the arguments on which the results of a function
+    syntactically depend. Functions containing operations with regions are
+    assumed to depend on all their arguments.
+    """
+    return_op = func.get_return_op()
+    assert return_op is not None
+    used: set[int] = set()
+    visited: set[SSAValue] = set()
+    worklist = list(return_op.operands)
+    while worklist:
+        value = worklist.pop()
+        if value in visited:
+            continue
+        visited.add(value)
+        match value:
+            case BlockArgument(index=index):
+                used.add(index)
+            case OpResult(op=op):
+                if op.regions:
+                    return set(range(len(func.args)))
+                worklist.extend(op.operands)
+            case _:
+                pass
+    return used
+
+
+_useless_parameters_cache: dict[Hashable, frozenset[int]] = {}
+"""The useless parameters computed in this process, by structural key of the semantics."""
+
+
+def build_evaluator(semantics: FuncOp) -> Evaluator:
+    """
+    Returns a function evaluating the semantics of a pattern on a batch of
+    inputs. The semantics are compiled once when possible, and otherwise
+    evaluated with the xDSL interpreter.
+    """
+    compiled = compile_function(semantics)
+    if compiled is not None:
+        return compiled.evaluate
+
+    interpreter = build_interpreter(ModuleOp([semantics.clone()]), 64)
+    return lambda points: tuple(interpret(interpreter, point) for point in points)
 
 
 @dataclass(init=False, unsafe_hash=True)
@@ -118,9 +340,16 @@ class Pattern:
     """
     The evaluation of the pattern on an ordered set of inputs.
     """
+    canonical_permutation: Permutation
+    """
+    A permutation of the arguments that only depends on the behavior of the
+    pattern on the evaluation points, up to permutation of the arguments.
+    """
     unordered_fingerprint: UnorderedFingerprint
     """
-    The multiset of results of the pattern on a set of inputs.
+    The evaluation of the pattern on an ordered set of inputs, after permuting
+    its arguments with the canonical permutation. Patterns that are equal up
+    to permutation of their arguments have the same unordered fingerprint.
     """
 
     useless_parameters: frozenset[int]
@@ -129,17 +358,55 @@ class Pattern:
     """
 
     def __init__(self, func: FuncOp, semantics: FuncOp) -> None:
+        self._set_ir(func, semantics)
+        evaluate = build_evaluator(self.semantics)
+        self.useless_parameters = self._compute_useless_parameters(evaluate)
+        self._set_fingerprints(evaluate)
+
+    @classmethod
+    def from_fingerprint(
+        cls,
+        func: FuncOp,
+        semantics: FuncOp,
+        useless_parameters: frozenset[int],
+        ordered_fingerprint: tuple[Result, ...],
+    ) -> Pattern:
+        """
+        Build a pattern whose useless parameters and ordered fingerprint are
+        already known, without evaluating it.
+        """
+        pattern = cls.__new__(cls)
+        pattern._set_ir(func, semantics)
+        pattern.useless_parameters = useless_parameters
+        pattern._set_fingerprints(lambda _: ordered_fingerprint)
+        return pattern
+
+    def _set_ir(self, func: FuncOp, semantics: FuncOp) -> None:
         self.func = func
         self.semantics = semantics
 
         self.size = Pattern._formula_size(self.ret())
+        self.exact_fingerprint = all(
+            total for _, total in map(values_of_type, semantics.function_type.inputs)
+        )
 
+    def _set_fingerprints(self, evaluate: Evaluator) -> None:
+        # The number of values of each argument only depends on the types of
+        # the useful arguments, which are the same for patterns with the same
+        # behavior.
+        types = self.semantics.function_type.inputs.data
+        bitvector_count = _evaluation_points.bitvector_count(
+            [ty for i, ty in enumerate(types) if i not in self.useless_parameters]
+        )
         values_for_each_param = [
-            values_of_type(ty) for ty in self.semantics.function_type.inputs
+            values_of_type(ty, bitvector_count, _evaluation_points.seed) for ty in types
         ]
-        self.exact_fingerprint = all(total for _, total in values_for_each_param)
-
-        self.useless_parameters = frozenset(self._compute_useless_parameters())
+        # Larger bitvector counts may cover all values of the useful arguments.
+        self.exact_fingerprint = self.exact_fingerprint or all(
+            total
+            for i, (_, total) in enumerate(values_for_each_param)
+            if i not in self.useless_parameters
+        )
 
         # We don't need to compute multiple values for useless parameters.
         self.evaluation_points_per_argument = tuple(
@@ -150,16 +417,13 @@ class Pattern:
             )
             for i in range(self.semantics_arity)
         )
-        interpreter = build_interpreter(ModuleOp([self.semantics.clone()]), 64)
         self.evaluation_points = Pattern.get_evaluation_points(
             self.evaluation_points_per_argument
         )
-        self.ordered_fingerprint = tuple(
-            interpret(interpreter, point) for point in self.evaluation_points
-        )
-        self.unordered_fingerprint = FrozenMultiset[tuple[Result, ...]].from_iterable(
-            self.permutated_fingerprint(permutation)
-            for permutation in self.input_permutations()
+        self.ordered_fingerprint = evaluate(self.evaluation_points)
+        self.canonical_permutation = self._compute_canonical_permutation()
+        self.unordered_fingerprint = self.permutated_fingerprint(
+            self.canonical_permutation
         )
 
     def ret(self) -> SSAValue:
@@ -188,20 +452,159 @@ class Pattern:
         """
         Returns the pattern ordered fingerprint when its arguments are permuted.
         """
-        evaluation_points_per_arguments = permute(
-            self.evaluation_points_per_argument, permutation
+        fingerprint = self.ordered_fingerprint
+        return tuple(fingerprint[i] for i in self._permuted_indices(permutation))
+
+    def _permuted_indices(self, permutation: Permutation) -> list[int]:
+        """
+        Returns the indices in `ordered_fingerprint` of the results of
+        `permutated_fingerprint(permutation)`. The evaluation points are ordered
+        lexicographically, so the index of a point is the sum of the indices of
+        its values, scaled by the number of points of the following arguments.
+        """
+        sizes = [len(values) for values in self.evaluation_points_per_argument]
+        strides = [1] * len(sizes)
+        for i in reversed(range(len(sizes) - 1)):
+            strides[i] = strides[i + 1] * sizes[i + 1]
+
+        indices = [0]
+        for i in permutation:
+            indices = [
+                index + value * strides[i]
+                for index in indices
+                for value in range(sizes[i])
+            ]
+        return indices
+
+    def _argument_colors(self, params: list[int]) -> dict[int, int]:
+        """
+        Color the given arguments by invariants that do not depend on their
+        order, as in graph canonization: their type, and the results obtained
+        for each of their values. Colors are then refined by the results
+        obtained for each pair of values of two arguments, until no more
+        arguments are separated.
+        """
+        types = self.semantics.function_type.outputs.data
+        keys = [_result_key(types, result) for result in self.ordered_fingerprint]
+
+        # The indices of the values of the arguments at each evaluation point.
+        sizes = [len(values) for values in self.evaluation_points_per_argument]
+        point_values = list(itertools.product(*map(range, sizes)))
+
+        def results_per_values(*args: int) -> tuple[tuple[Any, ...], ...]:
+            """The sorted results for each combination of values of `args`."""
+            groups: dict[tuple[int, ...], list[Any]] = {}
+            for values, key in zip(point_values, keys, strict=True):
+                groups.setdefault(tuple(values[arg] for arg in args), []).append(key)
+            return tuple(tuple(sorted(groups[k])) for k in sorted(groups))
+
+        input_types = self.semantics.function_type.inputs.data
+        colors = _rank(
+            {i: (str(input_types[i]), results_per_values(i)) for i in params}
         )
-        evaluation_points = Pattern.get_evaluation_points(
-            evaluation_points_per_arguments
+        pair_colors = _rank(
+            {(i, j): results_per_values(i, j) for i in params for j in params if i != j}
         )
-        mapping_fingerprint = {
-            permute(point, permutation): value
-            for point, value in zip(
-                self.evaluation_points, self.ordered_fingerprint, strict=True
+        while True:
+            refined = _rank(
+                {
+                    i: (
+                        colors[i],
+                        tuple(
+                            sorted(
+                                (colors[j], pair_colors[i, j]) for j in params if j != i
+                            )
+                        ),
+                    )
+                    for i in params
+                }
             )
-        }
+            if len(set(refined.values())) == len(set(colors.values())):
+                return colors
+            colors = refined
 
-        return tuple(mapping_fingerprint[point] for point in evaluation_points)
+    def _compute_canonical_permutation(self) -> Permutation:
+        """
+        Compute a canonical permutation of the arguments, such that patterns
+        that are equal up to permutation of their arguments have the same
+        fingerprint once permuted, without trying all permutations.
+
+        Arguments are ordered by their color, and only the orders of arguments
+        with the same color are tried. Arguments that can be swapped without
+        changing the fingerprint are not reordered.
+        """
+        types = self.semantics.function_type.outputs.data
+        keys = [_result_key(types, result) for result in self.ordered_fingerprint]
+        identity = tuple(range(self.semantics_arity))
+        params = [i for i in range(self.arity) if i not in self.useless_parameters]
+        if len(params) < 2:
+            return identity
+        colors = self._argument_colors(params)
+
+        def is_symmetric(i: int, j: int) -> bool:
+            swap = list(identity)
+            swap[i], swap[j] = j, i
+            indices = self._permuted_indices(tuple(swap))
+            return all(keys[k] == keys[index] for k, index in enumerate(indices))
+
+        # Group the arguments of each color into classes of arguments that can
+        # be swapped. Swapping arguments is an equivalence relation, as it is
+        # generated by the transpositions that preserve the fingerprint.
+        classes_per_color: list[list[list[int]]] = []
+        for color in sorted(set(colors.values())):
+            classes: list[list[int]] = []
+            for i in params:
+                if colors[i] != color:
+                    continue
+                for symmetric_class in classes:
+                    if is_symmetric(symmetric_class[0], i):
+                        symmetric_class.append(i)
+                        break
+                else:
+                    classes.append([i])
+            classes_per_color.append(classes)
+
+        best: tuple[Any, ...] | None = None
+        best_permutation = identity
+        for orders in itertools.product(
+            *(_class_orders(classes) for classes in classes_per_color)
+        ):
+            permutation = list(identity)
+            for position, i in zip(params, itertools.chain(*orders), strict=True):
+                permutation[position] = i
+            key = tuple(keys[k] for k in self._permuted_indices(tuple(permutation)))
+            if best is None or key < best:
+                best = key
+                best_permutation = tuple(permutation)
+        return best_permutation
+
+    def _canonical_permutations(self) -> Iterator[Permutation]:
+        """
+        Returns the permutations of the arguments giving the same fingerprint
+        as the canonical permutation. Only arguments of the same color are
+        exchanged, so this is usually the canonical permutation alone.
+        """
+        params = [i for i in range(self.arity) if i not in self.useless_parameters]
+        canonical = self.canonical_permutation
+        if len(params) < 2:
+            yield canonical
+            return
+        colors = self._argument_colors(params)
+        positions_per_color: dict[int, list[int]] = {}
+        for position in params:
+            positions_per_color.setdefault(colors[canonical[position]], []).append(
+                position
+            )
+        groups = list(positions_per_color.values())
+        for orders in itertools.product(*map(itertools.permutations, groups)):
+            permutation = list(canonical)
+            for positions, order in zip(groups, orders, strict=True):
+                for position, source in zip(positions, order, strict=True):
+                    permutation[position] = canonical[source]
+            if self.permutated_fingerprint(tuple(permutation)) == (
+                self.unordered_fingerprint
+            ):
+                yield tuple(permutation)
 
     @staticmethod
     def get_evaluation_points(
@@ -283,15 +686,25 @@ class Pattern:
             z3.unsat == run_module_through_smtlib(module)[0]
         )  # pyright: ignore[reportUnknownVariableType]
 
-    def _compute_useless_parameters(self) -> set[int]:
+    def _compute_useless_parameters(self, evaluate: Evaluator) -> frozenset[int]:
         """
         Compute the set of parameters that do not have any effect in the
-        computation of the pattern.
+        computation of the pattern. The result is cached for structurally
+        equal semantics.
         """
+        key = structural_key(self.semantics)
+        useless_parameters = _useless_parameters_cache.get(key)
+        if useless_parameters is None:
+            useless_parameters = frozenset(
+                self._compute_useless_parameters_uncached(evaluate)
+            )
+            _useless_parameters_cache[key] = useless_parameters
+        return useless_parameters
+
+    def _compute_useless_parameters_uncached(self, evaluate: Evaluator) -> set[int]:
         values_for_each_param = [
             values_of_type(ty) for ty in self.semantics.function_type.inputs
         ]
-        interpreter = build_interpreter(ModuleOp([self.semantics.clone()]), 64)
 
         # This list contains, for each parameter i, a map from the values of all
         # other parameters to the set of results obtained when varying parameter i.
@@ -299,8 +712,10 @@ class Pattern:
             dict[tuple[Attribute, ...], set[tuple[Any, ...]]]
         ] = [{} for _ in range(self.semantics_arity)]
 
-        for inputs in itertools.product(*(vals for vals, _ in values_for_each_param)):
-            result = interpret(interpreter, inputs)
+        all_inputs = tuple(
+            itertools.product(*(vals for vals, _ in values_for_each_param))
+        )
+        for inputs, result in zip(all_inputs, evaluate(all_inputs), strict=True):
             for i in range(self.semantics_arity):
                 results_for_fixed_inputs[i].setdefault(
                     inputs[:i] + inputs[i + 1 :], set()
@@ -317,8 +732,14 @@ class Pattern:
         if self.exact_fingerprint:
             return useless_parameters_on_cvec
 
-        # Then, compute which of those parameters are actually useless.
-        return {i for i in useless_parameters_on_cvec if self._is_parameter_useless(i)}
+        # Parameters on which the results do not syntactically depend are
+        # useless. Only the other parameters are checked with Z3.
+        used_parameters = _used_arguments(self.semantics)
+        return {
+            i
+            for i in useless_parameters_on_cvec
+            if i not in used_parameters or self._is_parameter_useless(i)
+        }
 
     def input_permutations(self) -> Iterable[Permutation]:
         """
@@ -335,24 +756,57 @@ class Pattern:
         for permutation in itertools.permutations(range(num_parameters_to_permute)):
             yield tuple(
                 i
-                if i >= self.arity or self.useless_parameters
+                if i >= self.arity or i in self.useless_parameters
                 else permutation_index_to_parameter[
                     permutation[parameter_to_permutation_index[i]]
                 ]
                 for i in range(self.semantics_arity)
             )
 
+    @cached_property
+    def refined_fingerprint(self) -> RefinedFingerprint:
+        """
+        The multiset of results of the pattern on pseudo-random inputs, under
+        the canonical permutations of its arguments. Patterns with the same
+        behavior have the same refined fingerprint, which often separates
+        patterns whose `unordered_fingerprint` is equal but inexact without
+        calling Z3.
+        The random values are drawn for the useful arguments in canonical
+        order, and only depend on their types. Useless arguments always take
+        the same value, as in the evaluation points.
+        """
+        types = self.semantics.function_type.inputs.data
+        positions = [
+            i for i in range(self.semantics_arity) if i not in self.useless_parameters
+        ]
+        rng = random.Random(0)
+        points = [
+            [
+                random_value_of_type(types[self.canonical_permutation[i]], rng)
+                for i in positions
+            ]
+            for _ in range(NUM_REFINEMENT_POINTS)
+        ]
+        fixed = [values[0] for values in self.evaluation_points_per_argument]
+        inputs: list[tuple[Attribute, ...]] = []
+        for permutation in self._canonical_permutations():
+            for point in points:
+                values = list(fixed)
+                for position, value in zip(positions, point, strict=True):
+                    values[permutation[position]] = value
+                inputs.append(tuple(values))
+        results = build_evaluator(self.semantics)(inputs)
+        return FrozenMultiset[tuple[Result, ...]].from_iterable(
+            results[i : i + len(points)] for i in range(0, len(results), len(points))
+        )
+
     def ordered_patterns(self) -> Iterable[OrderedPattern]:
         """
         Returns all the ordered patterns that are equivalent to this pattern,
         up to permutation of the arguments.
         """
         for permutation in self.input_permutations():
-            yield OrderedPattern(
-                self.func,
-                self.semantics,
-                permutation,
-            )
+            yield OrderedPattern.from_pattern(self, permutation)
 
     def is_same_behavior(self, other: Pattern) -> bool:
         """
@@ -366,6 +820,9 @@ class Pattern:
         if self.exact_fingerprint and other.exact_fingerprint:
             return True
 
+        if self.refined_fingerprint != other.refined_fingerprint:
+            return False
+
         other_ordered = next(iter(other.ordered_patterns()))
         for permuted in self.ordered_patterns():
             if permuted.has_same_behavior(other_ordered):
@@ -423,6 +880,17 @@ class OrderedPattern(Pattern):
         super().__init__(func, semantics)
         self.permutation = permutation
 
+    @classmethod
+    def from_pattern(cls, pattern: Pattern, permutation: Permutation) -> OrderedPattern:
+        """
+        Build an ordered pattern from a pattern, reusing its fingerprints
+        instead of evaluating it again.
+        """
+        ordered = cls.__new__(cls)
+        ordered.__dict__.update(pattern.__dict__)
+        ordered.permutation = permutation
+        return ordered
+
     @property
     def ordered_func(self):
         func = self.func.clone()
@@ -759,3 +1227,243 @@ class OrderedPattern(Pattern):
         return (
             z3.unsat == run_module_through_smtlib(module)[0]
         )  # pyright: ignore[reportUnknownVariableType]
+
+
+PackedFingerprint = tuple[tuple[str, ...], tuple[Any, ...]]
+"""
+The unordered fingerprint of a packed pattern: the result types of its
+semantics, and the leaves of the results of its unordered fingerprint, with
+booleans and bitvectors given as integers.
+"""
+
+
+def _leaf_count(ty: Attribute) -> int:
+    if isinstance(ty, pair.PairType):
+        ty = cast(pair.PairType[Attribute, Attribute], ty)
+        return _leaf_count(ty.first) + _leaf_count(ty.second)
+    return 1
+
+
+def _pack_value(ty: Attribute, value: Any, leaves: list[Any]) -> None:
+    """
+    Append the leaves of a value returned by the evaluator to a list. Booleans
+    and bitvectors are converted to integers, and other values are kept as is.
+    """
+    match ty, value:
+        case smt.BoolType(), bool():
+            leaves.append(int(value))
+        case bv.BitVectorType(), bv.BitVectorAttr():
+            leaves.append(value.value.data)
+        case pair.PairType(), (first, second):
+            ty = cast(pair.PairType[Attribute, Attribute], ty)
+            _pack_value(ty.first, first, leaves)
+            _pack_value(ty.second, second, leaves)
+        case _:
+            leaves.append(value)
+
+
+def _unpack_value(ty: Attribute, leaves: Iterator[Any]) -> Any:
+    """Build a value returned by the evaluator from its leaves."""
+    match ty:
+        case pair.PairType():
+            ty = cast(pair.PairType[Attribute, Attribute], ty)
+            return (_unpack_value(ty.first, leaves), _unpack_value(ty.second, leaves))
+        case smt.BoolType():
+            leaf = next(leaves)
+            return bool(leaf) if isinstance(leaf, int) else leaf
+        case bv.BitVectorType(width=IntAttr(data=width)):
+            leaf = next(leaves)
+            return bv.BitVectorAttr(leaf, width) if isinstance(leaf, int) else leaf
+        case _:
+            return next(leaves)
+
+
+def _pack_results(
+    types: Sequence[Attribute], results: Iterable[Result]
+) -> tuple[Any, ...]:
+    leaves: list[Any] = []
+    for result in results:
+        for ty, value in zip(types, result, strict=True):
+            _pack_value(ty, value, leaves)
+    return tuple(leaves)
+
+
+def _unpack_results(
+    types: Sequence[Attribute], leaves: Sequence[Any]
+) -> tuple[Result, ...]:
+    num_results = len(leaves) // sum(_leaf_count(ty) for ty in types)
+    leaf_iterator = iter(leaves)
+    return tuple(
+        tuple(_unpack_value(ty, leaf_iterator) for ty in types)
+        for _ in range(num_results)
+    )
+
+
+def _to_array(leaves: tuple[Any, ...]) -> array[int] | tuple[Any, ...]:
+    """
+    Store integers in an array with the smallest item size that fits them, or
+    keep them as a tuple if they do not fit in 64 bits.
+    """
+    if not all(isinstance(leaf, int) and leaf >= 0 for leaf in leaves):
+        return leaves
+    max_leaf = max(leaves, default=0)
+    for typecode in "BHIQ":
+        if max_leaf < 1 << (8 * array(typecode).itemsize):
+            return array(typecode, leaves)
+    return leaves
+
+
+def _print_generic(func: FuncOp) -> str:
+    stream = StringIO()
+    Printer(stream, print_generic_format=True).print_op(func)
+    return stream.getvalue()
+
+
+@cache
+def _parsing_context() -> Context:
+    ctx = Context()
+    ctx.allow_unregistered = True
+    for dialect_name, dialect_factory in get_all_dialects().items():
+        ctx.register_dialect(dialect_name, dialect_factory)
+    return ctx
+
+
+def _parse_func(source: str) -> FuncOp:
+    func = Parser(_parsing_context(), source).parse_op()
+    assert isinstance(func, FuncOp)
+    return func
+
+
+class PackedPattern:
+    """
+    A compact representation of a pattern, to keep many patterns in memory and
+    to send them between processes. The IR is kept in the generic format and
+    is only parsed when needed, and the fingerprints are kept as integers, so
+    that fingerprints can be compared without the IR.
+    """
+
+    __slots__ = (
+        "source",
+        "semantics_source",
+        "size",
+        "exact_fingerprint",
+        "useless_parameters",
+        "ordered_fingerprint",
+        "unordered_fingerprint",
+        "_pattern",
+    )
+
+    source: str
+    """The function representing the pattern, in the generic format."""
+    semantics_source: str | None
+    """
+    The function representing the pattern's semantics, in the generic format,
+    or None if the pattern is its own semantics.
+    """
+    size: int
+    """The number of connectors in the pattern."""
+    exact_fingerprint: bool
+    """Wether the pattern's fingerprint represents exactly the pattern behavior."""
+    useless_parameters: frozenset[int]
+    """The set of useless parameters of the pattern."""
+    ordered_fingerprint: array[int] | tuple[Any, ...]
+    """
+    The leaves of the results of the ordered fingerprint, as an array of
+    integers when they all fit in 64 bits.
+    """
+    unordered_fingerprint: PackedFingerprint
+    """The unordered fingerprint, packed so that it can be compared and hashed."""
+    _pattern: Pattern | None
+    """The pattern, if it was already built in this process."""
+
+    def __init__(self, pattern: Pattern) -> None:
+        self.source = _print_generic(pattern.func)
+        self.semantics_source = (
+            None
+            if pattern.semantics is pattern.func
+            else _print_generic(pattern.semantics)
+        )
+        self.size = pattern.size
+        self.exact_fingerprint = pattern.exact_fingerprint
+        self.useless_parameters = pattern.useless_parameters
+
+        types = pattern.semantics.function_type.outputs.data
+        leaves = _pack_results(types, pattern.ordered_fingerprint)
+        self.ordered_fingerprint = _to_array(leaves)
+        self.unordered_fingerprint = (
+            tuple(str(ty) for ty in types),
+            _pack_results(types, pattern.unordered_fingerprint),
+        )
+        self._pattern = pattern
+
+    def __getstate__(self) -> tuple[Any, ...]:
+        # The IR is not sent to other processes.
+        return (
+            self.source,
+            self.semantics_source,
+            self.size,
+            self.exact_fingerprint,
+            self.useless_parameters,
+            self.ordered_fingerprint,
+            self.unordered_fingerprint,
+        )
+
+    def __setstate__(self, state: tuple[Any, ...]) -> None:
+        (
+            self.source,
+            self.semantics_source,
+            self.size,
+            self.exact_fingerprint,
+            self.useless_parameters,
+            self.ordered_fingerprint,
+            self.unordered_fingerprint,
+        ) = state
+        self._pattern = None
+
+    def unpack(self) -> Pattern:
+        """
+        Get the pattern if it is already built, and otherwise build it from its
+        sources, without evaluating it again. In the latter case, the built
+        pattern is not kept.
+        """
+        if self._pattern is not None:
+            return self._pattern
+        func = _parse_func(self.source)
+        semantics = (
+            func
+            if self.semantics_source is None
+            else _parse_func(self.semantics_source)
+        )
+        ordered_fingerprint = _unpack_results(
+            semantics.function_type.outputs.data, self.ordered_fingerprint
+        )
+        return Pattern.from_fingerprint(
+            func, semantics, self.useless_parameters, ordered_fingerprint
+        )
+
+    @property
+    def pattern(self) -> Pattern:
+        """The pattern, which is built once and kept."""
+        if self._pattern is None:
+            self._pattern = self.unpack()
+        return self._pattern
+
+    def release(self) -> None:
+        """Drop the built pattern, if any, keeping only the packed data."""
+        self._pattern = None
+
+    @property
+    def refined_fingerprint(self) -> RefinedFingerprint:
+        return self.pattern.refined_fingerprint
+
+    def is_same_behavior(self, other: PackedPattern) -> bool:
+        """
+        Tests whether two programs are logically equivalent up to parameter
+        permutation, and ignoring useless parameters. The IR is only built if
+        the fingerprints are not exact.
+        """
+        if self.unordered_fingerprint != other.unordered_fingerprint:
+            return False
+        if self.exact_fingerprint and other.exact_fingerprint:
+            return True
+        return self.pattern.is_same_behavior(other.pattern)
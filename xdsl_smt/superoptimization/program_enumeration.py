@@ -1,6 +1,9 @@
+import os
+import queue
 import subprocess as sp
+import threading
 import time
-from typing import Sequence, Iterable
+from typing import IO, Generator, Sequence, Iterable
 
 from xdsl.printer import Printer
 from xdsl_smt.utils.get_submodule_path import get_mlir_fuzz_executable_path
@@ -12,17 +15,26 @@ MLIR_ENUMERATE_PATH = get_mlir_fuzz_executable_path("mlir-enumerate")
 EXCLUDE_SUBPATTERNS_FILE = f"/tmp/exclude-subpatterns-{time.time()}.mlir"
 BUILDING_BLOCKS_FILE = f"/tmp/building-blocks-{time.time()}.mlir"
 
+PROGRAM_SEPARATOR = b"// -----\n"
+READ_CHUNK_SIZE = 1 << 16
+"""The number of bytes read at once from the enumerator output."""
+MAX_QUEUED_BATCHES = 64
+"""
+The number of batches of programs that can be read ahead of the consumer.
+When the queue is full, the reader stops reading, and the enumerator blocks
+once the pipe is full.
+"""
 
-def _read_program_from_enumerator(enumerator: sp.Popen[str]) -> str | None:
+
+def _read_program_from_enumerator(stdout: IO[bytes]) -> str | None:
     """Read a single program from the enumerator."""
-    program_lines = list[str]()
-    assert enumerator.stdout is not None
+    program_lines = list[bytes]()
     while True:
-        output = enumerator.stdout.readline()
+        output = stdout.readline()
 
         # End of program marker
-        if output == "// -----\n":
-            return "".join(program_lines)
+        if output == PROGRAM_SEPARATOR:
+            return b"".join(program_lines).decode("utf-8")
 
         # End of file
         if not output:
@@ -32,6 +44,79 @@ def _read_program_from_enumerator(enumerator: sp.Popen[str]) -> str | None:
         program_lines.append(output)
 
 
+def _read_batches_from_enumerator(
+    stdout: IO[bytes], batches: queue.Queue[list[str] | None]
+) -> None:
+    """
+    Read the enumerator output in large chunks, and push the programs it
+    contains in batches to the queue. `None` is pushed once the output ends.
+    """
+    try:
+        buffer = b""
+        fd = stdout.fileno()
+        while chunk := os.read(fd, READ_CHUNK_SIZE):
+            *programs, buffer = (buffer + chunk).split(PROGRAM_SEPARATOR)
+            if programs:
+                batches.put([program.decode("utf-8") for program in programs])
+    finally:
+        batches.put(None)
+
+
+def _check_exit_status(enumerator: sp.Popen[bytes]) -> None:
+    """Raise `CalledProcessError` if the enumerator exited with an error."""
+    returncode = enumerator.wait()
+    if returncode != 0:
+        raise sp.CalledProcessError(returncode, enumerator.args)
+
+
+def read_programs_from_enumerator(
+    enumerator: sp.Popen[bytes], pause_between_programs: bool = False
+) -> Generator[str, None, None]:
+    """
+    Read the programs printed by an enumerator, separated by `// -----`.
+
+    If `pause_between_programs` is set, the enumerator is expected to have been
+    started with `--pause-between-programs`, and a character is sent to it
+    after reading each program. Otherwise, the output is read in a separate
+    thread without any handshake, and the enumerator is killed if the iteration
+    stops before the end of its output.
+    Raises `CalledProcessError` once the output ends if the enumerator exited
+    with an error.
+    """
+    assert enumerator.stdout is not None
+
+    if pause_between_programs:
+        assert enumerator.stdin is not None
+        while (source := _read_program_from_enumerator(enumerator.stdout)) is not None:
+            # Send a character to the enumerator to continue.
+            enumerator.stdin.write(b"a")
+            enumerator.stdin.flush()
+            yield source
+        _check_exit_status(enumerator)
+        return
+
+    batches = queue.Queue[list[str] | None](maxsize=MAX_QUEUED_BATCHES)
+    reader = threading.Thread(
+        target=_read_batches_from_enumerator,
+        args=(enumerator.stdout, batches),
+        daemon=True,
+    )
+    reader.start()
+    finished = False
+    try:
+        while (batch := batches.get()) is not None:
+            yield from batch
+        finished = True
+    finally:
+        if not finished:
+            enumerator.kill()
+            # Unblock the reader so that it can observe the end of the output.
+            while batches.get() is not None:
+                pass
+        reader.join()
+    _check_exit_status(enumerator)
+
+
 def enumerate_programs(
     max_num_args: int,
     num_ops: int,
@@ -41,8 +126,13 @@ def enumerate_programs(
     dialect_path: str,
     configuration: str = "smt",
     additional_options: Sequence[str] = (),
+    pause_between_programs: bool = False,
 ) -> Iterable[str]:
-    """Enumerate all programs up to a given size."""
+    """
+    Enumerate all programs up to a given size.
+    By default, the enumerator output is streamed without waiting for each
+    program to be consumed, see `read_programs_from_enumerator`.
+    """
     if building_blocks is not None:
         with open(BUILDING_BLOCKS_FILE, "w") as f:
             printer = Printer(f, print_generic_format=True)
@@ -70,21 +160,14 @@ def enumerate_programs(
             "--seed=1",
             f"--max-num-args={max_num_args}",
             f"--max-num-ops={num_ops}",
-            "--pause-between-programs",
+            *(["--pause-between-programs"] if pause_between_programs else []),
             "--mlir-print-op-generic",
             f"--building-blocks={BUILDING_BLOCKS_FILE if building_blocks is not None else ''}",
             f"--exclude-subpatterns={EXCLUDE_SUBPATTERNS_FILE}",
             *additional_options,
         ],
-        text=True,
-        stdin=sp.PIPE,
+        stdin=sp.PIPE if pause_between_programs else sp.DEVNULL,
         stdout=sp.PIPE,
     )
 
-    while (source := _read_program_from_enumerator(enumerator)) is not None:
-        # Send a character to the enumerator to continue.
-        assert enumerator.stdin is not None
-        enumerator.stdin.write("a")
-        enumerator.stdin.flush()
-
-        yield source
+    yield from read_programs_from_enumerator(enumerator, pause_between_programs)
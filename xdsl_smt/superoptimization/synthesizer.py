@@ -4,7 +4,7 @@ program such that it is a refinement of an LHS program.
 """
 
 import z3  # type: ignore[reportMissingTypeStubs]
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Sequence, Mapping, cast, Any
 from xdsl.context import Context
 from xdsl.ir import SSAValue, Attribute, OperationInvT
@@ -20,6 +20,7 @@ from xdsl.dialects.builtin import (
     IntegerAttr,
     IntegerType,
     DictionaryAttr,
+    FunctionType,
 )
 from xdsl_smt.dialects.smt_dialect import (
     DeclareConstOp,
@@ -53,7 +54,14 @@ from xdsl_smt.passes.lower_effects_with_memory import LowerEffectsWithMemoryPass
 from xdsl_smt.passes.lower_memory_to_array import LowerMemoryToArrayPass
 from xdsl_smt.passes.smt_expand import SMTExpand
 from xdsl_smt.passes.transfer_inline import FunctionCallInline
-from xdsl_smt.utils.run_with_smt_solver import run_module_through_smtlib
+from xdsl_smt.superoptimization.cegis import check_with_cegis
+from xdsl_smt.superoptimization.concrete_inputs import ConcreteInputs
+from xdsl_smt.utils.dialect_to_z3 import Z3TranslationError
+from xdsl_smt.utils.run_with_smt_solver import (
+    IncrementalSolver,
+    SolverBackend,
+    run_module_through_smtlib,
+)
 
 
 class SynthSemantics(OperationSemantics):
@@ -255,162 +263,250 @@ def replace_synth_constant_with_op(synth_const: synth.ConstantOp, value: Any) ->
         rewriter.replace_op(synth_const, [new_op])
 
 
-def synthesize_constants(
-    lhs: ModuleOp,
-    rhs: ModuleOp,
-    ctx: Context,
-    optimize: bool,
-    timeout: int | None = None,
-) -> ModuleOp | None:
-    lhs = lhs.clone()
-    rhs = rhs.clone()
-    rhs_old = rhs
-    # Give a name to each synth.constant so we can track them during the pipeline.
-    name_to_synth_const = assign_names_to_synth_constants(rhs_old)
-    synth_op_to_attr_names = assign_names_to_synth_attributes(rhs_old)
-
-    rhs = rhs_old.clone()
-
-    func_lhs = get_op_from_module(lhs, FuncOp)
-    assert isinstance(func_lhs, FuncOp)
-    lhs_func_type = func_lhs.function_type
-
-    # Move smt.synth.constant to function arguments
-    func_rhs = get_op_from_module(rhs, FuncOp)
-    assert isinstance(func_rhs, FuncOp)
-    rhs_func_type = func_rhs.function_type
-
-    # Move synth.constant outside of the rhs function body
-    # move_synth_constants_at_toplevel(rhs, InsertPoint.at_start(rhs.body.block))
-
+def lower_function_to_smt(module: ModuleOp, ctx: Context, optimize: bool) -> None:
+    """
+    Lower a module containing a function to SMT, including its effects.
+    The constants declared in the function body are moved at the top level.
+    """
     SMTLowerer.op_semantics[synth.ConstantOp] = SynthSemantics()
     SMTLowerer.op_semantics[synth.OperationOp] = SynthOpSemantics(ctx)
-    # Convert both module to SMTLib
-    LowerToSMTPass().apply(ctx, lhs)
-    LowerToSMTPass().apply(ctx, rhs)
-    move_declare_constants_at_toplevel(rhs, InsertPoint.at_start(rhs.body.block))
-
-    func = get_op_from_module(lhs, DefineFunOp)
-    func_rhs = get_op_from_module(rhs, DefineFunOp)
-
-    # Combine both modules into a new one
-    new_module = ModuleOp([])
-    block = new_module.body.blocks[0]
-    for op in lhs.body.ops:
-        op.detach()
-        block.add_op(op)
-    for op in rhs.body.ops:
-        op.detach()
-        block.add_op(op)
-
-    if optimize:
-        optimize_module(ctx, new_module, with_pairs=False)
-
-    LowerMemoryEffectsPass().apply(ctx, new_module)
+    LowerToSMTPass().apply(ctx, module)
+    move_declare_constants_at_toplevel(module, InsertPoint.at_start(module.body.block))
 
     if optimize:
-        optimize_module(ctx, new_module, with_pairs=False)
+        optimize_module(ctx, module, with_pairs=False)
 
-    LowerEffectsWithMemoryPass().apply(ctx, new_module)
+    LowerMemoryEffectsPass().apply(ctx, module)
 
     if optimize:
-        optimize_module(ctx, new_module, with_pairs=False)
-
-    new_module.verify()
-    refinement = insert_function_refinement_with_forall(
-        func,
-        lhs_func_type,
-        func_rhs,
-        rhs_func_type,
-        InsertPoint.at_end(block),
-    )
-    block.add_op(AssertOp(refinement))
-
-    if optimize:
-        optimize_module(ctx, new_module)
+        optimize_module(ctx, module, with_pairs=False)
 
-    move_declare_constants_at_toplevel(
-        new_module, InsertPoint.at_start(new_module.body.blocks[0])
-    )
+    LowerEffectsWithMemoryPass().apply(ctx, module)
 
     if optimize:
-        optimize_module(ctx, new_module)
-
+        optimize_module(ctx, module, with_pairs=False)
 
-    FunctionCallInline(True, {}).apply(ctx, new_module)
-    for op in new_module.body.ops:
-        if isinstance(op, DefineFunOp):
-            new_module.body.block.erase_op(op)
 
-    if optimize:
-        optimize_module(ctx, new_module)
-
-    # Lower memory to arrays
-    LowerMemoryToArrayPass().apply(ctx, new_module)
+@dataclass
+class ConstantSynthesizer:
+    """
+    Synthesize constants in RHS programs such that they refine the same LHS
+    program. The LHS program is lowered to SMT only once.
+    If `incremental` is set, the queries are checked with a single incremental
+    solver instead of a new solver for each query.
+    If `cegis` is set, the constants are synthesized with counterexample-guided
+    inductive synthesis instead of a single quantified query.
+    If `concrete_filter` is set, the RHS programs without constants are first
+    evaluated on concrete inputs, and rejected without calling the solver if
+    one input shows that they do not refine the LHS program. The inputs include
+    the counterexamples found by CEGIS for previous RHS programs.
+    """
 
-    if optimize:
-        optimize_module(ctx, new_module)
+    lhs: ModuleOp
+    ctx: Context
+    optimize: bool
+    timeout: int | None = None
+    backend: SolverBackend | None = None
+    incremental: bool = False
+    cegis: bool = False
+    concrete_filter: bool = False
+
+    _inputs: ConcreteInputs = field(init=False)
+    _lowered_lhs: ModuleOp = field(init=False)
+    _lhs_func_type: FunctionType = field(init=False)
+    _solver: IncrementalSolver | None = field(init=False)
+
+    def __post_init__(self):
+        func_lhs = get_op_from_module(self.lhs, FuncOp)
+        self._lhs_func_type = func_lhs.function_type
+        self._inputs = ConcreteInputs()
+        self._lowered_lhs = self.lhs.clone()
+        lower_function_to_smt(self._lowered_lhs, self.ctx, self.optimize)
+        self._solver = None
+        if self.incremental:
+            if self.timeout is not None:
+                self._solver = IncrementalSolver(self.timeout)
+            else:
+                self._solver = IncrementalSolver()
+
+    def _check(self, module: ModuleOp) -> tuple[Any, Any | None]:
+        """Check an SMT program, and return its model if it is satisfiable."""
+        if self.cegis:
+            try:
+                if self.timeout is not None:
+                    return check_with_cegis(module, self.timeout, inputs=self._inputs)
+                return check_with_cegis(module, inputs=self._inputs)
+            except Z3TranslationError:
+                # Fall back to the quantified query.
+                pass
+        if self._solver is not None:
+            return self._solver.check(module)
+        if self.timeout is not None:
+            result, solver = run_module_through_smtlib(
+                module, timeout=self.timeout, backend=self.backend
+            )
+        else:
+            result, solver = run_module_through_smtlib(module, backend=self.backend)
+        if result != z3.sat:
+            return result, None
+        return result, solver.model()  # pyright: ignore[reportUnknownMemberType]
+
+    def synthesize(self, rhs: ModuleOp) -> ModuleOp | None:
+        """
+        Synthesize the constants of an RHS program so that it refines the LHS
+        program. Returns the RHS program with its constants replaced, or None if
+        no such constants exist.
+        """
+        ctx = self.ctx
+        optimize = self.optimize
+        lhs = self._lowered_lhs.clone()
+        lhs_func_type = self._lhs_func_type
+        rhs = rhs.clone()
+        rhs_old = rhs
+        # Give a name to each synth.constant so we can track them during the pipeline.
+        name_to_synth_const = assign_names_to_synth_constants(rhs_old)
+        synth_op_to_attr_names = assign_names_to_synth_attributes(rhs_old)
+
+        rhs = rhs_old.clone()
+
+        # Move smt.synth.constant to function arguments
+        func_rhs = get_op_from_module(rhs, FuncOp)
+        assert isinstance(func_rhs, FuncOp)
+        rhs_func_type = func_rhs.function_type
+
+        # Convert the RHS module to SMTLib
+        lower_function_to_smt(rhs, ctx, optimize)
+
+        func = get_op_from_module(lhs, DefineFunOp)
+        func_rhs = get_op_from_module(rhs, DefineFunOp)
+
+        # Combine both modules into a new one
+        new_module = ModuleOp([])
+        block = new_module.body.blocks[0]
+        for op in lhs.body.ops:
+            op.detach()
+            block.add_op(op)
+        for op in rhs.body.ops:
+            op.detach()
+            block.add_op(op)
+
+        new_module.verify()
+        refinement = insert_function_refinement_with_forall(
+            func,
+            lhs_func_type,
+            func_rhs,
+            rhs_func_type,
+            InsertPoint.at_end(block),
+        )
+        block.add_op(AssertOp(refinement))
 
-    # Expand ops not supported by all SMT solvers
-    SMTExpand().apply(ctx, new_module)
+        if optimize:
+            optimize_module(ctx, new_module)
 
-    if optimize:
-        optimize_module(ctx, new_module)
-    else:
-        # Remove pairs for the last time if we did not optimize before.
-        # Without this call, some seemingly simple examples return `unknown` with z3.
-        LowerPairs().apply(ctx, new_module)
-
-    name_to_ssavalue = assign_name_hints_to_declare_const(new_module)
-
-    block.add_op(CheckSatOp())
-    if timeout is not None:
-        result, solver = run_module_through_smtlib(new_module, timeout=timeout)
-    else:
-        result, solver = run_module_through_smtlib(new_module)
-    if result != z3.sat:
-        return None
-
-    model = solver.model()
-    ssavalue_to_attr: dict[SSAValue, Attribute] = {}
-    for d in cast(list[Any], model.decls()):
-        # We remove the $ that is added when printing SMTLib
-        name = d.name()[1:]
-        attr = z3_value_to_attribute(model[d])  # type: ignore[reportUnknownMemberType]
-        ssavalue_to_attr[name_to_ssavalue[name]] = attr
-
-    name_to_from_value: dict[str, synth.FromValueOp] = {}
-    for op in new_module.walk():
-        if isinstance(op, synth.FromValueOp):
-            assert "cst_name" in op.attributes
-            assert isinstance(op.attributes["cst_name"], StringAttr)
-            name_to_from_value[op.attributes["cst_name"].data] = op
-
-    synth_const_to_values: dict[synth.ConstantOp, Any] = {}
-    for name, synth_const in name_to_synth_const.items():
-        input_value = name_to_from_value[name].input
-        value = compute_value(new_module, input_value, ssavalue_to_attr)
-        synth_const_to_values[synth_const] = value
+        move_declare_constants_at_toplevel(
+            new_module, InsertPoint.at_start(new_module.body.blocks[0])
+        )
 
-    rewriter = Rewriter()
-    for op, names in synth_op_to_attr_names:
-        assert isinstance(op.properties["op_name"], StringAttr)
-        op_class = ctx.get_op(op.properties["op_name"].data)
-        attributes : dict[str, Attribute] = {}
-        for attr_name, cst_name in names.items():
-            input_value = name_to_from_value[cst_name.data].input
+        if optimize:
+            optimize_module(ctx, new_module)
+
+        FunctionCallInline(True, {}).apply(ctx, new_module)
+        for op in new_module.body.ops:
+            if isinstance(op, DefineFunOp):
+                new_module.body.block.erase_op(op)
+
+        # Reject the program before running the rest of the pipeline if it is
+        # falsified by a concrete input.
+        if self.concrete_filter and self._inputs.refutes(new_module):
+            return None
+
+        if optimize:
+            optimize_module(ctx, new_module)
+
+        # Lower memory to arrays
+        LowerMemoryToArrayPass().apply(ctx, new_module)
+
+        if optimize:
+            optimize_module(ctx, new_module)
+
+        # Expand ops not supported by all SMT solvers
+        SMTExpand().apply(ctx, new_module)
+
+        if optimize:
+            optimize_module(ctx, new_module)
+        else:
+            # Remove pairs for the last time if we did not optimize before.
+            # Without this call, some seemingly simple examples return `unknown` with z3.
+            LowerPairs().apply(ctx, new_module)
+
+        name_to_ssavalue = assign_name_hints_to_declare_const(new_module)
+
+        block.add_op(CheckSatOp())
+        result, model = self._check(new_module)
+        if result != z3.sat:
+            return None
+        assert model is not None
+
+        ssavalue_to_attr: dict[SSAValue, Attribute] = {}
+        for d in cast(list[Any], model.decls()):
+            # We remove the $ that is added when printing SMTLib
+            name = d.name()[1:]
+            attr = z3_value_to_attribute(model[d])  # type: ignore[reportUnknownMemberType]
+            ssavalue_to_attr[name_to_ssavalue[name]] = attr
+
+        name_to_from_value: dict[str, synth.FromValueOp] = {}
+        for op in new_module.walk():
+            if isinstance(op, synth.FromValueOp):
+                assert "cst_name" in op.attributes
+                assert isinstance(op.attributes["cst_name"], StringAttr)
+                name_to_from_value[op.attributes["cst_name"].data] = op
+
+        synth_const_to_values: dict[synth.ConstantOp, Any] = {}
+        for name, synth_const in name_to_synth_const.items():
+            input_value = name_to_from_value[name].input
             value = compute_value(new_module, input_value, ssavalue_to_attr)
-            attributes[attr_name] = value
-        new_op = op_class.create(
-            operands=op.operands, 
-            result_types=op.result_types, 
-            attributes=attributes
-        )
-        rewriter.replace_op(op, new_op)
+            synth_const_to_values[synth_const] = value
+
+        rewriter = Rewriter()
+        for op, names in synth_op_to_attr_names:
+            assert isinstance(op.properties["op_name"], StringAttr)
+            op_class = ctx.get_op(op.properties["op_name"].data)
+            attributes : dict[str, Attribute] = {}
+            for attr_name, cst_name in names.items():
+                input_value = name_to_from_value[cst_name.data].input
+                value = compute_value(new_module, input_value, ssavalue_to_attr)
+                attributes[attr_name] = value
+            new_op = op_class.create(
+                operands=op.operands, 
+                result_types=op.result_types, 
+                attributes=attributes
+            )
+            rewriter.replace_op(op, new_op)
 
         
 
-    for synth_const, value in synth_const_to_values.items():
-        replace_synth_constant_with_op(synth_const, value)
+        for synth_const, value in synth_const_to_values.items():
+            replace_synth_constant_with_op(synth_const, value)
+
+        return rhs_old
 
-    return rhs_old
+
+def synthesize_constants(
+    lhs: ModuleOp,
+    rhs: ModuleOp,
+    ctx: Context,
+    optimize: bool,
+    timeout: int | None = None,
+    backend: SolverBackend | None = None,
+    cegis: bool = False,
+    concrete_filter: bool = False,
+) -> ModuleOp | None:
+    return ConstantSynthesizer(
+        lhs,
+        ctx,
+        optimize,
+        timeout,
+        backend,
+        cegis=cegis,
+        concrete_filter=concrete_filter,
+    ).synthesize(rhs)
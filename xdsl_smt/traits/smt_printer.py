@@ -1,9 +1,10 @@
 from __future__ import annotations
 from abc import abstractmethod
-from collections import deque
 
 from dataclasses import dataclass, field
-from typing import IO
+from functools import cache
+from io import StringIO
+from typing import IO, Sequence
 from xdsl.dialects.builtin import ModuleOp
 from xdsl.dialects.smt import BoolType, BitVectorType
 from xdsl.ir import OpResult, SSAValue, Operation, Attribute, OpTrait
@@ -58,11 +59,11 @@ class SimpleSMTLibOpTrait(SMTLibOpTrait):
     def print_expr_to_smtlib(
         self, op: Operation, stream: IO[str], ctx: SMTConversionCtx
     ) -> None:
-        print(f"({self.op_name}", file=stream, end="")
+        stream.write(f"({self.op_name}")
         for operand in op.operands:
-            print(" ", file=stream, end="")
+            stream.write(" ")
             ctx.print_expr_to_smtlib(operand, stream)
-        print(")", file=stream, end="")
+        stream.write(")")
 
 
 class SMTLibScriptOp(SMTLibOp):
@@ -82,11 +83,11 @@ class SimpleSMTLibOp(SMTLibOp):
 
     def print_expr_to_smtlib(self, stream: IO[str], ctx: SMTConversionCtx) -> None:
         assert isinstance(self, Operation)
-        print(f"({self.op_name()}", file=stream, end="")
+        stream.write(f"({self.op_name()}")
         for operand in self.operands:
-            print(" ", file=stream, end="")
+            stream.write(" ")
             ctx.print_expr_to_smtlib(operand, stream)
-        print(")", file=stream, end="")
+        stream.write(")")
 
     @abstractmethod
     def op_name(self) -> str:
@@ -136,9 +137,18 @@ class SMTConversionCtx:
         Get the order in which the let bindings should be introduced for the
         transitive uses of the value parent.
         """
-        # The stack of values to add. The leftmost value is the value we are
-        # currently considering to add
-        stack: deque[SSAValue] = deque(op.operands)
+        return self._shared_values_topo_sort(op.operands)
+
+    def _shared_values_topo_sort(self, values: Sequence[SSAValue]) -> list[SSAValue]:
+        """
+        Get the values with more than one use that the given values transitively
+        depend on, such that each value comes after its dependencies.
+        Values that already have a name are not traversed.
+        """
+        # The stack of values to visit, with a flag set once the operands of
+        # the value have been pushed. The given values are visited in order,
+        # while the operands of a value are visited from last to first.
+        stack = [(value, False) for value in reversed(values)]
 
         # The values we need to add in order, and the set of values that we have
         # already processed and that do not need to be added anymore
@@ -146,33 +156,27 @@ class SMTConversionCtx:
         processed = set[SSAValue]()
 
         while stack:
-            val = stack[0]
-
-            # If the value is a variable, we don't need to add it as a let binding.
-            if val in self.value_to_name.keys():
-                stack.popleft()
-                processed.add(val)
-                continue
+            val, expanded = stack.pop()
 
             # If the value is processed, we can continue.
             if val in processed:
-                stack.popleft()
                 continue
 
-            # We get the operands of the value owner.
-            assert isinstance(val.owner, Operation)
-            operands_to_add = [
-                operand for operand in val.owner.operands if operand not in processed
-            ]
-
-            # If there are still unprocessed operands, we should process them first.
-            if operands_to_add:
-                for operand in operands_to_add:
-                    stack.appendleft(operand)
+            # If the value is a variable, we don't need to add it as a let binding.
+            if val in self.value_to_name:
+                processed.add(val)
                 continue
 
-            # Process the value
-            stack.popleft()
+            # The operands of the value owner should be processed first.
+            if not expanded:
+                assert isinstance(val.owner, Operation)
+                stack.append((val, True))
+                stack.extend(
+                    (operand, False)
+                    for operand in val.owner.operands
+                    if operand not in processed
+                )
+                continue
 
             # Otherwise, we add it to the let binding if they have more than one use
             if val.has_more_than_one_use():
@@ -181,6 +185,28 @@ class SMTConversionCtx:
 
         return let_values
 
+    def hoist_shared_exprs(self, op: Operation, stream: IO[str]) -> None:
+        """
+        Print a `define-fun` without arguments for each top-level expression
+        used more than once that the operation depends on, so that they are
+        referred to by name instead of being bound again in each expression.
+        """
+        parent = op.parent_block()
+        roots = [
+            operand
+            for nested_op in op.walk()
+            for operand in nested_op.operands
+            if isinstance(operand, OpResult) and operand.op.parent_block() is parent
+        ]
+        for val in self._shared_values_topo_sort(roots):
+            name = self.get_fresh_name(val.name_hint)
+            stream.write(f"(define-fun {name} () ")
+            self.print_sort_to_smtlib(val.type, stream)
+            stream.write("\n  ")
+            self.print_expr_to_smtlib(val, stream, identation="  ")
+            stream.write(")\n")
+            self.value_to_name[val] = name
+
     def print_expr_to_smtlib(
         self, val: SSAValue, stream: IO[str], identation: str = ""
     ) -> None:
@@ -188,7 +214,7 @@ class SMTConversionCtx:
         Print the SSA value expression in the SMTLib format.
         """
         if val in self.value_to_name.keys():
-            print(self.value_to_name[val], file=stream, end="")
+            stream.write(self.value_to_name[val])
             return
 
         # First, get all the values we are going to put in let bindings
@@ -198,18 +224,18 @@ class SMTConversionCtx:
         for idx, let_value in enumerate(let_values):
             name = self.get_fresh_name(let_value)
             if idx != 0:
-                print(identation, file=stream, end="")
-            print(f"(let (({name} ", file=stream, end="")
+                stream.write(identation)
+            stream.write(f"(let (({name} ")
             if isinstance(let_value.owner, SMTLibOp):
                 let_value.owner.print_expr_to_smtlib(stream, self)
             else:
                 assert isinstance(let_value.owner, Operation)
                 assert (trait := let_value.owner.get_trait(SMTLibOpTrait)) is not None
                 trait.print_expr_to_smtlib(let_value.owner, stream, self)
-            print(")) ", file=stream)
+            stream.write(")) \n")
 
         if let_values:
-            print(identation, file=stream, end="")
+            stream.write(identation)
         if isinstance(val.op, SMTLibOp):
             val.op.print_expr_to_smtlib(stream, self)
         else:
@@ -217,37 +243,53 @@ class SMTConversionCtx:
             assert (trait := val.op.get_trait(SMTLibOpTrait)) is not None
             trait.print_expr_to_smtlib(val.op, stream, self)
 
-        print(")" * len(let_values), file=stream, end="")
+        stream.write(")" * len(let_values))
         for let_value in let_values:
             self.names.remove(self.value_to_name[let_value])
             del self.value_to_name[let_value]
 
     @staticmethod
     def print_sort_to_smtlib(attr: Attribute, stream: IO[str]):
-        if isinstance(attr, SMTLibSort):
-            attr.print_sort_to_smtlib(stream)
-            return
-        if isinstance(attr, BoolType):
-            print("Bool", file=stream, end="")
-            return
-        if isinstance(attr, BitVectorType):
-            print(f"(_ BitVec {attr.width.data})", file=stream, end="")
-            return
-        raise Exception(f"Unknown SMT-LIB sort: {attr}")
-
-
-def print_to_smtlib(module: ModuleOp, stream: IO[str]) -> None:
+        stream.write(_sort_to_smtlib(attr))
+
+
+@cache
+def _sort_to_smtlib(attr: Attribute) -> str:
+    """Get the SMTLib representation of a sort, which is cached per attribute."""
+    if isinstance(attr, SMTLibSort):
+        stream = StringIO()
+        attr.print_sort_to_smtlib(stream)
+        return stream.getvalue()
+    if isinstance(attr, BoolType):
+        return "Bool"
+    if isinstance(attr, BitVectorType):
+        return f"(_ BitVec {attr.width.data})"
+    raise Exception(f"Unknown SMT-LIB sort: {attr}")
+
+
+def print_to_smtlib(
+    module: ModuleOp, stream: IO[str], hoist_shared: bool = False
+) -> None:
     """
     Print a program to its SMTLib representation.
+    The program is printed to a buffer first, which is then written to the
+    stream at once.
+
+    If `hoist_shared` is set, the top-level expressions that are used more than
+    once are printed once as `define-fun`s, before the first script operation
+    using them. Otherwise, they are bound with a `let` in each expression.
     """
+    buffer = StringIO()
     ctx = SMTConversionCtx()
     # We use this hack for now
     # TODO: check for usage of pairs in the program to not always print this.
-    print(
-        "(declare-datatypes ((Pair 2)) ((par (X Y) ((pair (first X) (second Y))))))",
-        file=stream,
+    buffer.write(
+        "(declare-datatypes ((Pair 2)) ((par (X Y) ((pair (first X) (second Y))))))\n"
     )
     for op in module.ops:
         if isinstance(op, SMTLibScriptOp):
-            op.print_expr_to_smtlib(stream, ctx)
+            if hoist_shared:
+                ctx.hoist_shared_exprs(op, buffer)
+            op.print_expr_to_smtlib(buffer, ctx)
             continue
+    stream.write(buffer.getvalue())
@@ -0,0 +1,410 @@
+"""
+Translation of SMT programs to z3 expressions, without printing and parsing
+SMT-LIB.
+
+Each SSA value is translated once, so expressions shared between several uses
+are only built once. Constants and functions are given the same names as
+`print_to_smtlib` would give them, so that models can be read in the same way.
+"""
+
+from __future__ import annotations
+
+import operator
+from dataclasses import dataclass, field
+from typing import Any, Callable, cast
+
+import z3  # pyright: ignore[reportMissingTypeStubs]
+
+from xdsl.dialects.builtin import FunctionType, ModuleOp
+from xdsl.ir import Attribute, Operation, SSAValue
+
+from xdsl_smt.dialects import smt_bitvector_dialect as smt_bv
+from xdsl_smt.dialects import smt_int_dialect as smt_int
+from xdsl_smt.dialects.smt_array_dialect import ArrayType
+from xdsl_smt.dialects.smt_bitvector_dialect import BitVectorType
+from xdsl_smt.dialects.smt_dialect import (
+    AssertOp,
+    BoolType,
+    CallOp,
+    CheckSatOp,
+    ConstantBoolOp,
+    DeclareConstOp,
+    DeclareFunOp,
+    DefineFunOp,
+    EvalOp,
+    ExistsOp,
+    ForallOp,
+)
+from xdsl_smt.dialects.smt_utils_dialect import PairType
+from xdsl_smt.traits.smt_printer import (
+    SimpleSMTLibOp,
+    SimpleSMTLibOpTrait,
+    SMTConversionCtx,
+)
+
+Z3Expr = Any
+
+
+class Z3TranslationError(Exception):
+    """Raised when a program uses an operation or sort with no z3 translation."""
+
+
+def _bv_overflow(no_overflow: Callable[..., Z3Expr]) -> Callable[..., Z3Expr]:
+    return lambda *args: z3.Not(no_overflow(*args))  # pyright: ignore
+
+
+def _bv_uadd_no_overflow(lhs: Z3Expr, rhs: Z3Expr) -> Z3Expr:
+    return z3.BVAddNoOverflow(lhs, rhs, False)  # pyright: ignore
+
+
+def _bv_sadd_no_overflow(lhs: Z3Expr, rhs: Z3Expr) -> Z3Expr:
+    no_overflow = z3.BVAddNoOverflow(lhs, rhs, True)  # pyright: ignore
+    no_underflow = z3.BVAddNoUnderflow(lhs, rhs)  # pyright: ignore
+    return z3.And(no_overflow, no_underflow)  # pyright: ignore
+
+
+def _bv_usub_no_underflow(lhs: Z3Expr, rhs: Z3Expr) -> Z3Expr:
+    return z3.BVSubNoUnderflow(lhs, rhs, False)  # pyright: ignore
+
+
+def _bv_ssub_no_overflow(lhs: Z3Expr, rhs: Z3Expr) -> Z3Expr:
+    no_overflow = z3.BVSubNoOverflow(lhs, rhs)  # pyright: ignore
+    no_underflow = z3.BVSubNoUnderflow(lhs, rhs, True)  # pyright: ignore
+    return z3.And(no_overflow, no_underflow)  # pyright: ignore
+
+
+def _bv_umul_no_overflow(lhs: Z3Expr, rhs: Z3Expr) -> Z3Expr:
+    return z3.BVMulNoOverflow(lhs, rhs, False)  # pyright: ignore
+
+
+def _bv_smul_no_overflow(lhs: Z3Expr, rhs: Z3Expr) -> Z3Expr:
+    return z3.BVMulNoOverflow(lhs, rhs, True)  # pyright: ignore
+
+
+def _bv_smul_no_overflow_or_underflow(lhs: Z3Expr, rhs: Z3Expr) -> Z3Expr:
+    no_overflow = _bv_smul_no_overflow(lhs, rhs)
+    no_underflow = z3.BVMulNoUnderflow(lhs, rhs)  # pyright: ignore
+    return z3.And(no_overflow, no_underflow)  # pyright: ignore
+
+
+def _bv_nand(lhs: Z3Expr, rhs: Z3Expr) -> Z3Expr:
+    return ~(lhs & rhs)
+
+
+def _bv_nor(lhs: Z3Expr, rhs: Z3Expr) -> Z3Expr:
+    return ~(lhs | rhs)
+
+
+def _bv_xnor(lhs: Z3Expr, rhs: Z3Expr) -> Z3Expr:
+    return ~(lhs ^ rhs)
+
+
+def _int_sub(*args: Z3Expr) -> Z3Expr:
+    return -args[0] if len(args) == 1 else args[0] - args[1]
+
+
+_SIMPLE_OPS: dict[str, Callable[..., Z3Expr]] = {
+    # Core theory
+    "not": z3.Not,  # pyright: ignore[reportUnknownMemberType]
+    "=>": z3.Implies,  # pyright: ignore[reportUnknownMemberType]
+    "and": z3.And,  # pyright: ignore[reportUnknownMemberType]
+    "or": z3.Or,  # pyright: ignore[reportUnknownMemberType]
+    "xor": z3.Xor,  # pyright: ignore[reportUnknownMemberType]
+    "=": operator.eq,
+    "distinct": z3.Distinct,  # pyright: ignore[reportUnknownMemberType]
+    "ite": z3.If,  # pyright: ignore[reportUnknownMemberType]
+    # Bitvectors
+    "bvneg": operator.neg,
+    "bvadd": operator.add,
+    "bvsub": operator.sub,
+    "bvmul": operator.mul,
+    "bvurem": z3.URem,  # pyright: ignore[reportUnknownMemberType]
+    "bvsrem": z3.SRem,  # pyright: ignore[reportUnknownMemberType]
+    "bvsmod": operator.mod,
+    "bvshl": operator.lshift,
+    "bvlshr": z3.LShR,  # pyright: ignore[reportUnknownMemberType]
+    "bvashr": operator.rshift,
+    "bvudiv": z3.UDiv,  # pyright: ignore[reportUnknownMemberType]
+    "bvsdiv": operator.truediv,
+    "bvnot": operator.invert,
+    "bvor": operator.or_,
+    "bvxor": operator.xor,
+    "bvand": operator.and_,
+    "bvnand": _bv_nand,
+    "bvnor": _bv_nor,
+    "bvxnor": _bv_xnor,
+    "bvule": z3.ULE,  # pyright: ignore[reportUnknownMemberType]
+    "bvult": z3.ULT,  # pyright: ignore[reportUnknownMemberType]
+    "bvuge": z3.UGE,  # pyright: ignore[reportUnknownMemberType]
+    "bvugt": z3.UGT,  # pyright: ignore[reportUnknownMemberType]
+    "bvsle": operator.le,
+    "bvslt": operator.lt,
+    "bvsge": operator.ge,
+    "bvsgt": operator.gt,
+    "bvnego": _bv_overflow(z3.BVSNegNoOverflow),  # pyright: ignore
+    "bvuaddo": _bv_overflow(_bv_uadd_no_overflow),
+    "bvsaddo": _bv_overflow(_bv_sadd_no_overflow),
+    "bvusubo": _bv_overflow(_bv_usub_no_underflow),
+    "bvssubo": _bv_overflow(_bv_ssub_no_overflow),
+    "bvumulo": _bv_overflow(_bv_umul_no_overflow),
+    "bvsmulo": _bv_overflow(_bv_smul_no_overflow_or_underflow),
+    "bvumul_noovfl": _bv_umul_no_overflow,
+    "bvsmul_noovfl": _bv_smul_no_overflow,
+    "bvsmul_noudfl": z3.BVMulNoUnderflow,  # pyright: ignore[reportUnknownMemberType]
+    "concat": z3.Concat,  # pyright: ignore[reportUnknownMemberType]
+    # Integers
+    "+": z3.Sum,  # pyright: ignore[reportUnknownMemberType]
+    "-": _int_sub,
+    "*": z3.Product,  # pyright: ignore[reportUnknownMemberType]
+    "div": operator.truediv,
+    "mod": operator.mod,
+    "abs": z3.Abs,  # pyright: ignore[reportUnknownMemberType]
+    "<=": operator.le,
+    "<": operator.lt,
+    ">=": operator.ge,
+    ">": operator.gt,
+    # Arrays
+    "select": z3.Select,  # pyright: ignore[reportUnknownMemberType]
+    "store": z3.Store,  # pyright: ignore[reportUnknownMemberType]
+}
+"""The z3 constructors of the operations printed as `(op_name args...)`."""
+
+
+@dataclass
+class _Macro:
+    """A function defined with `define-fun`, which is inlined at each call."""
+
+    args: list[Z3Expr]
+    body: Z3Expr
+
+    def __call__(self, *args: Z3Expr) -> Z3Expr:
+        return z3.substitute(  # pyright: ignore[reportUnknownMemberType]
+            self.body, *zip(self.args, args)
+        )
+
+
+@dataclass
+class Z3Translator:
+    """Translate the values of an SMT program to z3 expressions."""
+
+    ctx: z3.Context
+    names: SMTConversionCtx = field(default_factory=SMTConversionCtx)
+    values: dict[SSAValue, Z3Expr] = field(default_factory=dict[SSAValue, Z3Expr])
+    sorts: dict[Attribute, Any] = field(default_factory=dict[Attribute, Any])
+    """
+    The z3 sorts of the types. Translators using the same z3 context should
+    share them, so that datatypes are not declared twice with the same name.
+    """
+
+    def sort(self, attr: Attribute) -> Any:
+        """Get the z3 sort of a type."""
+        if attr in self.sorts:
+            return self.sorts[attr]
+        sort: Any
+        if isinstance(attr, BoolType):
+            sort = z3.BoolSort(self.ctx)  # pyright: ignore[reportUnknownMemberType]
+        elif isinstance(attr, BitVectorType):
+            sort = z3.BitVecSort(  # pyright: ignore[reportUnknownMemberType]
+                attr.width.data, self.ctx
+            )
+        elif isinstance(attr, smt_int.SMTIntType):
+            sort = z3.IntSort(self.ctx)  # pyright: ignore[reportUnknownMemberType]
+        elif isinstance(attr, ArrayType):
+            attr = cast(ArrayType[Attribute, Attribute], attr)
+            domain, range = self.sort(attr.domain), self.sort(attr.range)
+            sort = z3.ArraySort(  # pyright: ignore[reportUnknownMemberType]
+                domain, range
+            )
+        elif isinstance(attr, PairType):
+            attr = cast(PairType[Attribute, Attribute], attr)
+            # z3 has no parametric datatypes, so each instance of Pair is a
+            # separate datatype, which needs a distinct name. The element sorts
+            # are created first, as they may be pairs themselves.
+            first = self.sort(attr.first)
+            second = self.sort(attr.second)
+            pair = z3.Datatype(f"Pair{len(self.sorts)}", self.ctx)
+            pair.declare(  # pyright: ignore[reportUnknownMemberType]
+                "pair", ("first", first), ("second", second)
+            )
+            sort = pair.create()
+        else:
+            raise Z3TranslationError(f"Cannot translate sort {attr} to z3")
+        self.sorts[attr] = sort
+        return sort
+
+    def declare(self, value: SSAValue) -> Z3Expr:
+        """Declare a fresh constant for a value."""
+        name = self.names.get_fresh_name(value)
+        const = z3.Const(  # pyright: ignore[reportUnknownMemberType]
+            name, self.sort(value.type)
+        )
+        self.values[value] = const
+        return const
+
+    def _dependencies(self, op: Operation) -> list[SSAValue]:
+        """
+        Get the values needed to translate an operation. The bound variables
+        of quantifiers are declared when the quantifier is first visited.
+        """
+        if isinstance(op, ForallOp | ExistsOp):
+            for arg in op.body.block.args:
+                if arg not in self.values:
+                    self.declare(arg)
+            return [op.returned_value]
+        return list(op.operands)
+
+    def _translate_op(self, op: Operation, operands: list[Z3Expr]) -> Z3Expr:
+        if isinstance(op, SimpleSMTLibOp):
+            op_name = op.op_name()
+        elif (trait := op.get_trait(SimpleSMTLibOpTrait)) is not None:
+            op_name = trait.op_name
+        else:
+            op_name = None
+        if op_name is not None and op_name in _SIMPLE_OPS:
+            return _SIMPLE_OPS[op_name](*operands)
+        if op_name in ("pair", "first", "second"):
+            pair_type = (op.results[0] if op_name == "pair" else op.operands[0]).type
+            pair = self.sort(pair_type)
+            if op_name == "pair":
+                return pair.pair(*operands)
+            return getattr(pair, op_name)(operands[0])
+
+        match op:
+            case ConstantBoolOp():
+                return z3.BoolVal(  # pyright: ignore[reportUnknownMemberType]
+                    bool(op.value), self.ctx
+                )
+            case smt_bv.ConstantOp():
+                value, width = op.value.value.data, op.value.type.width.data
+                return z3.BitVecVal(  # pyright: ignore[reportUnknownMemberType]
+                    value, width, self.ctx
+                )
+            case smt_int.ConstantOp():
+                return z3.IntVal(  # pyright: ignore[reportUnknownMemberType]
+                    op.value.value.data, self.ctx
+                )
+            case smt_bv.ExtractOp():
+                return z3.Extract(  # pyright: ignore[reportUnknownMemberType]
+                    op.end.data, op.start.data, operands[0]
+                )
+            case smt_bv.RepeatOp():
+                return z3.RepeatBitVec(  # pyright: ignore[reportUnknownMemberType]
+                    op.count.data, operands[0]
+                )
+            case smt_bv.ZeroExtendOp() | smt_bv.SignExtendOp():
+                assert isinstance(op.res.type, BitVectorType)
+                assert isinstance(op.operand.type, BitVectorType)
+                extension = op.res.type.width.data - op.operand.type.width.data
+                if isinstance(op, smt_bv.ZeroExtendOp):
+                    return z3.ZeroExt(  # pyright: ignore[reportUnknownMemberType]
+                        extension, operands[0]
+                    )
+                return z3.SignExt(  # pyright: ignore[reportUnknownMemberType]
+                    extension, operands[0]
+                )
+            case ForallOp() | ExistsOp():
+                bound = [self.values[arg] for arg in op.body.block.args]
+                if isinstance(op, ForallOp):
+                    return z3.ForAll(bound, operands[0])  # pyright: ignore
+                return z3.Exists(bound, operands[0])  # pyright: ignore
+            case CallOp():
+                if len(op.res) != 1:
+                    raise Z3TranslationError("Cannot translate calls with many results")
+                func, *args = operands
+                return func(*args) if args else func
+            case _:
+                raise Z3TranslationError(f"Cannot translate {op.name} to z3")
+
+    def translate(self, value: SSAValue) -> Z3Expr:
+        """
+        Translate a value to a z3 expression. The operations are visited in
+        post-order with an explicit stack, so deep expressions do not hit the
+        recursion limit.
+        """
+        stack = [value]
+        while stack:
+            val = stack[-1]
+            if val in self.values:
+                stack.pop()
+                continue
+            op = val.owner
+            if not isinstance(op, Operation):
+                raise Z3TranslationError(f"Value {val} is not defined")
+            missing = [dep for dep in self._dependencies(op) if dep not in self.values]
+            if missing:
+                stack.extend(reversed(missing))
+                continue
+            stack.pop()
+            operands = [self.values[dep] for dep in self._dependencies(op)]
+            self.values[val] = self._translate_op(op, operands)
+        return self.values[value]
+
+    def translate_script_op(self, op: Operation) -> Z3Expr | None:
+        """
+        Translate a top-level operation of an SMT program. Returns the asserted
+        expression for `smt.assert`, and `None` for other operations. As in
+        `print_to_smtlib`, operations that are not script operations are
+        ignored.
+        """
+        match op:
+            case DeclareConstOp():
+                self.declare(op.res)
+            case DeclareFunOp():
+                func_type = op.ret.type
+                assert isinstance(func_type, FunctionType)
+                name = self.names.get_fresh_name(
+                    op.fun_name.data if op.fun_name is not None else op.ret
+                )
+                self.names.value_to_name[op.ret] = name
+                domain = [self.sort(ty) for ty in func_type.inputs.data]
+                (result,) = func_type.outputs.data
+                range = self.sort(result)
+                if domain:
+                    self.values[
+                        op.ret
+                    ] = z3.Function(  # pyright: ignore[reportUnknownMemberType]
+                        name, *domain, range
+                    )
+                else:
+                    self.values[
+                        op.ret
+                    ] = z3.Const(  # pyright: ignore[reportUnknownMemberType]
+                        name, range
+                    )
+            case DefineFunOp():
+                if op.fun_name is not None:
+                    name = self.names.get_fresh_name(op.fun_name.data)
+                    self.names.value_to_name[op.ret] = name
+                else:
+                    self.names.get_fresh_name(op.ret)
+                args = [self.declare(arg) for arg in op.body.block.args]
+                (return_value,) = op.return_values
+                body = self.translate(return_value)
+                self.values[op.ret] = _Macro(args, body) if args else body
+            case AssertOp():
+                return self.translate(op.op)
+            case CheckSatOp():
+                pass
+            case EvalOp():
+                raise Z3TranslationError(f"Cannot translate {op.name} to z3")
+            case _:
+                # Expressions are translated when they are asserted.
+                pass
+        return None
+
+
+def module_to_z3(
+    module: ModuleOp, ctx: z3.Context, sorts: dict[Attribute, Any] | None = None
+) -> list[Z3Expr]:
+    """
+    Translate an SMT program to the list of its assertions as z3 expressions.
+    Raises `Z3TranslationError` if the program uses unsupported operations.
+    `sorts` are the sorts already declared in the context by previous
+    translations.
+    """
+    translator = Z3Translator(ctx, sorts=sorts if sorts is not None else {})
+    assertions: list[Z3Expr] = []
+    for op in module.ops:
+        if (assertion := translator.translate_script_op(op)) is not None:
+            assertions.append(assertion)
+    return assertions
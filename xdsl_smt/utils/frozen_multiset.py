@@ -19,7 +19,7 @@ class FrozenMultiset(Generic[T]):
                 items[value] += 1
             else:
                 items[value] = 1
-        return FrozenMultiset[T](frozenset(items.items()))
+        return FrozenMultiset(frozenset(items.items()))
 
     def __repr__(self) -> str:
         items: list[T] = []
@@ -1,3 +1,4 @@
+from enum import Enum
 from typing import Any
 from io import StringIO
 import sys
@@ -5,35 +6,153 @@ import sys
 import z3  # pyright: ignore[reportMissingTypeStubs]
 
 from xdsl.dialects.builtin import ModuleOp
+from xdsl.ir import Attribute
 
 from xdsl_smt.traits.smt_printer import print_to_smtlib
+from xdsl_smt.utils.dialect_to_z3 import Z3TranslationError, module_to_z3
+from xdsl_smt.utils.smt_query_cache import get_query_cache
 
 
-def run_module_through_smtlib(
-    module: ModuleOp, timeout: int = 1000
-) -> tuple[Any, z3.Solver]:
+class SolverBackend(Enum):
+    """How SMT programs are passed to z3."""
+
+    SMTLIB = "smtlib"
+    """Print the program to SMT-LIB, and let z3 parse it."""
+
+    Z3 = "z3"
+    """Build the z3 expressions directly from the program."""
+
+    def __str__(self):
+        return self.value
+
+
+_default_backend = SolverBackend.SMTLIB
+
+
+def set_solver_backend(backend: SolverBackend) -> None:
+    """Set the backend used by `run_module_through_smtlib` by default."""
+    global _default_backend
+    _default_backend = backend
+
+
+def _print_smtlib(module: ModuleOp) -> str:
     smtlib_program = StringIO()
     print_to_smtlib(module, smtlib_program)
+    return smtlib_program.getvalue()
+
+
+def run_module_through_smtlib(
+    module: ModuleOp, timeout: int = 1000, backend: SolverBackend | None = None
+) -> tuple[Any, z3.Solver]:
+    """
+    Check the satisfiability of an SMT program with z3. With the `Z3` backend,
+    programs that cannot be translated directly are passed as SMT-LIB.
+    """
+    if backend is None:
+        backend = _default_backend
+
+    # Reuse the result of a previous run of the same query if possible.
+    query_cache = get_query_cache()
+    smtlib_program: str | None = None
+    if query_cache is not None:
+        smtlib_program = _print_smtlib(module)
+        cached = query_cache.lookup(smtlib_program, timeout)
+        if cached is not None:
+            return cached
 
-    # Parse the SMT-LIB program and run it through the Z3 solver.
     ctx = z3.Context()
     solver = z3.Solver(ctx=ctx)
     # Set the timeout
     solver.set("timeout", timeout)  # pyright: ignore[reportUnknownMemberType]
-    try:
-        solver.from_string(  # pyright: ignore[reportUnknownMemberType]
-            smtlib_program.getvalue()
-        )
+
+    assertions: list[Any] | None = None
+    if backend == SolverBackend.Z3:
+        try:
+            assertions = module_to_z3(module, ctx)
+        except Z3TranslationError:
+            # Fall back to SMT-LIB.
+            pass
+
+    if assertions is not None:
+        solver.add(*assertions)  # pyright: ignore[reportUnknownMemberType]
         result = solver.check()  # pyright: ignore[reportUnknownMemberType]
-    except z3.z3types.Z3Exception as e:
-        print(
-            e.value.decode(  # pyright: ignore[reportUnknownMemberType, reportUnknownArgumentType]
-                "UTF-8"
-            ),
-            end="",
-            file=sys.stderr,
-        )
-        print("The above error happened with the following query:", file=sys.stderr)
-        print(smtlib_program.getvalue(), file=sys.stderr)
-        raise e
+    else:
+        if smtlib_program is None:
+            smtlib_program = _print_smtlib(module)
+        # Parse the SMT-LIB program and run it through the Z3 solver.
+        try:
+            solver.from_string(  # pyright: ignore[reportUnknownMemberType]
+                smtlib_program
+            )
+            result = solver.check()  # pyright: ignore[reportUnknownMemberType]
+        except z3.z3types.Z3Exception as e:
+            print(
+                e.value.decode(  # pyright: ignore[reportUnknownMemberType, reportUnknownArgumentType]
+                    "UTF-8"
+                ),
+                end="",
+                file=sys.stderr,
+            )
+            print("The above error happened with the following query:", file=sys.stderr)
+            print(smtlib_program, file=sys.stderr)
+            raise e
+
+    if query_cache is not None:
+        assert smtlib_program is not None
+        query_cache.store(smtlib_program, timeout, result, solver)
     return result, solver
+
+
+class IncrementalSolver:
+    """
+    A z3 solver checking successive SMT programs. The programs are translated
+    directly to z3 expressions in the same context, and each one is checked in
+    its own scope, so the solver and the declared sorts are reused.
+    Programs that cannot be translated, or that are found in the query cache,
+    are checked with `run_module_through_smtlib` instead.
+    """
+
+    ctx: z3.Context
+    solver: z3.Solver
+    timeout: int
+    _sorts: dict[Attribute, Any]
+
+    def __init__(self, timeout: int = 1000):
+        self.ctx = z3.Context()
+        self.solver = z3.Solver(ctx=self.ctx)
+        self.solver.set("timeout", timeout)  # pyright: ignore[reportUnknownMemberType]
+        self.timeout = timeout
+        self._sorts = {}
+
+    def check(self, module: ModuleOp) -> tuple[Any, Any | None]:
+        """
+        Check the satisfiability of an SMT program. Returns the result, and the
+        model if the program is satisfiable.
+        """
+        assertions: list[Any] | None = None
+        if get_query_cache() is None:
+            try:
+                assertions = module_to_z3(module, self.ctx, self._sorts)
+            except Z3TranslationError:
+                pass
+
+        if assertions is None:
+            result, solver = run_module_through_smtlib(
+                module, self.timeout, SolverBackend.SMTLIB
+            )
+            if result != z3.sat:
+                return result, None
+            return result, solver.model()  # pyright: ignore[reportUnknownMemberType]
+
+        self.solver.push()
+        try:
+            self.solver.add(*assertions)  # pyright: ignore[reportUnknownMemberType]
+            result = self.solver.check()  # pyright: ignore[reportUnknownMemberType]
+            model = (
+                self.solver.model()  # pyright: ignore[reportUnknownMemberType]
+                if result == z3.sat
+                else None
+            )
+        finally:
+            self.solver.pop()
+        return result, model
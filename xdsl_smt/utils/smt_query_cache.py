@@ -0,0 +1,164 @@
+"""
+A persistent cache of SMT query results, shared between runs and processes.
+
+Queries are identified by the SHA-256 hash of their SMT-LIB representation,
+after alpha-renaming of the declared names. The cache stores whether the query
+was `sat`, `unsat`, or `unknown`, and the model of satisfiable queries, in an
+SQLite database.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from typing import Any
+
+import z3  # pyright: ignore[reportMissingTypeStubs]
+
+_NAME_RE = re.compile(r"\$[^\s()|]+")
+
+_RESULTS: dict[str, Any] = {
+    "sat": z3.sat,
+    "unsat": z3.unsat,
+    "unknown": z3.unknown,
+}
+
+
+def canonicalize_smtlib(query: str) -> tuple[str, list[str]]:
+    """
+    Alpha-rename the names introduced by the SMT-LIB printer, in order of first
+    occurrence. Returns the renamed query, and the original names, where the
+    i-th name is renamed to `$i`.
+    """
+    names: dict[str, str] = {}
+
+    def rename(match: re.Match[str]) -> str:
+        name = match.group(0)
+        if name not in names:
+            names[name] = f"${len(names)}"
+        return names[name]
+
+    return _NAME_RE.sub(rename, query), list(names.keys())
+
+
+def _serialize_model(model: Any, names: list[str]) -> str | None:
+    """
+    Serialize the model as a list of (renamed constant, value) pairs. Returns
+    `None` if the model contains uninterpreted functions, which cannot be
+    replayed as simple assertions.
+    """
+    renaming = {name: f"${i}" for i, name in enumerate(names)}
+    entries: list[tuple[str, str]] = []
+    for decl in model.decls():
+        if decl.arity() != 0 or decl.name() not in renaming:
+            return None
+        entries.append((renaming[decl.name()], model[decl].sexpr()))
+    return json.dumps(entries)
+
+
+class SMTQueryCache:
+    """
+    An SQLite-backed cache of SMT query results. A separate connection is
+    opened in each process, so the cache can be used from `multiprocessing`
+    workers.
+    """
+
+    path: str
+    _connection: sqlite3.Connection | None
+    _pid: int | None
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection = None
+        self._pid = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=60)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS queries ("
+                "hash TEXT PRIMARY KEY, result TEXT, model TEXT, timeout INTEGER)"
+            )
+            connection.commit()
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    def lookup(self, query: str, timeout: int) -> tuple[Any, z3.Solver] | None:
+        """
+        Returns the cached result of an SMT-LIB query, and a solver containing
+        the query. For satisfiable queries, the solver is constrained by the
+        cached model so that `solver.model()` returns it without solving the
+        query again. `unknown` results are only reused if they were obtained
+        with a timeout at least as large as the given one.
+        """
+        canonical, names = canonicalize_smtlib(query)
+        key = hashlib.sha256(canonical.encode()).hexdigest()
+        row = self.connection.execute(
+            "SELECT result, model, timeout FROM queries WHERE hash = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        result, model, cached_timeout = row
+        if result == "unknown" and cached_timeout < timeout:
+            return None
+
+        ctx = z3.Context()
+        solver = z3.Solver(ctx=ctx)
+        solver.set("timeout", timeout)  # pyright: ignore[reportUnknownMemberType]
+        if result != "sat":
+            solver.from_string(query)  # pyright: ignore[reportUnknownMemberType]
+            return _RESULTS[result], solver
+
+        # Replay the model by constraining every constant to its value.
+        replay = [query]
+        for name, value in json.loads(model):
+            replay.append(f"(assert (= {names[int(name[1:])]} {value}))")
+        try:
+            solver.from_string(  # pyright: ignore[reportUnknownMemberType]
+                "\n".join(replay)
+            )
+            if solver.check() != z3.sat:  # pyright: ignore[reportUnknownMemberType]
+                return None
+        except z3.z3types.Z3Exception:
+            return None
+        return z3.sat, solver
+
+    def store(self, query: str, timeout: int, result: Any, solver: z3.Solver) -> None:
+        """Store the result of an SMT-LIB query solved by `solver`."""
+        canonical, names = canonicalize_smtlib(query)
+        key = hashlib.sha256(canonical.encode()).hexdigest()
+        model: str | None = None
+        if result == z3.sat:
+            model = _serialize_model(
+                solver.model(), names  # pyright: ignore[reportUnknownMemberType]
+            )
+            if model is None:
+                return
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO queries VALUES (?, ?, ?, ?)",
+                (key, str(result), model, timeout),
+            )
+
+
+_query_cache: SMTQueryCache | None = None
+
+
+def set_query_cache(path: str | None) -> None:
+    """
+    Set the file used to cache the results of `run_module_through_smtlib`,
+    or disable the cache if `None` is given.
+    """
+    global _query_cache
+    _query_cache = SMTQueryCache(path) if path is not None else None
+
+
+def get_query_cache() -> SMTQueryCache | None:
+    """Returns the cache used by `run_module_through_smtlib`, if any."""
+    return _query_cache
@@ -0,0 +1,91 @@
+"""
+A long-lived SMT solver process answering successive SMT-LIB queries.
+
+Starting a solver process for every query pays for the solver start-up each
+time, which dominates the runtime of tools issuing many small queries. The
+`SMTSolverService` keeps a single `z3 -in` process alive, and separates
+queries with `(reset)`.
+"""
+
+from __future__ import annotations
+
+import os
+import subprocess as sp
+from typing import Sequence
+
+_END_OF_QUERY_MARKER = "xdsl-smt-end-of-query"
+
+
+class SMTSolverService:
+    """
+    A persistent SMT solver process reading SMT-LIB queries from its stdin.
+    The process is restarted if it terminates unexpectedly.
+    """
+
+    command: tuple[str, ...]
+    _process: sp.Popen[str] | None
+
+    def __init__(self, command: Sequence[str] = ("z3", "-in")):
+        self.command = tuple(command)
+        self._process = None
+
+    @property
+    def process(self) -> sp.Popen[str]:
+        if self._process is None or self._process.poll() is not None:
+            self._process = sp.Popen(
+                self.command,
+                stdin=sp.PIPE,
+                stdout=sp.PIPE,
+                stderr=sp.STDOUT,
+                text=True,
+            )
+        return self._process
+
+    def _send(self, script: str) -> str:
+        """Send a script to the solver, and return everything it printed."""
+        process = self.process
+        assert process.stdin is not None and process.stdout is not None
+        process.stdin.write(f'{script}\n(echo "{_END_OF_QUERY_MARKER}")\n')
+        process.stdin.flush()
+
+        output = list[str]()
+        while (line := process.stdout.readline()) != f"{_END_OF_QUERY_MARKER}\n":
+            if not line:
+                self.close()
+                raise Exception(
+                    f"The SMT solver terminated unexpectedly: {''.join(output)}"
+                )
+            output.append(line)
+        return "".join(output)
+
+    def run(self, query: str) -> str:
+        """
+        Run an SMT-LIB query, and return the solver output. An exception is
+        raised if the solver reports an error.
+        """
+        output = self._send(f"{query}\n(reset)")
+        if "(error" in output:
+            raise Exception(output)
+        return output
+
+    def close(self) -> None:
+        """Terminate the solver process."""
+        if self._process is not None:
+            self._process.kill()
+            self._process.wait()
+            self._process = None
+
+
+_services: dict[int, SMTSolverService] = {}
+
+
+def run_smtlib_query(query: str) -> str:
+    """
+    Run an SMT-LIB query on a `z3` process owned by the current process, and
+    return the solver output.
+    """
+    pid = os.getpid()
+    if pid not in _services:
+        _services.clear()
+        _services[pid] = SMTSolverService()
+    return _services[pid].run(query)
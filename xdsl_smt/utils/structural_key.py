@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+from typing import Hashable
+
+from xdsl.dialects.func import FuncOp
+from xdsl.ir import SSAValue
+
+
+def structural_key(func: FuncOp) -> Hashable:
+    """
+    Get a key identifying a function up to the names of its values, such that
+    structurally equivalent functions have the same key.
+    """
+    values: dict[SSAValue, int] = {arg: i for i, arg in enumerate(func.args)}
+    key: list[Hashable] = [func.function_type]
+    for op in func.body.walk():
+        key.append(
+            (
+                op.name,
+                tuple(values[operand] for operand in op.operands),
+                tuple(op.result_types),
+                tuple(sorted(op.properties.items())),
+                tuple(sorted(op.attributes.items())),
+            )
+        )
+        for result in op.results:
+            values[result] = len(values)
+        for region in op.regions:
+            for block in region.blocks:
+                for arg in block.args:
+                    values[arg] = len(values)
+    return tuple(key)